@@ -0,0 +1,197 @@
+"""
+Adaptive Concurrency Limiter
+AIMD (additive increase, multiplicative decrease) limiter for calls to
+upstream services. The limit grows by roughly one slot per window of
+successful calls while latency stays near its baseline, and shrinks when
+latency rises or the upstream answers with 429/5xx. Calls of different
+sizes (e.g. a 500-token discovery call and an 8000-token validation call)
+are tracked against separate baselines so a shift in the call mix is not
+mistaken for congestion.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from scheduler import FairTagger, current_priority
+
+logger = logging.getLogger(__name__)
+
+# Limits for the LlamaParse and OpenAI call sites
+ADAPTIVE_PARSE_INITIAL = int(os.getenv("ADAPTIVE_PARSE_INITIAL", "4"))
+ADAPTIVE_PARSE_MAX = int(os.getenv("ADAPTIVE_PARSE_MAX", "16"))
+ADAPTIVE_LLM_INITIAL = int(os.getenv("ADAPTIVE_LLM_INITIAL", "4"))
+ADAPTIVE_LLM_MAX = int(os.getenv("ADAPTIVE_LLM_MAX", "32"))
+ADAPTIVE_MIN = int(os.getenv("ADAPTIVE_MIN", "1"))
+
+# Back off when recent latency exceeds the baseline by this factor
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", "2.0"))
+# Multiplicative decrease on 429/5xx responses and on rising latency
+ADAPTIVE_BACKOFF = float(os.getenv("ADAPTIVE_BACKOFF", "0.5"))
+ADAPTIVE_LATENCY_BACKOFF = float(os.getenv("ADAPTIVE_LATENCY_BACKOFF", "0.9"))
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """True for rate limiting, upstream 5xx and timeouts"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or 500 <= status < 600
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in type(error).__name__
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for one upstream that adapts to its latency and error rate"""
+
+    def __init__(self, name: str, initial: int, max_limit: int, min_limit: int = ADAPTIVE_MIN,
+                 latency_tolerance: float = ADAPTIVE_LATENCY_TOLERANCE,
+                 backoff: float = ADAPTIVE_BACKOFF,
+                 latency_backoff: float = ADAPTIVE_LATENCY_BACKOFF):
+        """Start at initial concurrency and stay within [min_limit, max_limit]"""
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.latency_backoff = latency_backoff
+        self._limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        # Waiters are woken in weighted-fair order of their priority class
+        self._waiters: List[Tuple[Tuple[float, int], asyncio.Future]] = []
+        self._tagger = FairTagger()
+
+        # Long-running latency baseline and a fast-moving recent average per call class
+        self._baseline: Dict[str, float] = {}
+        self._recent: Dict[str, float] = {}
+        # Only calls started after the last decrease may trigger another one
+        self._last_decrease = 0.0
+
+        self.successes = 0
+        self.overloads = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        """Current number of calls allowed in flight"""
+        return int(self._limit)
+
+    async def acquire(self):
+        """Wait for a free slot; waiters of the current priority class are served fairly"""
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            return
+
+        tag = self._tagger.tag(current_priority.get())
+        while self._in_flight >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (tag, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass a wake-up we can no longer use on to the next waiter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()
+                else:
+                    self._waiters = [entry for entry in self._waiters if entry[1] is not waiter]
+                    heapq.heapify(self._waiters)
+                raise
+        self._tagger.served(tag)
+        self._in_flight += 1
+
+    def release(self):
+        """Free a slot and wake as many waiters as the limit now allows"""
+        self._in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        """Wake the best-placed waiters for every free slot"""
+        free = self.limit - self._in_flight
+        while free > 0 and self._waiters:
+            _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    @asynccontextmanager
+    async def slot(self, call_class: str = "default") -> AsyncIterator[None]:
+        """Hold a slot for one upstream call and feed its outcome back into the limit
+
+        Latency is compared against the baseline of call_class only.
+        """
+        await self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_overload_error(e):
+                self._on_overload(started, e)
+            raise
+        else:
+            self._on_success(started, call_class, time.monotonic() - started)
+        finally:
+            self.release()
+
+    def _on_success(self, started: float, call_class: str, latency: float):
+        """Additive increase while latency holds, gentle decrease when it rises"""
+        self.successes += 1
+        baseline = self._baseline.get(call_class)
+        if baseline is None:
+            baseline = recent = latency
+        else:
+            baseline = 0.95 * baseline + 0.05 * latency
+            recent = 0.7 * self._recent[call_class] + 0.3 * latency
+        self._baseline[call_class] = baseline
+        self._recent[call_class] = recent
+
+        if recent > baseline * self.latency_tolerance:
+            self._decrease(started, self.latency_backoff,
+                           f"{call_class} latency {recent:.1f}s vs baseline {baseline:.1f}s")
+        else:
+            # Roughly +1 per limit's worth of completed calls
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._wake()
+
+    def _on_overload(self, started: float, error: BaseException):
+        """Multiplicative decrease on 429/5xx/timeouts"""
+        self.overloads += 1
+        self._decrease(started, self.backoff, f"{type(error).__name__}: {str(error)[:100]}")
+
+    def _decrease(self, started: float, factor: float, reason: str):
+        """Shrink the limit once per round of calls"""
+        if started < self._last_decrease:
+            return
+        previous = self.limit
+        self._limit = max(self.min_limit, self._limit * factor)
+        self._last_decrease = time.monotonic()
+        self.decreases += 1
+        logger.warning(f"{self.name} concurrency limit {previous} -> {self.limit} ({reason})")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current limit, load and latency estimates"""
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "latency_seconds": {name: round(value, 2) for name, value in self._recent.items()},
+            "baseline_seconds": {name: round(value, 2) for name, value in self._baseline.items()},
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "decreases": self.decreases
+        }
+
+
+# Shared limiters: one for LlamaParse, one for both gpt-4o calls (same OpenAI rate limit)
+parse_limiter = AdaptiveLimiter("parse", ADAPTIVE_PARSE_INITIAL, ADAPTIVE_PARSE_MAX)
+llm_limiter = AdaptiveLimiter("llm", ADAPTIVE_LLM_INITIAL, ADAPTIVE_LLM_MAX)
+
+
+def limiter_stats() -> Dict[str, Any]:
+    """Return stats for every shared limiter"""
+    return {limiter.name: limiter.stats() for limiter in (parse_limiter, llm_limiter)}
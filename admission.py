@@ -0,0 +1,117 @@
+"""
+Admission Control
+Rejects new uploads up front when the work already admitted cannot be
+finished within the latency SLO. Work is measured in estimated pages:
+uploads are estimated from their size, and the per-page service time is
+learned from the stage timings and page counts of finished documents.
+"""
+
+import os
+import math
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Backlog the service may hold: everything admitted must be finishable within this many seconds
+ADMISSION_SLO_SECONDS = float(os.getenv("ADMISSION_SLO_SECONDS", os.getenv("REQUEST_BUDGET_SECONDS", "600")))
+# Starting estimate of processing seconds per page, refined from finished documents
+ADMISSION_SECONDS_PER_PAGE = float(os.getenv("ADMISSION_SECONDS_PER_PAGE", "5"))
+# Rough PDF bytes per page, used to estimate page counts before parsing
+ADMISSION_BYTES_PER_PAGE = int(os.getenv("ADMISSION_BYTES_PER_PAGE", str(150 * 1024)))
+# Upper bound for the Retry-After header
+ADMISSION_MAX_RETRY_AFTER = int(os.getenv("ADMISSION_MAX_RETRY_AFTER", "300"))
+
+
+class OverloadedError(Exception):
+    """The backlog is too large to accept more work; retry after retry_after seconds"""
+
+    def __init__(self, retry_after: int, drain_seconds: float):
+        super().__init__(f"Service overloaded - backlog needs {drain_seconds:.0f}s, retry in {retry_after}s")
+        self.retry_after = retry_after
+        self.drain_seconds = drain_seconds
+
+
+@dataclass
+class AdmissionTicket:
+    """Admitted work for one document"""
+    pages: float
+    released: bool = False
+
+
+def estimate_pages(size_bytes: int) -> float:
+    """Estimate a PDF's page count from its size"""
+    return max(1.0, size_bytes / ADMISSION_BYTES_PER_PAGE)
+
+
+def count_markdown_pages(markdown: Optional[str]) -> Optional[int]:
+    """Count pages in parsed markdown using the parser's page markers"""
+    if not markdown:
+        return None
+    return markdown.count("START OF PAGE:") or None
+
+
+class AdmissionController:
+    """Tracks admitted work and decides whether new work fits in the SLO"""
+
+    def __init__(self, parallelism: Callable[[], int], slo_seconds: float = ADMISSION_SLO_SECONDS,
+                 seconds_per_page: float = ADMISSION_SECONDS_PER_PAGE):
+        """parallelism() returns how many documents are currently processed side by side"""
+        self.parallelism = parallelism
+        self.slo_seconds = slo_seconds
+        self.seconds_per_page = seconds_per_page
+        self.backlog_pages = 0.0
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def drain_seconds(self, extra_pages: float = 0.0) -> float:
+        """Estimated time to finish the admitted backlog plus extra_pages"""
+        return (self.backlog_pages + extra_pages) * self.seconds_per_page / max(1, self.parallelism())
+
+    def admit(self, page_estimates: List[float], force: bool = False) -> List[AdmissionTicket]:
+        """Admit a group of documents as a whole, or raise OverloadedError.
+
+        force admits regardless of load (for work that was accepted earlier, e.g. queued jobs).
+        """
+        extra_pages = sum(page_estimates)
+        drain = self.drain_seconds(extra_pages)
+        # An idle service always accepts, even a batch bigger than the SLO
+        if not force and self.in_flight and drain > self.slo_seconds:
+            self.rejected += 1
+            # Once this much of the backlog has drained, the new work fits in the SLO
+            retry_after = min(ADMISSION_MAX_RETRY_AFTER, max(1, math.ceil(drain - self.slo_seconds)))
+            logger.warning(f"Rejecting {len(page_estimates)} documents (~{extra_pages:.0f} pages): backlog needs {drain:.0f}s > SLO {self.slo_seconds:.0f}s")
+            raise OverloadedError(retry_after, drain)
+
+        self.backlog_pages += extra_pages
+        self.in_flight += len(page_estimates)
+        self.admitted += len(page_estimates)
+        return [AdmissionTicket(pages) for pages in page_estimates]
+
+    def release(self, ticket: AdmissionTicket, page_count: Optional[int] = None,
+                stage_timings: Optional[Dict[str, float]] = None):
+        """Remove finished work from the backlog and learn the per-page service time; releasing twice is a no-op"""
+        if ticket.released:
+            return
+        ticket.released = True
+        self.backlog_pages = max(0.0, self.backlog_pages - ticket.pages)
+        self.in_flight = max(0, self.in_flight - 1)
+
+        service_seconds = sum((stage_timings or {}).values())
+        if page_count and service_seconds > 0:
+            self.seconds_per_page = 0.9 * self.seconds_per_page + 0.1 * (service_seconds / page_count)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return backlog, estimates and admission counters"""
+        return {
+            "in_flight": self.in_flight,
+            "backlog_pages": round(self.backlog_pages, 1),
+            "seconds_per_page": round(self.seconds_per_page, 2),
+            "parallelism": self.parallelism(),
+            "estimated_drain_seconds": round(self.drain_seconds(), 1),
+            "slo_seconds": self.slo_seconds,
+            "admitted": self.admitted,
+            "rejected": self.rejected
+        }
@@ -1,12 +1,20 @@
 import json
 import os
+import asyncio
 from datetime import datetime
 from pathlib import Path
+
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+
 from html_generator import HTMLTraceabilityGenerator
 from summary import main as run_summary
-from dataclasses import asdict
 from certificate_extractor import CertificateExtractor
 from traceability_source_validator import TraceabilitySourceValidator
+from pipeline import DocumentPipeline, DocumentContext
+from scheduler import BACKGROUND
 
 class BatchHTMLGenerator:
     """Generate HTML reports for multiple aviation traceability documents"""
@@ -18,48 +26,44 @@ class BatchHTMLGenerator:
     
     def process_document(self, file_path):
         """Process a single document and return summary data"""
-        try:
-            with open(file_path, "r", encoding='utf-8') as file:
-                document_content = file.read()
-            
-            # Extract certificates
-            results = self.extractor.extract_certificates_from_text(document_content, os.path.basename(file_path))
-            
-            if not results:
+        return asyncio.run(self._process_documents([file_path]))[0]
+    
+    async def _process_documents(self, file_paths, reports_dir=None):
+        """Run markdown documents through the extract → validate → render stages concurrently"""
+        pipeline = DocumentPipeline(self.extractor, self.validator, self.html_generator)
+        
+        async def run_one(file_path):
+            filename = os.path.basename(file_path)
+            try:
+                with open(file_path, "r", encoding='utf-8') as file:
+                    document_content = file.read()
+                
+                report_path = None
+                if reports_dir:
+                    report_path = os.path.join(reports_dir, filename.replace('.md', '.html'))
+                
+                # Markdown is supplied, so the parse stage is skipped
+                ctx = await pipeline.process(DocumentContext(
+                    document_id=filename,
+                    filename=filename,
+                    priority=BACKGROUND,
+                    markdown=document_content,
+                    report_path=report_path
+                ))
+                if ctx.error:
+                    raise ctx.error
+                
+                return ctx.summary_data
+                
+            except Exception as e:
+                print(f"❌ Error processing {file_path}: {str(e)}")
                 return None
-            
-            # Find certificate for SKYLINK
-            cert_info = None
-            for result in results:
-                if result.buyer_name and "skylink" in result.buyer_name.lower():
-                    cert_info = result
-                    break
-            
-            if not cert_info:
-                cert_info = results[0]  # Fallback to first certificate
-            
-            # Validate traceability
-            results_dict = [asdict(cert) for cert in results]
-            traceability_source = self.validator.validate_source_traceability(results_dict, os.path.basename(file_path))
-            
-            # Create summary data
-            summary_data = {
-                "cert_type": cert_info.certificate_type,
-                "part_number": cert_info.part_number,
-                "serial_number": cert_info.serial_number,
-                "description": cert_info.description,
-                "condition_code": cert_info.condition_code,
-                "quantity": cert_info.quantity,
-                "traceability_type": traceability_source.final_source.source_type,
-                "traceability_name": traceability_source.final_source.source_name,
-                "document_name": os.path.basename(file_path)
-            }
-            
-            return summary_data
-            
-        except Exception as e:
-            print(f"❌ Error processing {file_path}: {str(e)}")
-            return None
+        
+        try:
+            return await asyncio.gather(*[run_one(file_path) for file_path in file_paths])
+        finally:
+            await pipeline.stop()
+            pipeline.stage_executor.shutdown()
     
     def generate_dashboard_html(self, documents_data):
         """Generate a dashboard HTML showing multiple documents"""
@@ -384,27 +388,20 @@ class BatchHTMLGenerator:
         os.makedirs(output_dir, exist_ok=True)
         os.makedirs(f"{output_dir}/individual_reports", exist_ok=True)
         
-        documents_data = []
+        # Process all markdown files concurrently through the staged pipeline
+        filenames = sorted(f for f in os.listdir(markdowns_dir) if f.endswith('.md'))
+        print(f"🔄 Processing {len(filenames)} documents...")
         
-        # Process each markdown file
-        for filename in os.listdir(markdowns_dir):
-            if filename.endswith('.md'):
-                file_path = os.path.join(markdowns_dir, filename)
-                print(f"🔄 Processing {filename}...")
-                
-                summary_data = self.process_document(file_path)
-                if summary_data:
-                    documents_data.append(summary_data)
-                    
-                    # Generate individual HTML report
-                    html_content = self.html_generator.generate_html(summary_data, filename)
-                    html_filename = filename.replace('.md', '.html')
-                    html_path = os.path.join(f"{output_dir}/individual_reports", html_filename)
-                    
-                    with open(html_path, 'w', encoding='utf-8') as f:
-                        f.write(html_content)
-                    
-                    print(f"✅ Generated {html_filename}")
+        results = asyncio.run(self._process_documents(
+            [os.path.join(markdowns_dir, filename) for filename in filenames],
+            reports_dir=f"{output_dir}/individual_reports"
+        ))
+        
+        documents_data = []
+        for filename, summary_data in zip(filenames, results):
+            if summary_data:
+                documents_data.append(summary_data)
+                print(f"✅ Generated {filename.replace('.md', '.html')}")
         
         # Generate dashboard
         if documents_data:
@@ -422,5 +419,7 @@ class BatchHTMLGenerator:
         return documents_data
 
 if __name__ == "__main__":
+    import logging
+    logging.basicConfig(level=logging.INFO)
     generator = BatchHTMLGenerator()
     generator.process_all_documents() 
\ No newline at end of file
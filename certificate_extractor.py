@@ -1,20 +1,60 @@
 import os
 import json
-from typing import Dict, List, Optional, Any
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Any
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from openai import OpenAI
 import logging
 from datetime import datetime
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv(".env")
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+
+from llm_client import get_openai_client, get_async_openai_client, create_chat_completion, acreate_chat_completion, astream_chat_completion
+from llm_cache import get_llm_cache
+from page_filter import select_relevant_pages, buyer_pages
+from json_stream import IncrementalJSONArrayParser
+from layout_templates import LAYOUT_TEMPLATES_ENABLED, get_template_store
+from chunked_extraction import (
+    EXTRACTION_CHUNK_THRESHOLD_TOKENS, EXTRACTION_CHUNK_THREADS, chunked_extraction_stats,
+    can_chunk, estimate_text_tokens, group_pages, merge_certificates, page_range, same_certificate, should_chunk, split_package
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Prompt fragments shared by the whole-package and chunked extraction prompts
+OFFICIAL_CERTIFICATE_TYPES = """        *   `"Part or Material Certification Form (ATA Specification 106)"`
+        *   `"FAA Form 8130-3 (Authorized Release Certificate)"`
+        *   `"Certificate of Conformance/Conformity"`
+        *   `"Material Certification"`
+        *   `"OEM Manufacturer Certification"`
+        *   `"European Certificate of Conformity (EN10204)"`"""
+
+EXTRACTION_FIELDS = """**Extraction Fields**:
+    *   For the official certificates you extract, populate all fields precisely.
+    *   `traceability_source`: Look for explicit origin statements, PO numbers, or prior air carriers. If none is explicitly mentioned, set this to `null`."""
+
+CERTIFICATE_JSON_FORMAT = """RETURN RESULTS AS A JSON ARRAY:
+[
+  {
+    "certificate_type": "...",
+    "part_number": "...",
+    "serial_number": "...",
+    "description": "...",
+    "condition_code": "...",
+    "quantity": "...",
+    "manufacturer": "...",
+    "seller_name": "...",
+    "buyer_name": "...",
+    "certification_date": "...",
+    "authorized_signature": "...",
+    "traceability_source": "..."
+  }
+]"""
+
 @dataclass
 class CertificateInfo:
     """Data class for certificate information"""
@@ -44,13 +84,16 @@ class CertificateInfo:
 class CertificateExtractor:
     """Main class for extracting certificate information from aviation documents"""
     
+    # Bump the version whenever the prompt or response handling changes to invalidate cached responses
+    PROMPT_TEMPLATE = "certificate_extraction"
+    PROMPT_TEMPLATE_VERSION = "1"
+    CHUNK_PROMPT_TEMPLATE = "certificate_extraction_chunk"
+    DISCOVERY_PROMPT_TEMPLATE = "buyer_part_number_discovery"
+    
     def __init__(self, api_key: str = ""):
         """Initialize the extractor with OpenAI API key"""
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-        else:
-            # Try to get from environment
-            self.client = OpenAI()
+        # Shared clients are looked up on first use - an empty key falls back to the environment
+        self.api_key = api_key
         
         # Define certificate types based on our analysis
         self.certificate_types = {
@@ -67,6 +110,16 @@ class CertificateExtractor:
             "EUROPEAN_COC": "European Certificate of Conformity (EN10204)"
         }
     
+    @property
+    def client(self):
+        """Shared synchronous OpenAI client"""
+        return get_openai_client(self.api_key)
+    
+    @property
+    def async_client(self):
+        """Shared asynchronous OpenAI client"""
+        return get_async_openai_client(self.api_key)
+    
     def create_extraction_prompt(self, document_content: str) -> str:
         """Create a detailed prompt for certificate extraction with high accuracy"""
         
@@ -88,112 +141,403 @@ CRITICAL EXTRACTION PROCESS & RULES:
     *   Now, review the **entire document text again** from top to bottom.
     *   You MUST extract every document that is an **Official Certificate** AND is associated with one of the primary `part_number`(s) you identified in Step 1.
     *   A document is an "Official Certificate" if it is one of the following types. Use these exact names for `certificate_type`:
-        *   `"Part or Material Certification Form (ATA Specification 106)"`
-        *   `"FAA Form 8130-3 (Authorized Release Certificate)"`
-        *   `"Certificate of Conformance/Conformity"`
-        *   `"Material Certification"`
-        *   `"OEM Manufacturer Certification"`
-        *   `"European Certificate of Conformity (EN10204)"`
+{OFFICIAL_CERTIFICATE_TYPES}
     *   **CRITICAL RULE**: Any document that is NOT on this list (e.g., a "Packing Slip", "Work Order") MUST be ignored and NOT included in the output, even if it was used to find the part numbers.
 
-3.  **Extraction Fields**:
-    *   For the official certificates you extract, populate all fields precisely.
-    *   `traceability_source`: Look for explicit origin statements, PO numbers, or prior air carriers. If none is explicitly mentioned, set this to `null`.
+3.  {EXTRACTION_FIELDS}
 
 4.  **Output Format**:
     *   Return a single JSON array containing ONLY the official certificate objects for the parts sold to Skylink.
 
-RETURN RESULTS AS A JSON ARRAY:
-[
-  {{
-    "certificate_type": "...",
-    "part_number": "...",
-    "serial_number": "...",
-    "description": "...",
-    "condition_code": "...",
-    "quantity": "...",
-    "manufacturer": "...",
-    "seller_name": "...",
-    "buyer_name": "...",
-    "certification_date": "...",
-    "authorized_signature": "...",
-    "traceability_source": "..."
-  }}
-]
+{CERTIFICATE_JSON_FORMAT}
+
+CRITICAL: Your entire output must be ONLY the JSON array. Do not include any document that isn't a formal certificate from the approved list.
+"""
+        return prompt
+
+    def create_chunk_extraction_prompt(self, document_content: str, part_numbers: List[str], pages: str, total_pages: int) -> str:
+        """Create the extraction prompt for one page group of a chunked package"""
+        
+        if part_numbers:
+            primary = f"""The buyer's invoice/packing slip elsewhere in the package lists these primary part numbers purchased by SKYLINK:
+{", ".join(part_numbers)}"""
+        else:
+            primary = """The buyer's paperwork could not be located in advance. Use the invoice or packing slip on these pages where the BUYER is "SKYLINK" to identify the primary part numbers, and return [] if these pages do not show them."""
+        
+        prompt = f"""
+You are an expert aviation document auditor. The text below is pages {pages} of a {total_pages}-page package of traceability documents. Extract ONLY the official certificates on these pages for the part(s) sold to "SKYLINK".
+
+{primary}
+
+DOCUMENT PAGES:
+---
+{document_content}
+---
+
+CRITICAL EXTRACTION RULES:
+
+1.  **Extract All Matching Official Certificates**:
+    *   You MUST extract every document on these pages that is an **Official Certificate** AND is associated with one of the primary part numbers.
+    *   A document is an "Official Certificate" if it is one of the following types. Use these exact names for `certificate_type`:
+{OFFICIAL_CERTIFICATE_TYPES}
+    *   **CRITICAL RULE**: Any document that is NOT on this list (e.g., a "Packing Slip", "Work Order") MUST be ignored and NOT included in the output.
+    *   A certificate that starts or ends at the edge of these pages must still be extracted with the fields that are visible.
+
+2.  {EXTRACTION_FIELDS}
+
+3.  **Output Format**:
+    *   Return a single JSON array containing ONLY the official certificate objects for the parts sold to Skylink. If these pages contain none, return [].
+
+{CERTIFICATE_JSON_FORMAT}
 
 CRITICAL: Your entire output must be ONLY the JSON array. Do not include any document that isn't a formal certificate from the approved list.
 """
         return prompt
 
+    def create_discovery_prompt(self, document_content: str) -> str:
+        """Create the prompt that lists the part numbers sold to Skylink"""
+        
+        return f"""
+You are an expert aviation document auditor. The pages below come from a package of traceability documents.
+
+DOCUMENT PAGES:
+---
+{document_content}
+---
+
+Find the invoice, purchase order or packing slip where the **BUYER is "SKYLINK", "SKYLINK INC", or "SKYLINK, INC."** and list the primary part numbers Skylink is purchasing, exactly as printed.
+
+CRITICAL: Your entire output must be ONLY a JSON array of part number strings, e.g. ["2606672-4"]. Return [] if there is no such document.
+"""
+
+    def _build_request(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Build chat completion arguments around a prompt"""
+        return {
+            "model": "gpt-4o",  # Use GPT-4 for better accuracy
+            "messages": [
+                {"role": "system", "content": "You are an expert aviation document analyzer specializing in precise certificate extraction. Your accuracy is critical for aviation safety. Always return valid JSON with exact information from the documents."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.0,  # Zero temperature for maximum consistency
+            "max_tokens": max_tokens
+        }
+
+    def _build_extraction_request(self, document_content: str) -> Dict[str, Any]:
+        """Build the chat completion arguments for certificate extraction"""
+        # Increased for complex documents
+        return self._build_request(self.create_extraction_prompt(document_content), 6000)
+
+    def _build_chunk_request(self, group: List[tuple], part_numbers: List[str], total_pages: int) -> Dict[str, Any]:
+        """Build the chat completion arguments for one page group"""
+        prompt = self.create_chunk_extraction_prompt("".join(block for _, block in group), part_numbers, page_range(group), total_pages)
+        return self._build_request(prompt, 6000)
+
+    def _build_discovery_request(self, pages: List[tuple]) -> Optional[Dict[str, Any]]:
+        """Build the discovery request from the pages naming the buyer; None when no page does"""
+        selected, tokens = [], 0
+        for _, block in buyer_pages(pages):
+            tokens += estimate_text_tokens(block)
+            if selected and tokens > EXTRACTION_CHUNK_THRESHOLD_TOKENS:
+                break
+            selected.append(block)
+        if not selected:
+            return None
+        return self._build_request(self.create_discovery_prompt("".join(selected)), 500)
+
+    def _response_text(self, response, document_name: str) -> Optional[str]:
+        """Content of a completion, or None when it was cut off at max_tokens"""
+        choice = response.choices[0]
+        if getattr(choice, "finish_reason", None) == "length":
+            logger.warning(f"Response for {document_name} hit max_tokens and was truncated")
+            return None
+        return choice.message.content
+
+    def _decode_json_array(self, result_text: str, document_name: str) -> Optional[List[Any]]:
+        """Decode the JSON array in a model response; None when it is not valid JSON"""
+        
+        # Clean the response to extract JSON
+        if "```json" in result_text:
+            result_text = result_text.split("```json")[1].split("```")[0]
+        elif "```" in result_text:
+            result_text = result_text.split("```")[1].split("```")[0]
+        
+        # Remove any leading/trailing whitespace
+        result_text = result_text.strip()
+        
+        try:
+            data = json.loads(result_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error for {document_name}: {str(e)}")
+            logger.error(f"Raw response: {result_text[:500]}...")
+            return None
+        if not isinstance(data, list):
+            logger.error(f"Expected a JSON array for {document_name}, got {type(data).__name__}")
+            return None
+        return data
+
+    def _to_certificates(self, certificates_data: List[Any], document_name: str) -> List[CertificateInfo]:
+        """Validate decoded certificate objects and convert them to CertificateInfo"""
+        certificates = []
+        for i, cert_data in enumerate(certificates_data):
+            try:
+                # Validate part number format (basic check)
+                part_number = cert_data.get('part_number')
+                if part_number and not self._validate_part_number(part_number):
+                    logger.warning(f"Suspicious part number format in {document_name}: {part_number}")
+                
+                # Validate certificate type
+                cert_type = cert_data.get('certificate_type')
+                if cert_type and not self._validate_certificate_type(cert_type):
+                    logger.warning(f"Unknown certificate type in {document_name}: {cert_type}")
+                
+                cert_info = CertificateInfo(**cert_data)
+                certificates.append(cert_info)
+                
+            except Exception as e:
+                logger.error(f"Error creating certificate {i+1} from {document_name}: {str(e)}")
+                logger.error(f"Certificate data: {cert_data}")
+                continue
+        return certificates
+
+    def _log_extracted(self, certificates: List[CertificateInfo], document_name: str):
+        """Log the extraction outcome for a document"""
+        logger.info(f"Extracted {len(certificates)} certificates from {document_name}")
+        
+        # Additional validation
+        if len(certificates) == 0:
+            logger.warning(f"No certificates extracted from {document_name} - may need manual review")
+
+    def _parse_extraction_response(self, result_text: Optional[str], document_name: str) -> Optional[List[CertificateInfo]]:
+        """Convert the raw model response into validated CertificateInfo objects; None when it is truncated or not valid JSON"""
+        certificates_data = None if result_text is None else self._decode_json_array(result_text, document_name)
+        if certificates_data is None:
+            return None
+        certificates = self._to_certificates(certificates_data, document_name)
+        self._log_extracted(certificates, document_name)
+        return certificates
+
     def extract_certificates_from_text(self, document_content: str, document_name: str = "Unknown") -> List[CertificateInfo]:
         """Extract certificates from document text using OpenAI with enhanced accuracy"""
         
         try:
-            prompt = self.create_extraction_prompt(document_content)
+            pages = split_package(document_content)
+            if should_chunk(document_content, pages):
+                logger.info(f"{document_name}: ~{estimate_text_tokens(document_content)} prompt tokens over {len(pages)} pages, extracting in chunks")
+                return self._extract_chunked(pages, document_name, truncated=False)
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o",  # Use GPT-4 for better accuracy
-                messages=[
-                    {"role": "system", "content": "You are an expert aviation document analyzer specializing in precise certificate extraction. Your accuracy is critical for aviation safety. Always return valid JSON with exact information from the documents."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,  # Zero temperature for maximum consistency
-                max_tokens=6000   # Increased for complex documents
-            )
-            
-            # Parse the JSON response
-            result_text = response.choices[0].message.content
+            request = self._build_extraction_request(document_content)
+            llm_cache = get_llm_cache()
             
-            # Clean the response to extract JSON
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0]
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0]
+            cached_text = llm_cache.get(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION)
+            if cached_text is not None:
+                logger.info(f"Using cached extraction response for {document_name}")
+                return self._parse_extraction_response(cached_text, document_name) or []
             
-            # Remove any leading/trailing whitespace
-            result_text = result_text.strip()
+            response = create_chat_completion(self.client, request)
+            result_text = self._response_text(response, document_name)
             
-            try:
-                certificates_data = json.loads(result_text)
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error for {document_name}: {str(e)}")
-                logger.error(f"Raw response: {result_text[:500]}...")
-                return []
-            
-            # Validate and convert to CertificateInfo objects
-            certificates = []
-            for i, cert_data in enumerate(certificates_data):
-                try:
-                    # Validate part number format (basic check)
-                    part_number = cert_data.get('part_number')
-                    if part_number and not self._validate_part_number(part_number):
-                        logger.warning(f"Suspicious part number format in {document_name}: {part_number}")
-                    
-                    # Validate certificate type
-                    cert_type = cert_data.get('certificate_type')
-                    if cert_type and not self._validate_certificate_type(cert_type):
-                        logger.warning(f"Unknown certificate type in {document_name}: {cert_type}")
-                    
-                    cert_info = CertificateInfo(**cert_data)
-                    certificates.append(cert_info)
-                    
-                except Exception as e:
-                    logger.error(f"Error creating certificate {i+1} from {document_name}: {str(e)}")
-                    logger.error(f"Certificate data: {cert_data}")
-                    continue
-            
-            logger.info(f"Extracted {len(certificates)} certificates from {document_name}")
-            
-            # Additional validation
-            if len(certificates) == 0:
-                logger.warning(f"No certificates extracted from {document_name} - may need manual review")
+            # Parse the JSON response
+            certificates = self._parse_extraction_response(result_text, document_name)
+            if certificates is None and can_chunk(pages):
+                logger.warning(f"Extraction response for {document_name} was incomplete, extracting in chunks")
+                return self._extract_chunked(pages, document_name, truncated=True)
             
-            return certificates
+            # Only cache responses that yielded certificates so failed extractions are retried
+            if certificates:
+                llm_cache.set(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION, result_text)
+            return certificates or []
             
         except Exception as e:
             logger.error(f"Error extracting certificates from {document_name}: {str(e)}")
             return []
 
+    async def aextract_certificates_from_text(self, document_content: str, document_name: str = "Unknown") -> List[CertificateInfo]:
+        """Async variant of extract_certificates_from_text using the shared AsyncOpenAI client"""
+        
+        try:
+            return [cert async for cert in self.astream_certificates_from_text(document_content, document_name)]
+        except Exception as e:
+            logger.error(f"Error extracting certificates from {document_name}: {str(e)}")
+            return []
+
+    async def astream_certificates_from_text(self, document_content: str, document_name: str = "Unknown") -> AsyncIterator[CertificateInfo]:
+        """Yield each certificate as soon as the streamed response completes it; raises on API errors"""
+        
+        pages = split_package(document_content)
+        if should_chunk(document_content, pages):
+            logger.info(f"{document_name}: ~{estimate_text_tokens(document_content)} prompt tokens over {len(pages)} pages, extracting in chunks")
+            for cert in await self._aextract_chunked(pages, document_name, truncated=False):
+                yield cert
+            return
+        
+        request = self._build_extraction_request(document_content)
+        llm_cache = get_llm_cache()
+        
+        cached_text = await llm_cache.aget(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION)
+        if cached_text is not None:
+            logger.info(f"Using cached extraction response for {document_name}")
+            for cert in self._parse_extraction_response(cached_text, document_name) or []:
+                yield cert
+            return
+        
+        # Parse the JSON array while it streams in
+        parser = IncrementalJSONArrayParser()
+        certificates = []
+        finish_reason = None
+        async for chunk in astream_chat_completion(self.async_client, request):
+            for choice in chunk.choices:
+                finish_reason = choice.finish_reason or finish_reason
+                for cert in self._to_certificates(parser.feed(choice.delta.content or ""), document_name):
+                    certificates.append(cert)
+                    yield cert
+        
+        if finish_reason == "length" or not parser.complete:
+            logger.warning(f"Extraction response for {document_name} was incomplete after {len(certificates)} certificates")
+            if can_chunk(pages):
+                # Certificates already yielded stay; only the ones the chunks add are new
+                for cert in await self._aextract_chunked(pages, document_name, truncated=True):
+                    if not any(same_certificate(cert, known) for known in certificates):
+                        yield cert
+            return
+        
+        self._log_extracted(certificates, document_name)
+        # Only cache responses that yielded certificates so failed extractions are retried
+        if certificates:
+            await llm_cache.aset(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION, parser.text)
+
+    def _complete_json(self, request: Dict[str, Any], template: str, document_name: str) -> Optional[List[Any]]:
+        """Cached completion decoded as a JSON array; None when truncated or invalid"""
+        llm_cache = get_llm_cache()
+        cached_text = llm_cache.get(request, template, self.PROMPT_TEMPLATE_VERSION)
+        if cached_text is not None:
+            return self._decode_json_array(cached_text, document_name)
+        
+        response = create_chat_completion(self.client, request)
+        result_text = self._response_text(response, document_name)
+        data = None if result_text is None else self._decode_json_array(result_text, document_name)
+        # A page group legitimately holding no certificates is a complete answer, so [] is cached too
+        if data is not None:
+            llm_cache.set(request, template, self.PROMPT_TEMPLATE_VERSION, result_text)
+        return data
+
+    async def _acomplete_json(self, request: Dict[str, Any], template: str, document_name: str) -> Optional[List[Any]]:
+        """Async variant of _complete_json"""
+        llm_cache = get_llm_cache()
+        cached_text = await llm_cache.aget(request, template, self.PROMPT_TEMPLATE_VERSION)
+        if cached_text is not None:
+            return self._decode_json_array(cached_text, document_name)
+        
+        response = await acreate_chat_completion(self.async_client, request)
+        result_text = self._response_text(response, document_name)
+        data = None if result_text is None else self._decode_json_array(result_text, document_name)
+        # A page group legitimately holding no certificates is a complete answer, so [] is cached too
+        if data is not None:
+            await llm_cache.aset(request, template, self.PROMPT_TEMPLATE_VERSION, result_text)
+        return data
+
+    def _discovered_part_numbers(self, data: Optional[List[Any]], document_name: str) -> List[str]:
+        """Clean the discovery answer into a list of part numbers"""
+        part_numbers = [str(item).strip() for item in data or [] if isinstance(item, (str, int)) and str(item).strip()]
+        logger.info(f"Discovery for {document_name}: {', '.join(part_numbers) or 'no buyer part numbers found'}")
+        return part_numbers
+
+    def _extract_chunked(self, pages: List[tuple], document_name: str, truncated: bool) -> List[CertificateInfo]:
+        """Map-reduce extraction: discover the buyer part numbers, extract page groups in parallel, merge"""
+        
+        # Step 1: Discovery pass over the pages that name the buyer
+        request = self._build_discovery_request(pages)
+        data = None if request is None else self._complete_json(request, self.DISCOVERY_PROMPT_TEMPLATE, document_name)
+        part_numbers = self._discovered_part_numbers(data, document_name)
+        
+        # Step 2: Extract every page group in parallel
+        groups = group_pages(pages)
+        chunked_extraction_stats.record_document(truncated, len(groups))
+        with ThreadPoolExecutor(max_workers=max(1, min(EXTRACTION_CHUNK_THREADS, len(groups))), thread_name_prefix="extract-chunk") as pool:
+            results = list(pool.map(lambda group: self._extract_group(group, part_numbers, len(pages), document_name), groups))
+        
+        # Step 3: Merge and deduplicate
+        certificates = merge_certificates(results)
+        self._log_extracted(certificates, f"{document_name} ({len(groups)} chunks)")
+        return certificates
+
+    async def _aextract_chunked(self, pages: List[tuple], document_name: str, truncated: bool) -> List[CertificateInfo]:
+        """Async variant of _extract_chunked; the groups share the adaptive LLM concurrency limit"""
+        
+        # Step 1: Discovery pass over the pages that name the buyer
+        request = self._build_discovery_request(pages)
+        data = None if request is None else await self._acomplete_json(request, self.DISCOVERY_PROMPT_TEMPLATE, document_name)
+        part_numbers = self._discovered_part_numbers(data, document_name)
+        
+        # Step 2: Extract every page group in parallel
+        groups = group_pages(pages)
+        chunked_extraction_stats.record_document(truncated, len(groups))
+        results = await asyncio.gather(*(self._aextract_group(group, part_numbers, len(pages), document_name) for group in groups))
+        
+        # Step 3: Merge and deduplicate
+        certificates = merge_certificates(results)
+        self._log_extracted(certificates, f"{document_name} ({len(groups)} chunks)")
+        return certificates
+
+    def _extract_group(self, group: List[tuple], part_numbers: List[str], total_pages: int, document_name: str) -> List[CertificateInfo]:
+        """Extract one page group, halving it until the answer fits in max_tokens"""
+        label = f"{document_name} pages {page_range(group)}"
+        data = self._complete_json(self._build_chunk_request(group, part_numbers, total_pages), self.CHUNK_PROMPT_TEMPLATE, label)
+        if data is not None:
+            return self._to_certificates(data, label)
+        if len(group) > 1:
+            chunked_extraction_stats.record_split()
+            half = len(group) // 2
+            return (self._extract_group(group[:half], part_numbers, total_pages, document_name)
+                    + self._extract_group(group[half:], part_numbers, total_pages, document_name))
+        chunked_extraction_stats.record_truncated_page()
+        logger.error(f"Extraction for {label} is incomplete even for a single page")
+        return []
+
+    async def _aextract_group(self, group: List[tuple], part_numbers: List[str], total_pages: int, document_name: str) -> List[CertificateInfo]:
+        """Async variant of _extract_group; both halves of a split group run in parallel"""
+        label = f"{document_name} pages {page_range(group)}"
+        data = await self._acomplete_json(self._build_chunk_request(group, part_numbers, total_pages), self.CHUNK_PROMPT_TEMPLATE, label)
+        if data is not None:
+            return self._to_certificates(data, label)
+        if len(group) > 1:
+            chunked_extraction_stats.record_split()
+            half = len(group) // 2
+            first, second = await asyncio.gather(
+                self._aextract_group(group[:half], part_numbers, total_pages, document_name),
+                self._aextract_group(group[half:], part_numbers, total_pages, document_name)
+            )
+            return first + second
+        chunked_extraction_stats.record_truncated_page()
+        logger.error(f"Extraction for {label} is incomplete even for a single page")
+        return []
+
+    def extract_with_template(self, markdown: str, document_name: str = "Unknown") -> Optional[List[CertificateInfo]]:
+        """Read certificates with a learned vendor layout template; None when the LLM has to extract"""
+        if not LAYOUT_TEMPLATES_ENABLED:
+            return None
+        try:
+            certificates_data = get_template_store().match(markdown, document_name)
+        except Exception as e:
+            logger.warning(f"Layout template lookup failed for {document_name}: {str(e)}")
+            return None
+        if certificates_data is None:
+            return None
+        if not all(self._validate_part_number(cert["part_number"]) for cert in certificates_data):
+            logger.info(f"Layout template for {document_name} read an unusual part number, using the LLM")
+            return None
+        certificates = self._to_certificates(certificates_data, document_name)
+        self._log_extracted(certificates, document_name)
+        return certificates or None
+
+    def learn_layout(self, markdown: str, certificates: List[CertificateInfo], document_name: str = "Unknown"):
+        """Record where an LLM extraction found each field so the vendor's next documents can skip the LLM"""
+        if not LAYOUT_TEMPLATES_ENABLED or not certificates:
+            return
+        try:
+            get_template_store().learn(markdown, [asdict(cert) for cert in certificates], document_name)
+        except Exception as e:
+            logger.warning(f"Could not learn a layout template from {document_name}: {str(e)}")
+
     def _validate_part_number(self, part_number: str) -> bool:
         """Validate part number format"""
         if not part_number or part_number.lower() in ['null', 'none', '']:
@@ -249,7 +593,17 @@ CRITICAL: Your entire output must be ONLY the JSON array. Do not include any doc
                 content = file.read()
             
             document_name = Path(file_path).name
-            return self.extract_certificates_from_text(content, document_name)
+            # Recurring vendor layouts are read locally once their template is learned
+            certificates = self.extract_with_template(content, document_name)
+            if certificates:
+                return certificates
+            
+            # Same prompt prefilter as the server pipeline
+            selection = select_relevant_pages(content)
+            logger.info(f"{document_name}: {len(selection.pages_kept)}/{selection.pages_total} pages, ~{selection.tokens_saved} tokens saved")
+            certificates = self.extract_certificates_from_text(selection.text, document_name)
+            self.learn_layout(content, certificates, document_name)
+            return certificates
             
         except Exception as e:
             logger.error(f"Error processing file {file_path}: {str(e)}")
@@ -373,4 +727,5 @@ def main():
     # print(f"\nDetailed results saved to: certificate_extraction_results.json")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main() 
\ No newline at end of file
@@ -0,0 +1,192 @@
+"""
+Chunked Certificate Extraction
+Helpers for map-reduce extraction of document packages that are too large
+for one gpt-4o call, or whose single-call answer was cut off at max_tokens.
+The package is split into overlapping page groups that are extracted in
+parallel against the buyer part numbers found by a discovery pass, and the
+per-group certificates are merged and deduplicated here.
+"""
+
+import os
+import re
+import logging
+import threading
+from dataclasses import fields
+from typing import Any, Dict, List, Optional, Tuple
+
+from token_bucket import CHARS_PER_TOKEN
+from page_filter import split_pages
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CHUNKING_ENABLED = os.getenv("EXTRACTION_CHUNKING_ENABLED", "1") == "1"
+# Packages estimated above this many prompt tokens skip the single call and go straight to chunks
+EXTRACTION_CHUNK_THRESHOLD_TOKENS = int(os.getenv("EXTRACTION_CHUNK_THRESHOLD_TOKENS", "60000"))
+# Pages per group, and pages repeated at the start of the next group so a certificate split across a page break is seen whole
+EXTRACTION_CHUNK_PAGES = int(os.getenv("EXTRACTION_CHUNK_PAGES", "8"))
+EXTRACTION_CHUNK_OVERLAP_PAGES = int(os.getenv("EXTRACTION_CHUNK_OVERLAP_PAGES", "1"))
+# Threads extracting groups in parallel on the synchronous (CLI) path; the async path is bounded by llm_limiter
+EXTRACTION_CHUNK_THREADS = int(os.getenv("EXTRACTION_CHUNK_THREADS", "4"))
+
+# Values the model uses for "not on the document"
+_EMPTY_VALUES = {"", "NULL", "NONE", "NA", "N/A", "UNKNOWN"}
+
+# Fields that tell serial-less lots of the same part apart when both sightings give them
+LOT_FIELDS = ("certification_date", "quantity", "traceability_source")
+
+
+class ChunkedExtractionStats:
+    """Counts documents extracted in chunks and why"""
+
+    def __init__(self):
+        """Start all counters at zero"""
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.oversized = 0
+        self.truncated_fallbacks = 0
+        self.groups = 0
+        self.group_splits = 0
+        self.truncated_pages = 0
+        self.duplicates_merged = 0
+
+    def record_document(self, truncated: bool, groups: int):
+        """Count one chunked document"""
+        with self._lock:
+            self.documents += 1
+            if truncated:
+                self.truncated_fallbacks += 1
+            else:
+                self.oversized += 1
+            self.groups += groups
+
+    def record_split(self):
+        """Count a group that was truncated and split in half"""
+        with self._lock:
+            self.group_splits += 1
+
+    def record_truncated_page(self):
+        """Count a single page whose answer was still truncated"""
+        with self._lock:
+            self.truncated_pages += 1
+
+    def record_duplicates(self, count: int):
+        """Count certificates dropped as duplicates when merging"""
+        with self._lock:
+            self.duplicates_merged += count
+
+    def stats(self) -> Dict[str, Any]:
+        """Return chunking counters"""
+        with self._lock:
+            return {
+                "enabled": EXTRACTION_CHUNKING_ENABLED,
+                "threshold_tokens": EXTRACTION_CHUNK_THRESHOLD_TOKENS,
+                "pages_per_chunk": EXTRACTION_CHUNK_PAGES,
+                "documents": self.documents,
+                "oversized": self.oversized,
+                "truncated_fallbacks": self.truncated_fallbacks,
+                "groups": self.groups,
+                "group_splits": self.group_splits,
+                "truncated_pages": self.truncated_pages,
+                "duplicates_merged": self.duplicates_merged
+            }
+
+
+chunked_extraction_stats = ChunkedExtractionStats()
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Rough prompt size of a text"""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def split_package(markdown: str) -> List[tuple]:
+    """Page blocks of a package, with any text before the first page marker kept on the first page"""
+    pages = split_pages(markdown)
+    if pages:
+        prefix = markdown[:len(markdown) - sum(len(block) for _, block in pages)]
+        pages[0] = (pages[0][0], prefix + pages[0][1])
+    return pages
+
+
+def should_chunk(text: str, pages: List[tuple]) -> bool:
+    """True when a package is too large to extract in one call"""
+    return EXTRACTION_CHUNKING_ENABLED and len(pages) >= 2 and estimate_text_tokens(text) > EXTRACTION_CHUNK_THRESHOLD_TOKENS
+
+
+def can_chunk(pages: List[tuple]) -> bool:
+    """True when a truncated single-call answer can be retried in chunks"""
+    return EXTRACTION_CHUNKING_ENABLED and len(pages) >= 2
+
+
+def group_pages(pages: List[tuple], size: int = EXTRACTION_CHUNK_PAGES,
+                overlap: int = EXTRACTION_CHUNK_OVERLAP_PAGES) -> List[List[tuple]]:
+    """Split (page number, block) pairs into consecutive groups of size pages, each overlapping the previous one"""
+    size = max(1, size)
+    step = max(1, size - max(0, overlap))
+    groups = []
+    for start in range(0, len(pages), step):
+        groups.append(pages[start:start + size])
+        if start + size >= len(pages):
+            break
+    return groups
+
+
+def page_range(group: List[tuple]) -> str:
+    """Human-readable page span of a group, e.g. "9-16" """
+    first, last = group[0][0], group[-1][0]
+    return str(first) if first == last else f"{first}-{last}"
+
+
+def _normalize(value: Optional[str]) -> str:
+    """Upper-case alphanumerics only; empty for null-like values"""
+    text = re.sub(r"[^A-Z0-9]", "", str(value or "").upper())
+    return "" if str(value or "").strip().upper() in _EMPTY_VALUES else text
+
+
+def certificate_key(cert) -> Tuple[str, ...]:
+    """Identity of a certificate for deduplication across groups: type, part number, serial number and seller"""
+    return (
+        _normalize(cert.certificate_type),
+        _normalize(cert.part_number),
+        _normalize(cert.serial_number),
+        _normalize(cert.seller_name)
+    )
+
+
+def same_certificate(first, second) -> bool:
+    """True when two sightings with the same key are one certificate.
+
+    Without a serial number, sightings that both give a date, quantity or traceability source must agree
+    on it, so separate lots of a part stay apart while a partial sighting at an overlap page still merges.
+    """
+    if certificate_key(first) != certificate_key(second):
+        return False
+    if _normalize(first.serial_number):
+        return True
+    for name in LOT_FIELDS:
+        first_value, second_value = _normalize(getattr(first, name)), _normalize(getattr(second, name))
+        if first_value and second_value and first_value != second_value:
+            return False
+    return True
+
+
+def merge_certificates(group_results: List[List[Any]]) -> List[Any]:
+    """Concatenate per-group certificates in page order, merging duplicates field by field"""
+    merged: List[Any] = []
+    by_key: Dict[Tuple[str, ...], List[Any]] = {}
+    duplicates = 0
+    for certificates in group_results:
+        for cert in certificates:
+            candidates = by_key.setdefault(certificate_key(cert), [])
+            existing = next((candidate for candidate in candidates if same_certificate(candidate, cert)), None)
+            if existing is None:
+                candidates.append(cert)
+                merged.append(cert)
+                continue
+            # The same certificate seen in an overlapping page: fill fields the first sighting missed
+            duplicates += 1
+            for field in fields(existing):
+                if not _normalize(getattr(existing, field.name)) and _normalize(getattr(cert, field.name)):
+                    setattr(existing, field.name, getattr(cert, field.name))
+    chunked_extraction_stats.record_duplicates(duplicates)
+    return merged
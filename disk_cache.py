@@ -0,0 +1,209 @@
+"""
+Disk Cache
+Small SQLite-backed key/value cache with size-bounded LRU eviction,
+optional TTL expiry, tag-based invalidation and hit/miss counters.
+Async callers use aget/aset, which run the SQLite calls on a worker thread.
+SQLite keeps the cache safe to share between threads and worker
+processes on the same machine.
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Root directory for all on-disk caches
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
+
+class DiskCache:
+    """Persistent string cache with least-recently-used eviction by total size"""
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        """Open (or create) the cache database at path; entries expire after ttl_seconds if set"""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    tag TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_tag ON entries(tag)")
+
+            # Running entry count and size, kept exact for every process by triggers so writes never sum the table
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    entries INTEGER NOT NULL,
+                    size INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+                    UPDATE totals SET entries = entries + 1, size = size + NEW.size WHERE id = 0;
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+                    UPDATE totals SET size = size + NEW.size - OLD.size WHERE id = 0;
+                END
+                """
+            )
+            conn.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+                    UPDATE totals SET entries = entries - 1, size = size - OLD.size WHERE id = 0;
+                END
+                """
+            )
+            # Created after the triggers, so rows written in between are counted exactly once
+            conn.execute("INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM entries")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived transaction; SQLite handles cross-process locking"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """Return the cached value for key, or None on a miss
+
+        Speculative lookups pass count=False and report the outcome with count_lookup() once it is used.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.expirations += 1
+                row = None
+
+            if row is not None:
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        if count:
+            self.count_lookup(row is not None)
+        return row[0] if row is not None else None
+
+    async def aget(self, key: str, count: bool = True) -> Optional[str]:
+        """get() on a worker thread, so the event loop never waits for the database lock"""
+        return await asyncio.to_thread(self.get, key, count)
+
+    def count_lookup(self, hit: bool):
+        """Add one lookup to the hit/miss counters"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def set(self, key: str, value: str, tag: Optional[str] = None):
+        """Store value under key (optionally tagged for bulk invalidation) and evict if over the size limit"""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            logger.warning(f"Not caching entry of {size} bytes - larger than cache limit {self.max_bytes}")
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # An upsert (not INSERT OR REPLACE) so the update trigger keeps the running size exact
+            conn.execute(
+                """
+                INSERT INTO entries (key, value, size, created_at, last_access, tag) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, size = excluded.size,
+                    created_at = excluded.created_at, last_access = excluded.last_access, tag = excluded.tag
+                """,
+                (key, value, size, now, now, tag)
+            )
+            self._evict(conn)
+
+    async def aset(self, key: str, value: str, tag: Optional[str] = None):
+        """set() on a worker thread, so the event loop never waits for the database lock"""
+        await asyncio.to_thread(self.set, key, value, tag)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then least recently used ones while the running size is over max_bytes"""
+        if self.ttl_seconds:
+            self.expirations += conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+
+        total = conn.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+        while total > self.max_bytes:
+            # Oldest entries first, a batch at a time, so eviction never reads the whole table
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        """Remove a single entry, returning True if it existed"""
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM entries WHERE key = ?", (key,)).rowcount > 0
+
+    def delete_tag(self, tag: str) -> int:
+        """Remove every entry stored with tag, returning how many were deleted"""
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM entries WHERE tag = ?", (tag,)).rowcount
+
+    def clear(self) -> int:
+        """Remove every entry, returning how many were deleted"""
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM entries").rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current cache occupancy"""
+        with self._lock, self._connect() as conn:
+            entries, total = conn.execute("SELECT entries, size FROM totals WHERE id = 0").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "size_bytes": total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -1,27 +1,45 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import os
+import json
 import tempfile
 import shutil
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Callable
 import logging
-from dataclasses import asdict
 import asyncio
 
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+
 # Import our existing components
-from pdfparser import parse_document
+from pdfparser import get_parse_cache
 from certificate_extractor import CertificateExtractor
 from traceability_source_validator import TraceabilitySourceValidator
 from html_generator import HTMLTraceabilityGenerator
+from stage_executor import StageExecutor
+from llm_cache import get_llm_cache
+from jobs import JobStore, JobManager, JOBS_DIR, JOB_DRAIN_SECONDS
+from pipeline import DocumentPipeline, DocumentContext
+from adaptive_limiter import limiter_stats, parse_limiter, llm_limiter
+from admission import AdmissionController, AdmissionTicket, OverloadedError, estimate_pages, count_markdown_pages
+from token_bucket import openai_token_bucket
+from llm_retry import llm_retry_policy
+from page_filter import page_filter_stats
+from chunked_extraction import chunked_extraction_stats
+from traceability_rules import fast_path_stats
+from layout_templates import get_template_store
+from uploads import save_upload, new_memory_budget, upload_size
+from scheduler import INTERACTIVE, BATCH, BACKGROUND
+from warmup import warm_up
+from http_transport import transport_stats, close_http_transports
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -39,16 +57,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
+# Initialize components - importing this module does no I/O; clients, caches,
+# directories and the job database are created on first use or at startup
 extractor = CertificateExtractor()
 validator = TraceabilitySourceValidator()
 html_generator = HTMLTraceabilityGenerator()
 
+# Thread pool for the blocking parse/extract/validate/render stages
+stage_executor = StageExecutor()
+
+# Staged parse → extract → validate → render pipeline with per-stage worker limits
+document_pipeline = DocumentPipeline(extractor, validator, html_generator, stage_executor)
+
+# Rejects uploads the backlog cannot absorb within the SLO; each document makes
+# one parse call and two LLM calls, so the LLM limit counts for half
+admission = AdmissionController(lambda: min(parse_limiter.limit, max(1, llm_limiter.limit // 2)))
+
 # Configuration for directories
 TEMP_DIR = "temp_uploads"
 OUTPUT_DIR = "processed_reports"
 PUBLIC_DIR = "public"
 
+# How often long-running requests check whether the client is still connected
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "1.0"))
+
 def setup_directories():
     """Create and setup all required directories"""
     directories = [
@@ -68,9 +100,6 @@ def setup_directories():
         os.makedirs(directory, exist_ok=True)
         logger.info(f"Directory ensured: {directory}")
 
-# Setup directories on startup
-setup_directories()
-
 def check_public_files():
     """Check if public files exist and log status"""
     public_files = [
@@ -86,12 +115,17 @@ def check_public_files():
         status = "✅ Available" if os.path.exists(full_path) else "❌ Missing"
         logger.info(f"  {description}: {status}")
 
-# Check public files on startup
-check_public_files()
+@app.on_event("startup")
+async def prepare_runtime():
+    """Configure logging and create directories before the server takes traffic"""
+    logging.basicConfig(level=logging.INFO)
+    setup_directories()
+    check_public_files()
 
-# Mount static files for serving generated HTML reports and public assets
-app.mount("/reports", StaticFiles(directory=OUTPUT_DIR), name="reports")
-app.mount("/public", StaticFiles(directory=PUBLIC_DIR), name="public")
+# Mount static files for serving generated HTML reports and public assets;
+# the directories are created by the startup hook, not at import
+app.mount("/reports", StaticFiles(directory=OUTPUT_DIR, check_dir=False), name="reports")
+app.mount("/public", StaticFiles(directory=PUBLIC_DIR, check_dir=False), name="public")
 
 # Data models
 class ProcessingResult(BaseModel):
@@ -110,6 +144,15 @@ class ProcessingResult(BaseModel):
     html_report_url: Optional[str] = None
     processing_time: Optional[float] = None
     filename: Optional[str] = None
+    # Pipeline stages that ran out of their latency budget, and per-stage durations in seconds
+    timed_out_stages: List[str] = []
+    stage_timings: Dict[str, float] = {}
+    # Pages sent to the extraction prompt out of all parsed pages, and the estimated tokens saved
+    prompt_pages: Optional[int] = None
+    total_pages: Optional[int] = None
+    prompt_tokens_saved: Optional[int] = None
+    # Seconds into extraction when the first certificate was parsed from the streamed response
+    first_certificate_seconds: Optional[float] = None
 
 class BatchProcessingResult(BaseModel):
     success: bool
@@ -122,6 +165,77 @@ class BatchProcessingResult(BaseModel):
     total_processing_time: float
     dashboard_url: Optional[str] = None
 
+class JobFileStatus(BaseModel):
+    file_index: int
+    filename: str
+    status: str
+    result: Optional[ProcessingResult] = None
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    total_files: int
+    completed_files: int
+    successful_files: int
+    failed_files: int
+    files: List[JobFileStatus]
+    dashboard_url: Optional[str] = None
+
+class JobSubmission(BaseModel):
+    job_id: str
+    status: str
+    total_files: int
+    status_url: str
+
+def write_html_report(html_path: str, html_content: str):
+    """Write a generated HTML report to disk"""
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+async def process_job_file(path: str, filename: str) -> dict:
+    """Process one persisted job file and return its result as a dict"""
+    # Job files were accepted at submission, so they count towards the backlog but are never rejected
+    ticket = admission.admit([estimate_pages(os.path.getsize(path))], force=True)[0]
+    try:
+        # Keep the file if processing is interrupted so the job can resume; complete_job removes the job folder
+        result = await process_saved_pdf_async(path, filename, make_document_id(filename), datetime.now(),
+                                               remove_pdf=False, priority=BACKGROUND, admission_ticket=ticket)
+    finally:
+        admission.release(ticket)
+    return result.dict()
+
+async def complete_job(job_id: str, results: List[dict]) -> str:
+    """Write the dashboard for a finished job and return its URL"""
+    dashboard_html = generate_batch_dashboard(job_id, [ProcessingResult(**r) for r in results])
+    dashboard_filename = f"{job_id}_dashboard.html"
+    await stage_executor.run("render", write_html_report, os.path.join(OUTPUT_DIR, dashboard_filename), dashboard_html)
+    
+    # Drop the job folder with its uploaded PDFs
+    shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+    return f"/reports/{dashboard_filename}"
+
+# Persistent job queue for asynchronous batch processing
+job_manager = JobManager(
+    JobStore(os.path.join(JOBS_DIR, "jobs.sqlite3")),
+    process_job_file,
+    on_job_complete=complete_job
+)
+
+@app.on_event("startup")
+async def start_job_manager():
+    """Warm up clients, then start job workers and resume jobs left unfinished by a previous run"""
+    # The server only accepts connections once startup hooks have finished
+    await warm_up()
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_stage_executor():
+    """Drain job workers and release pipeline worker threads and pooled connections when the server stops"""
+    await job_manager.stop(drain_seconds=JOB_DRAIN_SECONDS)
+    await document_pipeline.stop()
+    stage_executor.shutdown(wait=False)
+    await close_http_transports()
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     """Root endpoint with upload form - now serves from public folder if available"""
@@ -139,126 +253,72 @@ async def root():
         404 Page not found.
     """
 
+def admit_uploads(files: List[UploadFile]) -> List[AdmissionTicket]:
+    """Admit a request's uploads as a whole or reject them with 503 and Retry-After"""
+    try:
+        return admission.admit([estimate_pages(upload_size(file)) for file in files])
+    except OverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def run_until_disconnected(request: Request, awaitable):
+    """Await work for a request, cancelling it if the client disconnects first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path} - cancelling in-flight work")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                # Nobody is listening any more; 499 is the conventional "client closed request" status
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
 @app.post("/process-pdf", response_model=ProcessingResult)
-async def process_pdf(files: List[UploadFile] = File(...)):
+async def process_pdf(request: Request, files: List[UploadFile] = File(...)):
     """Process uploaded PDF document(s) - if multiple files, processes first one only"""
     # Handle backward compatibility - if multiple files sent, process first one
     file = files[0] if isinstance(files, list) else files
-    start_time = datetime.now()
     
     # Validate file type
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
+    ticket = admit_uploads([file])[0]
+    try:
+        # Interactive uploads are scheduled ahead of queued batch work
+        return await run_until_disconnected(request, process_single_file_async(file, priority=INTERACTIVE, admission_ticket=ticket))
+    finally:
+        # Covers uploads that failed or were cancelled before reaching the pipeline
+        admission.release(ticket)
+
+def make_document_id(filename: str) -> str:
+    """Generate a unique document ID for an uploaded file"""
+    return f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{filename.replace('.pdf', '')}"
+
+async def process_single_file_async(file: UploadFile, memory_budget: Optional[asyncio.Semaphore] = None,
+                                    priority: str = BATCH,
+                                    admission_ticket: Optional[AdmissionTicket] = None) -> ProcessingResult:
+    """Process a single PDF file asynchronously; memory_budget is shared by all uploads of a batch"""
+    start_time = datetime.now()
+    
     # Generate unique document ID
-    document_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename.replace('.pdf', '')}"
+    document_id = make_document_id(file.filename)
     
     try:
         # Save uploaded file temporarily
         temp_file_path = os.path.join(TEMP_DIR, f"{document_id}.pdf")
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Processing PDF: {file.filename}")
-        
-        # Step 1: Parse PDF to markdown
-        logger.info("Step 1: Parsing PDF...")
-        markdown_content = parse_document(temp_file_path)
-        
-        if not markdown_content or not markdown_content.strip():
-            raise Exception("Failed to extract content from PDF")
         
-        # Step 2: Extract certificates from markdown
-        logger.info("Step 2: Extracting certificates...")
-        certificates = extractor.extract_certificates_from_text(markdown_content, file.filename)
-        # print(certificates)
-        if not certificates:
-            raise Exception("No certificates found in document")
-        
-        # Step 3: Find certificate for analysis (prefer SKYLINK, fallback to first)
-        target_cert = None
-        for cert in certificates:
-            if cert.buyer_name and "skylink" in cert.buyer_name.lower():
-                target_cert = cert
-                break
-        
-        # print("="*100)
-        # print(certificates)
-        # print("="*100)
-
-        logger.info(f"Target cert: {certificates}")
-
-        if not target_cert:
-            target_cert = certificates[0]
-        
-        # with open("results/target_cert.json", "w") as f:
-        #     import json
-        #     json.dump(target_cert, f, indent=4)
-
-        # Step 4: Validate traceability
-        logger.info("Step 3: Validating traceability...")
-        certificates_dict = [asdict(cert) for cert in certificates]
-        traceability_result = validator.validate_source_traceability(certificates_dict, file.filename)
-        
-        # Step 5: Generate HTML report
-        logger.info("Step 4: Generating HTML report...")
-        summary_data = {
-            "cert_type": target_cert.certificate_type,
-            "part_number": target_cert.part_number,
-            "serial_number": target_cert.serial_number,
-            "description": target_cert.description,
-            "condition_code": target_cert.condition_code,
-            "quantity": target_cert.quantity,
-            "traceability_type": traceability_result.final_source.source_type,
-            "traceability_name": traceability_result.final_source.source_name,
-            "validation_notes": traceability_result.validation_notes,
-            "document_name": file.filename
-        }
-        
-        html_content = html_generator.generate_html(summary_data, file.filename)
-        
-        # Save HTML report
-        html_filename = f"{document_id}_report.html"
-        html_path = os.path.join(OUTPUT_DIR, html_filename)
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        # Clean up temporary file
-        os.remove(temp_file_path)
-        
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Determine compliance status
-        is_compliant = traceability_result.final_source.source_type in ['OEM', '121', '129', '135', '145']
-        compliance_status = "✅ COMPLIANT" if is_compliant else "❌ NON-COMPLIANT"
-        
-        return ProcessingResult(
-            success=True,
-            message="Document processed successfully",
-            document_id=document_id,
-            cert_type=target_cert.certificate_type,
-            part_number=target_cert.part_number,
-            serial_number=target_cert.serial_number,
-            description=target_cert.description,
-            condition_code=target_cert.condition_code,
-            quantity=target_cert.quantity,
-            traceability_type=traceability_result.final_source.source_type,
-            traceability_name=traceability_result.final_source.source_name,
-            compliance_status=compliance_status,
-            html_report_url=f"/reports/{html_filename}",
-            processing_time=round(processing_time, 2),
-            filename=file.filename
-        )
+        # Stream to disk in chunks, hashing on the way so the parser never re-reads it
+        content_hash = await save_upload(file, temp_file_path, memory_budget)
         
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
-        
-        # Clean up temporary file if it exists
-        temp_file_path = os.path.join(TEMP_DIR, f"{document_id}.pdf")
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        
+        logger.error(f"Error saving upload {file.filename}: {str(e)}")
         return ProcessingResult(
             success=False,
             message=f"Processing failed: {str(e)}",
@@ -266,119 +326,98 @@ async def process_pdf(files: List[UploadFile] = File(...)):
             processing_time=round((datetime.now() - start_time).total_seconds(), 2),
             filename=file.filename
         )
+    
+    return await process_saved_pdf_async(temp_file_path, file.filename, document_id, start_time,
+                                         content_hash=content_hash, priority=priority,
+                                         admission_ticket=admission_ticket)
 
-async def process_single_file_async(file: UploadFile) -> ProcessingResult:
-    """Process a single PDF file asynchronously"""
-    start_time = datetime.now()
+async def process_saved_pdf_async(temp_file_path: str, filename: str, document_id: str, start_time: datetime,
+                                  on_stage: Optional[Callable[[str, float], None]] = None,
+                                  content_hash: Optional[str] = None,
+                                  remove_pdf: bool = True,
+                                  priority: str = BATCH,
+                                  admission_ticket: Optional[AdmissionTicket] = None,
+                                  on_certificate: Optional[Callable[[Dict[str, Any]], None]] = None) -> ProcessingResult:
+    """Run a PDF already saved to disk through the document pipeline.
     
-    # Generate unique document ID
-    document_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{file.filename.replace('.pdf', '')}"
+    on_stage(stage, seconds) is called as each stage finishes with that stage's duration.
+    content_hash is the SHA-256 of the file when already known from the upload.
+    With remove_pdf the pipeline deletes the file once it is no longer needed, including on cancellation.
+    priority is the scheduling class (interactive, batch or background) for the parse and LLM stages.
+    admission_ticket is released when the document finishes (or fails, or is cancelled).
+    on_certificate(event) is called with each certificate and its entity checks as soon as extraction yields it.
+    """
+    html_filename = f"{document_id}_report.html"
+    ctx = DocumentContext(
+        document_id=document_id,
+        filename=filename,
+        priority=priority,
+        pdf_path=temp_file_path,
+        remove_pdf=remove_pdf,
+        content_hash=content_hash,
+        report_path=os.path.join(OUTPUT_DIR, html_filename),
+        on_stage=on_stage,
+        on_certificate=on_certificate
+    )
     
+    logger.info(f"Processing PDF: {filename}")
     try:
-        # Save uploaded file temporarily
-        temp_file_path = os.path.join(TEMP_DIR, f"{document_id}.pdf")
-        
-        # Read file content
-        content = await file.read()
-        with open(temp_file_path, "wb") as buffer:
-            buffer.write(content)
-        
-        logger.info(f"Processing PDF: {file.filename}")
-        
-        # Step 1: Parse PDF to markdown
-        markdown_content = parse_document(temp_file_path)
-        
-        if not markdown_content or not markdown_content.strip():
-            raise Exception("Failed to extract content from PDF")
-        
-        # Step 2: Extract certificates from markdown
-        certificates = extractor.extract_certificates_from_text(markdown_content, file.filename)
-        
-        if not certificates:
-            raise Exception("No certificates found in document")
-        
-        # Step 3: Find certificate for analysis (prefer SKYLINK, fallback to first)
-        target_cert = None
-        for cert in certificates:
-            if cert.buyer_name and "skylink" in cert.buyer_name.lower():
-                target_cert = cert
-                break
-        
-        if not target_cert:
-            target_cert = certificates[0]
-        
-        # Step 4: Validate traceability
-        certificates_dict = [asdict(cert) for cert in certificates]
-        traceability_result = validator.validate_source_traceability(certificates_dict, file.filename)
-        
-        # Step 5: Generate HTML report
-        summary_data = {
-            "cert_type": target_cert.certificate_type,
-            "part_number": target_cert.part_number,
-            "serial_number": target_cert.serial_number,
-            "description": target_cert.description,
-            "condition_code": target_cert.condition_code,
-            "quantity": target_cert.quantity,
-            "traceability_type": traceability_result.final_source.source_type,
-            "traceability_name": traceability_result.final_source.source_name,
-            "validation_notes": traceability_result.validation_notes,
-            "document_name": file.filename
-        }
-        
-        html_content = html_generator.generate_html(summary_data, file.filename)
-        
-        # Save HTML report
-        html_filename = f"{document_id}_report.html"
-        html_path = os.path.join(OUTPUT_DIR, html_filename)
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        # Clean up temporary file
-        os.remove(temp_file_path)
-        
-        # Calculate processing time
-        processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Determine compliance status
-        is_compliant = traceability_result.final_source.source_type in ['OEM', '121', '129', '135', '145']
-        compliance_status = "✅ COMPLIANT" if is_compliant else "❌ NON-COMPLIANT"
-        
-        return ProcessingResult(
-            success=True,
-            message="Document processed successfully",
-            document_id=document_id,
-            cert_type=target_cert.certificate_type,
-            part_number=target_cert.part_number,
-            serial_number=target_cert.serial_number,
-            description=target_cert.description,
-            condition_code=target_cert.condition_code,
-            quantity=target_cert.quantity,
-            traceability_type=traceability_result.final_source.source_type,
-            traceability_name=traceability_result.final_source.source_name,
-            compliance_status=compliance_status,
-            html_report_url=f"/reports/{html_filename}",
-            processing_time=round(processing_time, 2),
-            filename=file.filename
-        )
-        
-    except Exception as e:
-        logger.error(f"Error processing PDF {file.filename}: {str(e)}")
-        
-        # Clean up temporary file if it exists
-        temp_file_path = os.path.join(TEMP_DIR, f"{document_id}.pdf")
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        
+        await document_pipeline.process(ctx)
+    finally:
+        if admission_ticket:
+            admission.release(admission_ticket, count_markdown_pages(ctx.markdown), ctx.stage_timings)
+    
+    # Calculate processing time
+    processing_time = round((datetime.now() - start_time).total_seconds(), 2)
+    
+    if ctx.error is not None:
+        logger.error(f"Error processing PDF {filename}: {str(ctx.error)}")
         return ProcessingResult(
             success=False,
-            message=f"Processing failed: {str(e)}",
+            message=f"Processing failed: {str(ctx.error)}",
             document_id=document_id,
-            processing_time=round((datetime.now() - start_time).total_seconds(), 2),
-            filename=file.filename
+            processing_time=processing_time,
+            filename=filename,
+            timed_out_stages=ctx.timed_out_stages,
+            stage_timings=ctx.stage_timings
         )
+    
+    # Determine compliance status
+    target_cert = ctx.target_cert
+    traceability_result = ctx.traceability
+    is_compliant = traceability_result.final_source.source_type in ['OEM', '121', '129', '135', '145']
+    compliance_status = "✅ COMPLIANT" if is_compliant else "❌ NON-COMPLIANT"
+    
+    message = "Document processed successfully"
+    if ctx.timed_out_stages:
+        message = f"Document processed with degraded results (timed out: {', '.join(ctx.timed_out_stages)})"
+    
+    return ProcessingResult(
+        success=True,
+        message=message,
+        document_id=document_id,
+        cert_type=target_cert.certificate_type,
+        part_number=target_cert.part_number,
+        serial_number=target_cert.serial_number,
+        description=target_cert.description,
+        condition_code=target_cert.condition_code,
+        quantity=target_cert.quantity,
+        traceability_type=traceability_result.final_source.source_type,
+        traceability_name=traceability_result.final_source.source_name,
+        compliance_status=compliance_status,
+        html_report_url=f"/reports/{html_filename}",
+        processing_time=processing_time,
+        filename=filename,
+        timed_out_stages=ctx.timed_out_stages,
+        stage_timings=ctx.stage_timings,
+        prompt_pages=len(ctx.page_selection.pages_kept) if ctx.page_selection else None,
+        total_pages=ctx.page_selection.pages_total if ctx.page_selection else None,
+        prompt_tokens_saved=ctx.page_selection.tokens_saved if ctx.page_selection else None,
+        first_certificate_seconds=ctx.first_certificate_seconds
+    )
 
 @app.post("/process-pdf-batch", response_model=BatchProcessingResult)
-async def process_pdf_batch(files: List[UploadFile] = File(...)):
+async def process_pdf_batch(request: Request, files: List[UploadFile] = File(...)):
     """Process multiple PDF documents in batch"""
     start_time = datetime.now()
     
@@ -391,18 +430,18 @@ async def process_pdf_batch(files: List[UploadFile] = File(...)):
     if not pdf_files:
         raise HTTPException(status_code=400, detail="No PDF files found")
     
+    tickets = admit_uploads(pdf_files)
     logger.info(f"Processing batch of {len(pdf_files)} PDF files")
     
-    # Process files in parallel with a reasonable concurrency limit
-    semaphore = asyncio.Semaphore(3)  # Limit to 3 concurrent processes
-    
-    async def process_with_semaphore(file):
-        async with semaphore:
-            return await process_single_file_async(file)
-    
-    # Process all files
-    tasks = [process_with_semaphore(file) for file in pdf_files]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    # Process all files - per-stage pipeline workers bound the concurrency and
+    # the shared memory budget bounds how much upload data is buffered at once
+    memory_budget = new_memory_budget()
+    tasks = [process_single_file_async(file, memory_budget, admission_ticket=ticket) for file, ticket in zip(pdf_files, tickets)]
+    try:
+        results = await run_until_disconnected(request, asyncio.gather(*tasks, return_exceptions=True))
+    finally:
+        for ticket in tickets:
+            admission.release(ticket)
     
     print("="*100)
     print(results)
@@ -448,6 +487,156 @@ async def process_pdf_batch(files: List[UploadFile] = File(...)):
         dashboard_url=f"/reports/{dashboard_filename}"
     )
 
+def format_sse(event: str, data: dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/process-pdf-stream")
+async def process_pdf_stream(files: List[UploadFile] = File(...)):
+    """Process multiple PDF documents, streaming per-file stage events as Server-Sent Events"""
+    start_time = datetime.now()
+    batch_id = f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    
+    pdf_files = [file for file in files if file.filename.lower().endswith('.pdf')]
+    
+    if not pdf_files:
+        raise HTTPException(status_code=400, detail="No PDF files found")
+    
+    tickets = admit_uploads(pdf_files)
+    
+    # Save uploads before streaming starts - the request body is not available afterwards
+    saved_files = []
+    memory_budget = new_memory_budget()
+    try:
+        for file, ticket in zip(pdf_files, tickets):
+            document_id = make_document_id(file.filename)
+            temp_file_path = os.path.join(TEMP_DIR, f"{document_id}.pdf")
+            content_hash = await save_upload(file, temp_file_path, memory_budget)
+            saved_files.append((temp_file_path, file.filename, document_id, content_hash, ticket))
+    except BaseException:
+        for ticket in tickets:
+            admission.release(ticket)
+        raise
+    
+    logger.info(f"Streaming batch of {len(saved_files)} PDF files")
+    
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def run_file(temp_file_path: str, filename: str, document_id: str, content_hash: str,
+                       ticket: AdmissionTicket):
+        def on_stage(stage: str, seconds: float):
+            events.put_nowait((stage, {"document_id": document_id, "filename": filename, "stage": stage, "seconds": seconds}))
+        
+        def on_certificate(event: Dict[str, Any]):
+            events.put_nowait(("certificate", event))
+        
+        file_start = datetime.now()
+        try:
+            result = await process_saved_pdf_async(temp_file_path, filename, document_id, file_start,
+                                                   on_stage=on_stage, content_hash=content_hash,
+                                                   admission_ticket=ticket, on_certificate=on_certificate)
+        except Exception as e:
+            # Every file must end with file_complete or the stream waits for it forever
+            logger.error(f"Error processing PDF {filename}: {str(e)}")
+            result = ProcessingResult(
+                success=False,
+                message=f"Processing failed: {str(e)}",
+                document_id=document_id,
+                processing_time=round((datetime.now() - file_start).total_seconds(), 2),
+                filename=filename
+            )
+        events.put_nowait(("file_complete", result.dict()))
+    
+    async def event_stream():
+        tasks = [asyncio.create_task(run_file(*saved)) for saved in saved_files]
+        # Only the small per-file results are kept, for the dashboard at the end
+        results = []
+        try:
+            yield format_sse("batch_started", {"batch_id": batch_id, "total_files": len(saved_files)})
+            
+            while len(results) < len(tasks):
+                event, data = await events.get()
+                if event == "file_complete":
+                    results.append(ProcessingResult(**data))
+                yield format_sse(event, data)
+            
+            dashboard_filename = f"{batch_id}_dashboard.html"
+            dashboard_html = generate_batch_dashboard(batch_id, results)
+            await stage_executor.run("render", write_html_report, os.path.join(OUTPUT_DIR, dashboard_filename), dashboard_html)
+            
+            successful_files = sum(1 for r in results if r.success)
+            yield format_sse("batch_complete", {
+                "success": True,
+                "batch_id": batch_id,
+                "total_files": len(results),
+                "successful_files": successful_files,
+                "failed_files": len(results) - successful_files,
+                "total_processing_time": round((datetime.now() - start_time).total_seconds(), 2),
+                "dashboard_url": f"/reports/{dashboard_filename}"
+            })
+        finally:
+            # Stop outstanding work if the client went away mid-stream
+            for task in tasks:
+                task.cancel()
+            for ticket in tickets:
+                admission.release(ticket)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/jobs", response_model=JobSubmission, status_code=202)
+async def submit_job(files: List[UploadFile] = File(...)):
+    """Queue PDF documents for background processing and return a job ID immediately"""
+    pdf_files = [file for file in files if file.filename.lower().endswith('.pdf')]
+    
+    if not pdf_files:
+        raise HTTPException(status_code=400, detail="No PDF files found")
+    
+    job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    
+    # Persist uploads so the job survives a server restart
+    saved_files = []
+    memory_budget = new_memory_budget()
+    for index, file in enumerate(pdf_files):
+        saved_path = os.path.join(job_dir, f"{index}.pdf")
+        await save_upload(file, saved_path, memory_budget)
+        saved_files.append((file.filename, saved_path))
+    
+    await job_manager.submit(job_id, saved_files)
+    
+    return JobSubmission(
+        job_id=job_id,
+        status="queued",
+        total_files=len(saved_files),
+        status_url=f"/jobs/{job_id}"
+    )
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """Return per-file progress and partial results for a job"""
+    job = await asyncio.to_thread(job_manager.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    files = [JobFileStatus(**f) for f in job["files"]]
+    finished = [f for f in files if f.result is not None]
+    
+    return JobStatus(
+        job_id=job["job_id"],
+        status=job["status"],
+        total_files=job["total_files"],
+        completed_files=len(finished),
+        successful_files=sum(1 for f in finished if f.result.success),
+        failed_files=sum(1 for f in finished if not f.result.success),
+        files=files,
+        dashboard_url=job["dashboard_url"]
+    )
+
 def generate_batch_dashboard(batch_id: str, results: List[ProcessingResult]) -> str:
     """Generate HTML dashboard for batch processing results"""
     
@@ -788,7 +977,39 @@ async def serve_public_file(file_path: str):
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "stage_executor": stage_executor.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Pipeline and cache metrics"""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "stage_executor": stage_executor.stats(),
+        "pipeline": document_pipeline.stats(),
+        "single_flight": document_pipeline.singleflight.stats(),
+        "adaptive_limits": limiter_stats(),
+        "openai_tpm": openai_token_bucket.stats(),
+        "llm_retries": llm_retry_policy.stats(),
+        "page_filter": page_filter_stats.stats(),
+        "chunked_extraction": chunked_extraction_stats.stats(),
+        "trace_fast_path": fast_path_stats.stats(),
+        "layout_templates": get_template_store().stats(),
+        "job_queue_depth": job_manager.queue_depth(),
+        "parse_cache": get_parse_cache().stats(),
+        "llm_cache": get_llm_cache().stats(),
+        "admission": admission.stats(),
+        "http_transport": transport_stats.stats()
+    }
+
+@app.delete("/cache/llm")
+async def invalidate_llm_cache(template: Optional[str] = None):
+    """Invalidate cached LLM responses for one prompt template, or all of them"""
+    removed = await asyncio.to_thread(get_llm_cache().invalidate, template)
+    return {"invalidated": removed, "template": template or "all"}
 
 @app.get("/api/docs")
 async def get_api_docs():
@@ -800,11 +1021,16 @@ async def get_api_docs():
             "GET /": "Main application interface",
             "POST /process-pdf": "Upload and process single PDF document",
             "POST /process-pdf-batch": "Upload and process multiple PDF documents",
+            "POST /process-pdf-stream": "Upload multiple PDFs and stream per-file progress as Server-Sent Events",
+            "POST /jobs": "Queue PDF documents for background processing (202 Accepted)",
+            "GET /jobs/{job_id}": "Job progress and partial results",
             "GET /public-demo": "Public demo page",
             "GET /public/{file_path}": "Serve custom HTML files from public directory",
             "GET /public/": "Static files (CSS, JS, assets) from public directory",
             "GET /reports/{filename}": "Access generated HTML reports",
             "GET /health": "Health check endpoint",
+            "GET /metrics": "Pipeline and cache metrics",
+            "DELETE /cache/llm": "Invalidate cached LLM responses (optional ?template=certificate_extraction|source_validation)",
             "GET /api/docs": "This API documentation"
         },
         "public_folder": {
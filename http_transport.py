@@ -0,0 +1,189 @@
+"""
+Shared HTTP Transport
+One keep-alive, HTTP/2-capable httpx connection pool per process (and per
+event loop for async callers) that every OpenAI and LlamaParse client
+sends through, so connections and TLS sessions are reused across
+documents instead of being set up per client. Each consumer gets its own
+thin client on top of the shared transport, because LlamaParse rewrites
+the base URL, headers and timeout of the client it is given.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib.util
+import weakref
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool limits shared by all OpenAI and LlamaParse calls in a process
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+# Default client timeouts; OpenAI and LlamaParse set their own per-request timeouts on top
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "120"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "10"))
+# HTTP/2 needs the h2 package (httpx[http2]); without it connections use HTTP/1.1
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+class TransportStats:
+    """Counts requests, new connections and TLS handshakes across the shared transports"""
+
+    def __init__(self):
+        """Start all counters at zero"""
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self.connect_seconds = 0.0
+        self.http2_requests = 0
+
+    def request_tracer(self) -> Callable[[str, Dict[str, Any]], None]:
+        """Return an httpcore trace callback for one request"""
+        started: Dict[str, float] = {}
+
+        def trace(event: str, info: Dict[str, Any]):
+            step, _, phase = event.rpartition(".")
+            if step in ("connection.connect_tcp", "connection.start_tls"):
+                if phase == "started":
+                    started[step] = time.perf_counter()
+                elif phase == "complete":
+                    with self._lock:
+                        self.connect_seconds += time.perf_counter() - started.pop(step, time.perf_counter())
+                        if step == "connection.connect_tcp":
+                            self.new_connections += 1
+                        else:
+                            self.tls_handshakes += 1
+            elif event == "http2.send_request_headers.started":
+                with self._lock:
+                    self.http2_requests += 1
+
+        return trace
+
+    def record_request(self):
+        """Count a request sent through a shared transport"""
+        with self._lock:
+            self.requests += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return connection reuse counters"""
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "http2_enabled": HTTP2_ENABLED,
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+                "tls_handshakes": self.tls_handshakes,
+                "connect_seconds": round(self.connect_seconds, 3),
+                "http2_requests": self.http2_requests
+            }
+
+
+transport_stats = TransportStats()
+
+
+def _limits() -> httpx.Limits:
+    """Pool limits from the environment"""
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+    )
+
+
+class SharedTransport(httpx.BaseTransport):
+    """Process-wide sync connection pool; clients closing it leave it open for the others"""
+
+    def __init__(self):
+        """Create the underlying pooled transport"""
+        self._transport = httpx.HTTPTransport(http2=HTTP2_ENABLED, limits=_limits())
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request through the pool, tracing connection setup"""
+        transport_stats.record_request()
+        request.extensions["trace"] = transport_stats.request_tracer()
+        return self._transport.handle_request(request)
+
+    def close(self):
+        """Ignored - the pool outlives the clients that use it"""
+
+    def shutdown(self):
+        """Close all pooled connections"""
+        self._transport.close()
+
+
+class SharedAsyncTransport(httpx.AsyncBaseTransport):
+    """Per-event-loop async connection pool shared by all async clients on that loop"""
+
+    def __init__(self):
+        """Create the underlying pooled transport"""
+        self._transport = httpx.AsyncHTTPTransport(http2=HTTP2_ENABLED, limits=_limits())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request through the pool, tracing connection setup"""
+        transport_stats.record_request()
+        tracer = transport_stats.request_tracer()
+
+        async def trace(event: str, info: Dict[str, Any]):
+            tracer(event, info)
+
+        request.extensions["trace"] = trace
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        """Ignored - the pool outlives the clients that use it"""
+
+    async def shutdown(self):
+        """Close all pooled connections"""
+        await self._transport.aclose()
+
+
+_transport_lock = threading.Lock()
+_sync_transport: Optional[SharedTransport] = None
+# Async connections belong to the loop that opened them, so each loop gets its own pool
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, SharedAsyncTransport]" = weakref.WeakKeyDictionary()
+
+
+def _timeout() -> httpx.Timeout:
+    """Default client timeout"""
+    return httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS)
+
+
+def new_http_client() -> httpx.Client:
+    """Return a new sync client on the shared connection pool"""
+    global _sync_transport
+    with _transport_lock:
+        if _sync_transport is None:
+            _sync_transport = SharedTransport()
+            logger.info(f"Shared HTTP transport created (HTTP/2 {'on' if HTTP2_ENABLED else 'off'}, {HTTP_MAX_CONNECTIONS} connections)")
+    return httpx.Client(transport=_sync_transport, timeout=_timeout())
+
+
+def new_async_http_client() -> httpx.AsyncClient:
+    """Return a new async client on the running loop's shared connection pool; call from a coroutine"""
+    loop = asyncio.get_running_loop()
+    with _transport_lock:
+        transport = _async_transports.get(loop)
+        if transport is None:
+            transport = _async_transports[loop] = SharedAsyncTransport()
+    return httpx.AsyncClient(transport=transport, timeout=_timeout())
+
+
+async def close_http_transports():
+    """Close the pools used by this process (the running loop's async pool and the sync pool)"""
+    global _sync_transport
+    with _transport_lock:
+        transport = _async_transports.pop(asyncio.get_running_loop(), None)
+        sync_transport, _sync_transport = _sync_transport, None
+    if transport is not None:
+        await transport.shutdown()
+    if sync_transport is not None:
+        sync_transport.shutdown()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Import-Time Benchmark
+Measures the cold-start cost of importing a module with `python -X importtime`
+in fresh interpreters, lists the slowest imports, checks that the import left
+no files behind, and appends each run to a history file so regressions show
+up over time.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(REPO_DIR, ".cache", "import_times.jsonl")
+
+
+def measure_import(module: str) -> Tuple[Dict[str, Tuple[int, int]], List[str]]:
+    """Import module once in a fresh interpreter and empty working directory.
+
+    Returns ({module: (self_us, cumulative_us)}, files created in the working directory).
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+        created = sorted(os.listdir(workdir))
+
+    timings = {}
+    for line in completed.stderr.splitlines():
+        # Format: "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Track the import-time cost of a module")
+    parser.add_argument("module", nargs="?", default="fastapi_pdf_processor", help="module to import")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to measure")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON-lines file the results are appended to")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail when the median import exceeds this")
+    args = parser.parse_args()
+
+    # Step 1: Measure; the first run also warms the bytecode cache
+    totals_ms = []
+    timings, created = {}, []
+    for _ in range(args.runs):
+        timings, created = measure_import(args.module)
+        totals_ms.append(timings[args.module][1] / 1000)
+    median_ms = statistics.median(totals_ms)
+
+    # Step 2: Report the slowest modules by their own import time
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (min {min(totals_ms):.1f}, max {max(totals_ms):.1f})")
+    print(f"\nSlowest imports (self time, last run):")
+    slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {self_us / 1000:8.1f} ms  (cumulative {cumulative_us / 1000:8.1f} ms)  {name}")
+
+    if created:
+        print(f"\n❌ Import created files in the working directory: {', '.join(created)}")
+    else:
+        print("\n✅ Import left the working directory untouched")
+
+    # Step 3: Compare with the previous run and append to the history
+    previous = None
+    if os.path.exists(args.history):
+        with open(args.history, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        previous = next((entry for entry in reversed(lines) if entry["module"] == args.module), None)
+    if previous:
+        delta = median_ms - previous["median_ms"]
+        print(f"Change since {previous['timestamp']}: {delta:+.1f} ms")
+
+    os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+    with open(args.history, "a", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "module": args.module,
+            "python": sys.version.split()[0],
+            "runs": args.runs,
+            "median_ms": round(median_ms, 1),
+            "created_files": created,
+            "slowest": [[name, self_us] for name, (self_us, _) in slowest]
+        }) + "\n")
+
+    if created or (args.max_ms is not None and median_ms > args.max_ms):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Batch Processing Jobs
+SQLite-backed job store and asyncio worker pool for long-running batch
+uploads. Jobs are persisted as soon as they are submitted, so files that
+were queued or in progress when the server stopped are picked up again
+on the next startup. Several server processes can share one job store:
+each file is claimed atomically before it is processed. The job manager
+runs every store call on a worker thread so SQLite lock waits never block
+the event loop.
+"""
+
+import os
+import json
+import time
+import asyncio
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Where job metadata and the uploaded PDFs waiting to be processed live
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "3"))
+# How long shutdown waits for job files already in progress before leaving them for the next start
+JOB_DRAIN_SECONDS = float(os.getenv("JOB_DRAIN_SECONDS", "30"))
+# Whether startup puts files left running by a previous run back in the queue;
+# a multi-process launcher does this once before starting its workers instead
+JOBS_REQUEUE_ON_START = os.getenv("JOBS_REQUEUE_ON_START", "1") == "1"
+
+# File and job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+COMPLETED = "completed"
+
+
+class JobStore:
+    """Persists jobs and per-file progress in SQLite"""
+
+    def __init__(self, path: str):
+        """Remember the job database location; it is created on first use"""
+        self.path = path
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    def _create_schema(self):
+        """Create the job database and its tables if needed"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._open() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    total_files INTEGER NOT NULL,
+                    dashboard_url TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS job_files (
+                    job_id TEXT NOT NULL,
+                    file_index INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    owner TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, file_index)
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived transaction, creating the database on first use"""
+        if not self._ready:
+            with self._ready_lock:
+                if not self._ready:
+                    self._create_schema()
+                    self._ready = True
+        with self._open() as conn:
+            yield conn
+
+    @contextmanager
+    def _open(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived transaction without schema checks"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_job(self, job_id: str, files: List[Tuple[str, str]]):
+        """Record a new job; files is a list of (filename, saved path)"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, status, total_files, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, len(files), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, file_index, filename, path, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, index, filename, path, QUEUED, now) for index, (filename, path) in enumerate(files)]
+            )
+
+    def mark_file(self, job_id: str, file_index: int, status: str, result: Optional[Dict[str, Any]] = None):
+        """Update the status (and optionally the result) of one file"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_files SET status = ?, result = COALESCE(?, result), updated_at = ? WHERE job_id = ? AND file_index = ?",
+                (status, json.dumps(result) if result is not None else None, now, job_id, file_index)
+            )
+            if status == RUNNING:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                    (RUNNING, now, job_id, QUEUED)
+                )
+
+    def claim_file(self, job_id: str, file_index: int, owner: str) -> bool:
+        """Mark a queued file as running for owner; False if another process already took it"""
+        now = time.time()
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE job_files SET status = ?, owner = ?, updated_at = ? WHERE job_id = ? AND file_index = ? AND status = ?",
+                (RUNNING, owner, now, job_id, file_index, QUEUED)
+            ).rowcount == 1
+            if claimed:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ? AND status = ?",
+                    (RUNNING, now, job_id, QUEUED)
+                )
+            return claimed
+
+    def requeue_running(self) -> int:
+        """Put files left running by a stopped server back in the queue; only safe while no worker runs"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE job_files SET status = ?, owner = NULL, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING)
+            ).rowcount
+
+    def finish_job(self, job_id: str, dashboard_url: Optional[str] = None):
+        """Mark a job as completed"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, dashboard_url = ?, updated_at = ? WHERE job_id = ?",
+                (COMPLETED, dashboard_url, time.time(), job_id)
+            )
+
+    def is_job_done(self, job_id: str) -> bool:
+        """True once every file of the job has a final status"""
+        with self._connect() as conn:
+            remaining = conn.execute(
+                "SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status IN (?, ?)",
+                (job_id, QUEUED, RUNNING)
+            ).fetchone()[0]
+            return remaining == 0
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job with its per-file status and results, or None if unknown"""
+        with self._connect() as conn:
+            job = conn.execute(
+                "SELECT job_id, status, total_files, dashboard_url, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            if job is None:
+                return None
+
+            files = conn.execute(
+                "SELECT file_index, filename, status, result FROM job_files WHERE job_id = ? ORDER BY file_index",
+                (job_id,)
+            ).fetchall()
+
+        return {
+            "job_id": job[0],
+            "status": job[1],
+            "total_files": job[2],
+            "dashboard_url": job[3],
+            "created_at": job[4],
+            "updated_at": job[5],
+            "files": [
+                {
+                    "file_index": index,
+                    "filename": filename,
+                    "status": status,
+                    "result": json.loads(result) if result else None
+                }
+                for index, filename, status, result in files
+            ]
+        }
+
+    def queued_files(self) -> List[Tuple[str, int, str, str]]:
+        """Return (job_id, file_index, filename, path) for files waiting to be processed"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT job_id, file_index, filename, path FROM job_files WHERE status = ? ORDER BY updated_at",
+                (QUEUED,)
+            ).fetchall()
+
+
+class JobManager:
+    """Runs queued job files on a fixed pool of asyncio workers"""
+
+    def __init__(self,
+                 store: JobStore,
+                 process_file: Callable[[str, str], Awaitable[Dict[str, Any]]],
+                 on_job_complete: Optional[Callable[[str, List[Dict[str, Any]]], Awaitable[Optional[str]]]] = None,
+                 workers: int = JOB_WORKERS):
+        """
+        process_file(path, filename) returns a ProcessingResult-style dict with a "success" key.
+        on_job_complete(job_id, results) may return a dashboard URL for the finished job.
+        """
+        self.store = store
+        self.process_file = process_file
+        self.on_job_complete = on_job_complete
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._busy: Set[asyncio.Task] = set()
+        self._stopping = False
+        # Identifies this process's claims in the shared store
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def start(self, requeue_running: bool = JOBS_REQUEUE_ON_START):
+        """Queue unfinished work from a previous run and start the workers"""
+        self._queue = asyncio.Queue()
+        self._stopping = False
+
+        if requeue_running:
+            requeued = await asyncio.to_thread(self.store.requeue_running)
+            if requeued:
+                logger.info(f"Re-queued {requeued} job files interrupted by a previous run")
+
+        # Other processes sharing the store may queue the same files; claim_file decides who runs them
+        queued = await asyncio.to_thread(self.store.queued_files)
+        if queued:
+            logger.info(f"Resuming {len(queued)} queued job files")
+        for job_id, file_index, filename, path in queued:
+            self._queue.put_nowait((job_id, file_index, filename, path))
+
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Job manager started with {self.workers} workers")
+
+    async def stop(self, drain_seconds: float = 0):
+        """Stop the workers, giving in-progress files up to drain_seconds to finish; the rest stay queued for the next start"""
+        self._stopping = True
+        busy = list(self._busy)
+        if busy and drain_seconds > 0:
+            logger.info(f"Draining {len(busy)} in-progress job files (up to {drain_seconds:.0f}s)")
+            _, pending = await asyncio.wait(busy, timeout=drain_seconds)
+            if pending:
+                logger.warning(f"{len(pending)} job files still running after drain; they will resume on the next start")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job_id: str, files: List[Tuple[str, str]]):
+        """Persist a new job and queue its files"""
+        await asyncio.to_thread(self.store.create_job, job_id, files)
+        for file_index, (filename, path) in enumerate(files):
+            self._queue.put_nowait((job_id, file_index, filename, path))
+        logger.info(f"Queued job {job_id} with {len(files)} files")
+
+    def queue_depth(self) -> int:
+        """Number of job files waiting for a worker"""
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self, worker_index: int):
+        """Process queued files one at a time until the manager stops"""
+        while not self._stopping:
+            job_id, file_index, filename, path = await self._queue.get()
+            try:
+                if self._stopping or not await asyncio.to_thread(self.store.claim_file, job_id, file_index, self.owner):
+                    continue
+                self._busy.add(asyncio.current_task())
+                try:
+                    result = await self.process_file(path, filename)
+                except Exception as e:
+                    logger.error(f"Job {job_id} file {filename} failed: {str(e)}")
+                    result = {"success": False, "message": f"Processing failed: {str(e)}", "filename": filename}
+
+                await asyncio.to_thread(self.store.mark_file, job_id, file_index,
+                                        SUCCEEDED if result.get("success") else FAILED, result)
+
+                if await asyncio.to_thread(self.store.is_job_done, job_id):
+                    await self._complete_job(job_id)
+            finally:
+                self._busy.discard(asyncio.current_task())
+                self._queue.task_done()
+
+    async def _complete_job(self, job_id: str):
+        """Run the completion hook and mark the job finished"""
+        dashboard_url = None
+        if self.on_job_complete:
+            job = await asyncio.to_thread(self.store.get_job, job_id)
+            results = [f["result"] for f in job["files"] if f["result"]]
+            try:
+                dashboard_url = await self.on_job_complete(job_id, results)
+            except Exception as e:
+                logger.error(f"Completion hook failed for job {job_id}: {str(e)}")
+        await asyncio.to_thread(self.store.finish_job, job_id, dashboard_url)
+        logger.info(f"Job {job_id} completed")
@@ -0,0 +1,78 @@
+"""
+Incremental JSON Array Parser
+Consumes a streamed model response piece by piece and returns each element
+of its top-level JSON array as soon as that element is complete, so callers
+can act on the first certificate while the rest is still being generated.
+Text before the array (e.g. a ```json fence) and after it is ignored.
+"""
+
+import json
+from typing import Any, List
+
+
+class IncrementalJSONArrayParser:
+    """Yields the elements of the first JSON array in a text fed in arbitrary pieces"""
+
+    def __init__(self):
+        """Start before the opening bracket"""
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start = None
+        self.elements = 0
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return self._buffer
+
+    def feed(self, piece: str) -> List[Any]:
+        """Add the next piece of text; return the elements it completed, in order"""
+        self._buffer += piece
+        completed = []
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.complete:
+            char = buffer[self._pos]
+            if not self._started:
+                if char == "[":
+                    self._started = True
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char in "{[":
+                if self._depth == 0:
+                    self._element_start = self._pos
+                self._depth += 1
+            elif char in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    # Objects and nested arrays are emitted on their closing bracket
+                    completed.append(self._emit(self._pos + 1))
+            elif self._depth == 0 and char in ",]":
+                # Scalars are only known to be complete at the next separator
+                if self._element_start is not None:
+                    completed.append(self._emit(self._pos))
+                if char == "]":
+                    self.complete = True
+            else:
+                if char == '"':
+                    self._in_string = True
+                if self._element_start is None and not char.isspace():
+                    self._element_start = self._pos
+            self._pos += 1
+        return completed
+
+    def _emit(self, end: int) -> Any:
+        """Decode the element that started at _element_start and ends before end"""
+        element = json.loads(self._buffer[self._element_start:end])
+        self._element_start = None
+        self.elements += 1
+        return element
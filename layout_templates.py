@@ -0,0 +1,428 @@
+"""
+Learned Layout Templates
+Recurring vendor paperwork (packing slips, C of Cs) has the same labels and
+tables every time. After gpt-4o extracts a document, this module records
+where each certificate field was found in it - a table column, a label on
+the lines under a table row, a document label, or a vendor constant - under
+a fingerprint of the document's layout. Once the same template has been
+learned from enough distinct documents, later documents with that layout
+are read with the stored locators and no LLM call. Low-confidence reads
+return None so the caller falls back to the LLM.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from disk_cache import DiskCache, CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_TEMPLATES_ENABLED = os.getenv("LAYOUT_TEMPLATES_ENABLED", "1") == "1"
+# Share of the template's fields that must be found (when learning and when applying)
+TEMPLATE_MIN_CONFIDENCE = float(os.getenv("TEMPLATE_MIN_CONFIDENCE", "0.9"))
+# Distinct documents that must have produced the same template before it replaces the LLM
+TEMPLATE_MIN_CONFIRMATIONS = int(os.getenv("TEMPLATE_MIN_CONFIRMATIONS", "2"))
+LAYOUT_TEMPLATE_MAX_BYTES = int(os.getenv("LAYOUT_TEMPLATE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Bump when the fingerprint or locator format changes so old templates are ignored
+TEMPLATE_FORMAT_VERSION = "3"
+
+# Fields that are the same on every document of a vendor layout and may be stored as constants.
+# Not the manufacturer: on distributor paperwork it changes from part to part.
+CONSTANT_FIELDS = ("certificate_type", "seller_name")
+
+# Fields the traceability chain is validated from; a template must locate each of them (or know it is absent)
+CHAIN_FIELDS = ("part_number", "manufacturer", "seller_name", "traceability_source")
+
+# "Label: value", "Label:: value", "Label# value", "Label#: value"
+LABEL_LINE = re.compile(r"^([A-Za-z*][A-Za-z0-9 /.&'()*-]{0,40}?)\s*(#:|:{1,2}|#)\s*(.*)$")
+PAGE_MARKER = re.compile(r"^(START|END) OF PAGE: \d+$")
+
+
+def _clean(value: Any) -> str:
+    """Whitespace-collapsed text without trailing punctuation"""
+    return re.sub(r"\s+", " ", str(value)).strip().rstrip(".,;").strip()
+
+
+def _same(a: Any, b: Any) -> bool:
+    """Comparison of cleaned values ignoring case and spacing ("GROMMET,NONMETALLIC" is "Grommet, nonmetallic")"""
+    return re.sub(r"\s", "", _clean(a).upper()) == re.sub(r"\s", "", _clean(b).upper())
+
+
+def _is_empty(value: Any) -> bool:
+    """True for missing or null-like values"""
+    return value is None or _clean(value).upper() in ("", "NULL", "NONE", "N/A")
+
+
+def _cells(line: str) -> List[str]:
+    """Cells of a markdown table line"""
+    line = line.strip()
+    # Only bordered tables ("| a | b |") have empty outer cells; "a | b |" ends with an empty last column
+    if line.startswith("|") and line.endswith("|"):
+        line = line[1:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+@dataclass
+class TableRow:
+    """One table row and the label lines printed under it (LOT#, TRACE TO:, ...)"""
+    cells: Dict[str, str]
+    labels: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Layout:
+    """Labels, tables and fixed lines of a parsed document"""
+    labels: Dict[str, str] = field(default_factory=dict)
+    tables: List[Tuple[Tuple[str, ...], List[TableRow]]] = field(default_factory=list)
+    fixed_lines: List[str] = field(default_factory=list)
+
+    def rows(self, header: Tuple[str, ...]) -> List[TableRow]:
+        """Rows of every table with this header (tables repeat on continuation pages)"""
+        return [row for table_header, rows in self.tables if table_header == header for row in rows]
+
+    def fingerprint(self) -> str:
+        """Hash of the layout: label names, table headers and fixed lines, without any values"""
+        signature = {
+            "labels": sorted(self.labels),
+            "tables": sorted({" | ".join(header) for header, _ in self.tables}),
+            "fixed": sorted(set(self.fixed_lines))
+        }
+        return hashlib.sha256(json.dumps(signature, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+def parse_layout(markdown: str) -> Layout:
+    """Read labels, tables (with per-row label lines) and fixed lines from parsed markdown"""
+    layout = Layout()
+    lines = [line.strip() for line in markdown.splitlines()]
+    header: Optional[Tuple[str, ...]] = None
+    rows: List[TableRow] = []
+    pending_label: Optional[str] = None
+    # The vendor's letterhead: the first lines that are neither labels nor table rows
+    letterhead = 2
+
+    def close_table():
+        nonlocal header, rows
+        if header:
+            layout.tables.append((header, rows))
+        header, rows = None, []
+
+    for line in lines:
+        if not line or PAGE_MARKER.match(line):
+            close_table()
+            pending_label = None
+            continue
+
+        if "|" in line and len(_cells(line)) >= 2:
+            cells = _cells(line)
+            if all(set(cell) <= set("-: ") for cell in cells):
+                continue
+            if header is None or len(cells) > len(header):
+                close_table()
+                header = tuple(cells)
+            else:
+                rows.append(TableRow(dict(zip(header, cells))))
+            continue
+
+        match = LABEL_LINE.match(line)
+        if match:
+            key = f"{_clean(match.group(1)).upper()}{match.group(2)[0]}"
+            value = match.group(3).strip()
+            if rows:
+                rows[-1].labels.setdefault(key, value)
+                continue
+            close_table()
+            layout.labels.setdefault(key, value)
+            # A label on its own line ("To:") takes the next line as its value
+            pending_label = key if not value else None
+            continue
+
+        close_table()
+        if pending_label and not layout.labels[pending_label]:
+            layout.labels[pending_label] = line
+            pending_label = None
+            continue
+        if line.startswith(("***", "#")):
+            layout.fixed_lines.append(_clean(re.sub(r"\d", "", line)).upper())
+        elif letterhead and not re.search(r"[:@]", line):
+            letterhead -= 1
+            layout.fixed_lines.append(_clean(re.sub(r"\d", "", line)).upper())
+    close_table()
+    return layout
+
+
+def _row_value(row: Optional[TableRow], layout: Layout, locator: List[Any]) -> Optional[str]:
+    """Apply one locator to a table row (or the whole document)"""
+    kind = locator[0]
+    if kind == "absent":
+        return None
+    if kind == "constant":
+        return locator[1]
+    if kind == "label":
+        value = layout.labels.get(locator[1])
+    elif row is None:
+        return None
+    elif kind == "row_label":
+        value = row.labels.get(locator[1])
+    else:
+        cell = row.cells.get(locator[1]) or ""
+        first, _, rest = cell.partition(" ")
+        value = {"cell": cell, "cell_first": first, "cell_rest": rest}[kind]
+    return None if _is_empty(value) else _clean(value)
+
+
+def _find_locator(name: str, value: str, row: Optional[TableRow], layout: Layout,
+                  preferred: Optional[List[Any]] = None) -> Optional[List[Any]]:
+    """First locator that reproduces value: the stored template's, then the row's, then the document's"""
+    candidates: List[List[Any]] = [preferred] if preferred else []
+    if row is not None:
+        for column in row.cells:
+            candidates += [["cell", column], ["cell_first", column], ["cell_rest", column]]
+        candidates += [["row_label", key] for key in row.labels]
+    candidates += [["label", key] for key in layout.labels]
+    for locator in candidates:
+        found = _row_value(row, layout, locator)
+        if found is not None and _same(found, value):
+            return locator
+    if name in CONSTANT_FIELDS:
+        return ["constant", value]
+    return None
+
+
+def _empty_slots(rows: List[Optional[TableRow]], layout: Layout) -> List[List[Any]]:
+    """Cells, row labels and document labels that are empty throughout the document"""
+    slots = [["label", key] for key, value in layout.labels.items() if _is_empty(value)]
+    if rows[0] is not None:
+        for locator in [["cell", column] for column in rows[0].cells] + \
+                       [["row_label", key] for key in sorted({key for row in rows for key in row.labels})]:
+            if all(_row_value(row, layout, locator) is None for row in rows):
+                slots.append(locator)
+    return slots
+
+
+def _absence_holds(template: Dict[str, Any], rows: List[Optional[TableRow]], layout: Layout) -> bool:
+    """True when a document has nothing where the fields empty at learning time could be printed"""
+    if any(_row_value(row, layout, slot) is not None for row in rows for slot in template["empty_slots"]):
+        return False
+    known = set(template["row_labels"])
+    return all(set(row.labels) <= known for row in rows if row is not None)
+
+
+def learn_template(markdown: str, certificates: List[Dict[str, Any]],
+                   stored: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Derive field locators that reproduce the extracted certificates; None if the layout does not explain them"""
+    layout = parse_layout(markdown)
+    if not certificates:
+        return None
+
+    # One certificate per row of the table that lists the part numbers, or one document-level certificate
+    header, rows = None, [None]
+    for table_header, _ in layout.tables:
+        table_rows = layout.rows(table_header)
+        if len(table_rows) == len(certificates) and all(
+                any(_same(cell.partition(" ")[0], cert.get("part_number")) or _same(cell, cert.get("part_number"))
+                    for cell in row.cells.values())
+                for row, cert in zip(table_rows, certificates) if not _is_empty(cert.get("part_number"))):
+            header, rows = table_header, table_rows
+            break
+    if header is None and len(certificates) != 1:
+        return None
+
+    locators: Dict[str, Any] = {}
+    located = 0
+    for name in certificates[0]:
+        values = [cert.get(name) for cert in certificates]
+        if all(_is_empty(value) for value in values):
+            # Reported empty later only while the document has nothing new where it could be printed
+            locators[name] = ["absent"]
+            located += 1
+            continue
+        # The locator must reproduce this field on every certificate; where several would, keep the stored one
+        preferred = stored["locators"].get(name) if stored else None
+        locator = _find_locator(name, values[0], rows[0], layout, preferred) if not _is_empty(values[0]) else None
+        if locator and all(not _is_empty(value) and _row_value(row, layout, locator) is not None
+                           and _same(_row_value(row, layout, locator), value) for row, value in zip(rows, values)):
+            locators[name] = locator
+            located += 1
+        else:
+            locators[name] = None
+
+    # Other fields the layout could not explain count against the template; chain fields may not be missing
+    coverage = located / len(locators) if locators else 0.0
+    if locators.get("part_number") in (None, ["absent"]) or coverage < TEMPLATE_MIN_CONFIDENCE \
+            or any(name in locators and locators[name] is None for name in CHAIN_FIELDS):
+        return None
+    return {
+        "header": list(header) if header else None,
+        "locators": locators,
+        "empty_slots": _empty_slots(rows, layout),
+        "row_labels": sorted({key for row in rows if row is not None for key in row.labels}),
+        "coverage": round(coverage, 3)
+    }
+
+
+def apply_template(template: Dict[str, Any], layout: Layout) -> Tuple[List[Dict[str, Any]], float]:
+    """Certificates read with a template and the share of all fields it accounted for"""
+    rows = layout.rows(tuple(template["header"])) if template["header"] else [None]
+    absence_holds = _absence_holds(template, rows, layout)
+    certificates = []
+    expected = found = 0
+    for row in rows:
+        certificate = {}
+        for name, locator in template["locators"].items():
+            expected += 1
+            if locator is None:
+                # A field the template never located is a miss, not an empty value
+                certificate[name] = None
+            elif locator == ["absent"]:
+                certificate[name] = None
+                found += absence_holds
+            else:
+                certificate[name] = _row_value(row, layout, locator)
+                found += certificate[name] is not None
+        certificates.append(certificate)
+    return certificates, (found / expected if expected else 0.0)
+
+
+def _missing_chain_field(template: Dict[str, Any], layout: Layout, certificates: List[Dict[str, Any]]) -> bool:
+    """True when a chain field came back empty without being known to be absent from this document"""
+    rows = layout.rows(tuple(template["header"])) if template["header"] else [None]
+    absence_holds = _absence_holds(template, rows, layout)
+    for name in CHAIN_FIELDS:
+        if name not in template["locators"]:
+            continue
+        known_absent = template["locators"][name] == ["absent"] and absence_holds
+        if not known_absent and any(cert.get(name) is None for cert in certificates):
+            return True
+    return False
+
+
+class TemplateStats:
+    """Counts documents read with templates versus sent to the LLM"""
+
+    def __init__(self):
+        """Start all counters at zero"""
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.hits = 0
+        self.no_template = 0
+        self.unconfirmed = 0
+        self.low_confidence = 0
+        self.learned = 0
+        self.confirmed = 0
+        self.not_learnable = 0
+
+    def count(self, counter: str):
+        """Increment one counter"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the template hit rate and learning counters"""
+        with self._lock:
+            return {
+                "enabled": LAYOUT_TEMPLATES_ENABLED,
+                "documents": self.documents,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.documents, 3) if self.documents else 0.0,
+                "no_template": self.no_template,
+                "unconfirmed": self.unconfirmed,
+                "low_confidence": self.low_confidence,
+                "learned": self.learned,
+                "confirmed": self.confirmed,
+                "not_learnable": self.not_learnable
+            }
+
+
+template_stats = TemplateStats()
+
+
+class LayoutTemplateStore:
+    """Learned templates keyed by layout fingerprint, shared by all workers through SQLite"""
+
+    def __init__(self, cache: DiskCache):
+        """Wrap the disk cache holding the templates"""
+        self.cache = cache
+
+    @staticmethod
+    def _key(fingerprint: str) -> str:
+        """Cache key of a layout"""
+        return f"v{TEMPLATE_FORMAT_VERSION}:{fingerprint}"
+
+    def _load(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Stored template record for a layout"""
+        stored = self.cache.get(self._key(fingerprint))
+        return json.loads(stored) if stored else None
+
+    def match(self, markdown: str, document_name: str) -> Optional[List[Dict[str, Any]]]:
+        """Certificate fields read with a confirmed template; None when the LLM should extract"""
+        template_stats.count("documents")
+        layout = parse_layout(markdown)
+        record = self._load(layout.fingerprint())
+        if record is None:
+            template_stats.count("no_template")
+            return None
+        if len(record["documents"]) < TEMPLATE_MIN_CONFIRMATIONS:
+            template_stats.count("unconfirmed")
+            return None
+
+        certificates, confidence = apply_template(record["template"], layout)
+        if confidence < TEMPLATE_MIN_CONFIDENCE or _missing_chain_field(record["template"], layout, certificates):
+            template_stats.count("low_confidence")
+            logger.info(f"Layout template for {document_name} found {confidence:.0%} of its fields, using the LLM")
+            return None
+        template_stats.count("hits")
+        logger.info(f"Read {len(certificates)} certificates from {document_name} with a learned layout template ({confidence:.0%} of fields)")
+        return certificates
+
+    def learn(self, markdown: str, certificates: List[Dict[str, Any]], document_name: str):
+        """Record the template that explains an LLM extraction; confirm it if this layout already has it"""
+        fingerprint = parse_layout(markdown).fingerprint()
+        record = self._load(fingerprint)
+        template = learn_template(markdown, certificates, record["template"] if record else None)
+        if template is None:
+            template_stats.count("not_learnable")
+            return
+        document_hash = hashlib.sha256(markdown.encode("utf-8")).hexdigest()[:16]
+
+        if record is not None and record["template"]["header"] == template["header"] and record["template"]["locators"] == template["locators"]:
+            if document_hash in record["documents"]:
+                return
+            # What was empty or printed under the rows on any confirming document
+            stored = record["template"]
+            stored["empty_slots"] = [slot for slot in stored["empty_slots"] if slot in template["empty_slots"]]
+            stored["row_labels"] = sorted(set(stored["row_labels"]) | set(template["row_labels"]))
+            record["documents"] = (record["documents"] + [document_hash])[-TEMPLATE_MIN_CONFIRMATIONS:]
+            template_stats.count("confirmed")
+        else:
+            # New layout, or the vendor changed what is where: start over
+            record = {"template": template, "documents": [document_hash]}
+            template_stats.count("learned")
+        self.cache.set(self._key(fingerprint), json.dumps(record))
+        logger.info(f"Layout template {fingerprint} from {document_name}: {len(record['documents'])}/{TEMPLATE_MIN_CONFIRMATIONS} confirmations")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return template counters and store occupancy"""
+        return {**template_stats.stats(), "store": self.cache.stats()}
+
+
+_template_store: Optional[LayoutTemplateStore] = None
+_template_store_lock = threading.Lock()
+
+
+def get_template_store() -> LayoutTemplateStore:
+    """Return the shared template store, opening it on first use"""
+    global _template_store
+    with _template_store_lock:
+        if _template_store is None:
+            _template_store = LayoutTemplateStore(DiskCache(
+                os.path.join(CACHE_DIR, "layout_templates.sqlite3"),
+                LAYOUT_TEMPLATE_MAX_BYTES
+            ))
+        return _template_store
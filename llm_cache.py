@@ -0,0 +1,98 @@
+"""
+LLM Response Cache
+Persistent cache for deterministic (temperature 0) chat completions.
+Entries are keyed on the model, system message, a hash of the user
+prompt and the prompt-template version, so bumping a template version
+never serves a stale answer.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from disk_cache import DiskCache, CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Cache limits (defaults: 256 MB, entries expire after 7 days)
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+class LLMResponseCache:
+    """Caches raw chat completion text per prompt template"""
+
+    def __init__(self, cache: DiskCache):
+        """Wrap a DiskCache instance"""
+        self.cache = cache
+
+    @staticmethod
+    def make_key(request: Dict[str, Any], template: str, template_version: str) -> str:
+        """Build the cache key for a chat completion request"""
+        messages = request.get("messages", [])
+        system_message = "\n".join(m["content"] for m in messages if m.get("role") == "system")
+        prompt = "\n".join(m["content"] for m in messages if m.get("role") != "system")
+
+        key_fields = {
+            "model": request.get("model"),
+            "system": hashlib.sha256(system_message.encode("utf-8")).hexdigest(),
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "template": f"{template}:{template_version}",
+            "temperature": request.get("temperature"),
+            "max_tokens": request.get("max_tokens")
+        }
+        return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, request: Dict[str, Any], template: str, template_version: str) -> Optional[str]:
+        """Return the cached response text, or None on a miss"""
+        return self.cache.get(self.make_key(request, template, template_version))
+
+    def set(self, request: Dict[str, Any], template: str, template_version: str, response_text: str):
+        """Store response text for a request"""
+        self.cache.set(self.make_key(request, template, template_version), response_text, tag=template)
+
+    async def aget(self, request: Dict[str, Any], template: str, template_version: str) -> Optional[str]:
+        """get() for async callers; the SQLite lookup runs on a worker thread"""
+        return await self.cache.aget(self.make_key(request, template, template_version))
+
+    async def aset(self, request: Dict[str, Any], template: str, template_version: str, response_text: str):
+        """set() for async callers; the SQLite write runs on a worker thread"""
+        await self.cache.aset(self.make_key(request, template, template_version), response_text, tag=template)
+
+    async def aprobe(self, request: Dict[str, Any], template: str, template_version: str) -> Optional[str]:
+        """aget() that leaves the hit/miss counters alone; report a used probe with count_probe()"""
+        return await self.cache.aget(self.make_key(request, template, template_version), count=False)
+
+    def count_probe(self, hit: bool):
+        """Count a probe whose result was used in place of a lookup"""
+        self.cache.count_lookup(hit)
+
+    def invalidate(self, template: Optional[str] = None) -> int:
+        """Drop cached responses for one template, or everything when template is None"""
+        removed = self.cache.delete_tag(template) if template else self.cache.clear()
+        logger.info(f"Invalidated {removed} cached LLM responses ({template or 'all templates'})")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and occupancy"""
+        return self.cache.stats()
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the shared LLM response cache, opening it on first use"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache(DiskCache(
+                os.path.join(CACHE_DIR, "llm_cache.sqlite3"),
+                LLM_CACHE_MAX_BYTES,
+                ttl_seconds=LLM_CACHE_TTL_SECONDS or None
+            ))
+        return _llm_cache
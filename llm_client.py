@@ -0,0 +1,131 @@
+"""
+Shared OpenAI Clients
+Provides process-wide synchronous and asynchronous OpenAI clients so every
+extractor and validator instance reuses the same connection pool, plus
+chat completion helpers that apply the shared rate limits and retry policy
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+from contextlib import AsyncExitStack
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict
+
+# openai and httpx are imported when the first client is built, keeping them off the import path
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
+
+from adaptive_limiter import llm_limiter
+from token_bucket import openai_token_bucket, estimate_request_tokens
+from llm_retry import llm_retry_policy
+
+# Per-request timeout for OpenAI calls (the library default is 10 minutes)
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120"))
+# The SDK's own retries are off; llm_retry_policy is the single retry layer
+OPENAI_SDK_MAX_RETRIES = 0
+
+_clients_lock = threading.Lock()
+_sync_clients: Dict[str, "OpenAI"] = {}
+# Async clients are bound to the event loop their connections were opened on
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client(api_key: str = "") -> "OpenAI":
+    """Return the shared synchronous client for an API key (environment key if empty)"""
+    with _clients_lock:
+        if api_key not in _sync_clients:
+            from openai import OpenAI
+            from http_transport import new_http_client
+            _sync_clients[api_key] = OpenAI(api_key=api_key or None, timeout=OPENAI_TIMEOUT_SECONDS,
+                                            max_retries=OPENAI_SDK_MAX_RETRIES, http_client=new_http_client())
+        return _sync_clients[api_key]
+
+
+def get_async_openai_client(api_key: str = "") -> "AsyncOpenAI":
+    """Return the shared asynchronous client for an API key on the running event loop (environment key if empty)"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        if api_key not in clients:
+            from openai import AsyncOpenAI
+            from http_transport import new_async_http_client
+            clients[api_key] = AsyncOpenAI(api_key=api_key or None, timeout=OPENAI_TIMEOUT_SECONDS,
+                                           max_retries=OPENAI_SDK_MAX_RETRIES, http_client=new_async_http_client())
+        return clients[api_key]
+
+
+def _settle_usage(response, reserved: int):
+    """Replace the token estimate with the usage reported by the API"""
+    usage = getattr(response, "usage", None)
+    if usage is not None and usage.total_tokens is not None:
+        openai_token_bucket.settle(reserved, usage.total_tokens)
+
+
+def create_chat_completion(client: "OpenAI", request: Dict[str, Any]):
+    """Send a chat completion, retrying rate limits and transient upstream failures"""
+    return llm_retry_policy.call(lambda: _create_chat_completion_once(client, request))
+
+
+async def acreate_chat_completion(client: "AsyncOpenAI", request: Dict[str, Any]):
+    """Async variant of create_chat_completion"""
+    return await llm_retry_policy.acall(lambda: _acreate_chat_completion_once(client, request))
+
+
+async def astream_chat_completion(client: "AsyncOpenAI", request: Dict[str, Any]) -> AsyncIterator[Any]:
+    """Stream a chat completion chunk by chunk under the same limits as acreate_chat_completion.
+
+    Failures opening the stream are retried; a stream that breaks after it started raises.
+    """
+    request = dict(request, stream=True, stream_options={"include_usage": True})
+    async with AsyncExitStack() as stack:
+        stream, reserved = await llm_retry_policy.acall(lambda: _aopen_stream_once(client, request, stack))
+        usage = None
+        async for chunk in stream:
+            usage = getattr(chunk, "usage", None) or usage
+            yield chunk
+        if usage is not None and usage.total_tokens is not None:
+            openai_token_bucket.settle(reserved, usage.total_tokens)
+
+
+async def _aopen_stream_once(client: "AsyncOpenAI", request: Dict[str, Any], stack: AsyncExitStack):
+    """Open a streamed completion; its concurrency slot is held on stack until the stream is consumed"""
+    reserved = estimate_request_tokens(request)
+    await openai_token_bucket.aacquire(reserved)
+    slot = AsyncExitStack()
+    await slot.enter_async_context(llm_limiter.slot(latency_class(request)))
+    try:
+        stream = await client.chat.completions.create(**request)
+    except BaseException as e:
+        # Report the failure to the limiter before the retry policy decides what to do
+        await slot.__aexit__(type(e), e, e.__traceback__)
+        raise
+    stack.push_async_exit(slot)
+    stack.push_async_callback(stream.close)
+    return stream, reserved
+
+
+def latency_class(request: Dict[str, Any]) -> str:
+    """Limiter latency class of a request; its completion budget sets how long it runs"""
+    return f"max_tokens={request.get('max_tokens') or 'default'}"
+
+
+def _create_chat_completion_once(client: "OpenAI", request: Dict[str, Any]):
+    """Send a chat completion once the shared TPM budget allows it"""
+    reserved = estimate_request_tokens(request)
+    openai_token_bucket.acquire(reserved)
+    # Failed calls keep their reservation, which doubles as a back-off
+    response = client.chat.completions.create(**request)
+    _settle_usage(response, reserved)
+    return response
+
+
+async def _acreate_chat_completion_once(client: "AsyncOpenAI", request: Dict[str, Any]):
+    """Async variant of _create_chat_completion_once that also holds an adaptive concurrency slot"""
+    reserved = estimate_request_tokens(request)
+    # Wait for tokens before taking a slot so queued calls do not hold concurrency
+    await openai_token_bucket.aacquire(reserved)
+    async with llm_limiter.slot(latency_class(request)):
+        response = await client.chat.completions.create(**request)
+    _settle_usage(response, reserved)
+    return response
@@ -0,0 +1,194 @@
+"""
+LLM Retry Policy
+Retries OpenAI calls that failed with rate limiting, upstream 5xx,
+timeouts or connection errors, waiting with capped exponential backoff
+and full jitter, or for the server's Retry-After when it sends one.
+Each document gets a retry budget shared by all of its LLM calls, so a
+struggling upstream cannot multiply one document's work indefinitely.
+Any other error is fatal and raised at once.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from adaptive_limiter import is_overload_error
+
+logger = logging.getLogger(__name__)
+
+# Attempts per call, including the first one
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+# Backoff ceiling doubles from the base per attempt, up to the max; a longer Retry-After gives up
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+# Retries one document may spend across extraction and validation
+LLM_RETRY_BUDGET = int(os.getenv("LLM_RETRY_BUDGET", "6"))
+
+
+class RetryBudget:
+    """Retries left for one document"""
+
+    def __init__(self, retries: int = LLM_RETRY_BUDGET):
+        """Start with the full budget"""
+        self.remaining = retries
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Spend one retry; False when the budget is used up"""
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+# Budget of the document a coroutine is working on; None means per-call attempts only
+current_retry_budget: contextvars.ContextVar = contextvars.ContextVar("current_retry_budget", default=None)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    """HTTP status of an API error, if it has one"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """True for rate limits, 5xx, request timeouts/conflicts and connection failures"""
+    if is_overload_error(error) or _status_code(error) in (408, 409):
+        return True
+    # openai.APIConnectionError and httpx connect/read errors, without importing either
+    return _status_code(error) is None and "Connection" in type(error).__name__
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay the server asked for in Retry-After / retry-after-ms, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP-date form
+            return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter, Retry-After support and per-document budgets"""
+
+    def __init__(self, max_attempts: int = LLM_MAX_ATTEMPTS, base_seconds: float = LLM_RETRY_BASE_SECONDS,
+                 max_seconds: float = LLM_RETRY_MAX_SECONDS):
+        """Configure the policy; counters start at zero"""
+        self.max_attempts = max(1, max_attempts)
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.retryable_errors = 0
+        self.fatal_errors = 0
+        self.gave_up = 0
+        self.budget_exhausted = 0
+        self.retry_after_used = 0
+        self.wait_seconds = 0.0
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """Full jitter: uniform between zero and the capped exponential ceiling"""
+        return random.uniform(0, min(self.max_seconds, self.base_seconds * 2 ** (attempt - 1)))
+
+    def _next_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to raise the error"""
+        with self._lock:
+            if not is_retryable_error(error):
+                self.fatal_errors += 1
+                return None
+            self.retryable_errors += 1
+
+            delay = retry_after_seconds(error)
+            if delay is not None and delay > self.max_seconds:
+                # Waiting this long would blow the request's latency budget
+                self.gave_up += 1
+                return None
+            if attempt >= self.max_attempts:
+                self.gave_up += 1
+                return None
+            budget = current_retry_budget.get()
+            if budget is not None and not budget.take():
+                self.budget_exhausted += 1
+                return None
+
+            if delay is None:
+                delay = self.backoff_seconds(attempt)
+            else:
+                self.retry_after_used += 1
+                delay = max(0.0, delay)
+            self.retries += 1
+            self.wait_seconds += delay
+
+        logger.warning(f"LLM call failed ({type(error).__name__}: {str(error)[:200]}); retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+        return delay
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        """Run func, retrying retryable failures in this thread"""
+        with self._lock:
+            self.calls += 1
+        attempt = 1
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of call; cancellation (e.g. a stage deadline) interrupts the wait"""
+        with self._lock:
+            self.calls += 1
+        attempt = 1
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return retry counters"""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "retryable_errors": self.retryable_errors,
+                "fatal_errors": self.fatal_errors,
+                "gave_up": self.gave_up,
+                "budget_exhausted": self.budget_exhausted,
+                "retry_after_used": self.retry_after_used,
+                "wait_seconds": round(self.wait_seconds, 2),
+                "max_attempts": self.max_attempts
+            }
+
+
+# Shared policy for all OpenAI calls
+llm_retry_policy = RetryPolicy()
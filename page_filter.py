@@ -0,0 +1,164 @@
+"""
+Page Relevance Prefilter
+Splits parsed markdown on the START OF PAGE / END OF PAGE markers that
+pdfparser emits and keeps only the pages that matter for certificate
+extraction: pages naming the buyer, pages carrying certificate-form
+signals (ATA 106, 8130-3, C of C, EN 10204, ...), pages with traceability
+evidence (bills of sale, air carriers, consignments) and pages mentioning
+a part number from the buyer's paperwork. Everything else (terms and
+conditions, cover letters, printer banners) is left out of the LLM prompt.
+When in doubt the whole document is kept.
+"""
+
+import os
+import re
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+PAGE_FILTER_ENABLED = os.getenv("PAGE_FILTER_ENABLED", "1") == "1"
+# Buyer whose paperwork defines the primary part numbers
+PAGE_FILTER_BUYER = os.getenv("PAGE_FILTER_BUYER", "SKYLINK")
+# Pages scoring below this are dropped (buyer 3, each certificate signal 2,
+# each traceability signal or part-number hit 1)
+PAGE_FILTER_MIN_SCORE = int(os.getenv("PAGE_FILTER_MIN_SCORE", "1"))
+
+PAGE_START = re.compile(r"START OF PAGE: (\d+)")
+
+CERTIFICATE_SIGNALS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"ATA\s*(SPEC\w*\.?\s*)?106",
+    r"PART\s*(OR\s*)?MATERIAL\s*CERTIFICATION",
+    r"8130-3",
+    r"EASA\s*FORM\s*1\b",
+    r"AUTHORI[SZ]ED\s*RELEASE\s*CERTIFICATE",
+    r"CERTIFICATE\s*OF\s*CONFORM",
+    r"\bC\s*of\s*C\b",
+    r"EN\s*10204",
+    r"MATERIAL\s*CERT",
+    r"CERTIF(Y|IES)\s*THAT",
+    r"TRUE\s*CERTIFIED\s*COPY",
+)]
+
+# Origin evidence the extractor reads into traceability_source
+TRACEABILITY_SIGNALS = [re.compile(pattern, re.IGNORECASE) for pattern in (
+    r"BILL\s*OF\s*SALE",
+    r"AIR\s*CARRIER",
+    r"AIR\s*LINES?\b|AIRLINES?\b",
+    r"PART\s*1(21|29|35|45)\b",
+    r"REPAIR\s*STATION",
+    r"NON[-\s]*INCIDENT",
+    r"CONSIGN",
+    r"TRACEAB",
+)]
+
+# Part-number-like tokens: letters/digits with at least one digit, optionally dash-separated
+PART_NUMBER_TOKEN = re.compile(r"\b(?=[A-Z0-9\-]*\d)(?=[A-Z0-9\-]*[A-Z\-])[A-Z0-9][A-Z0-9\-]{3,23}[A-Z0-9]\b")
+
+
+@dataclass
+class PageSelection:
+    """Pages kept for the extraction prompt and what was saved"""
+    text: str
+    pages_total: int
+    pages_kept: List[int]
+    chars_total: int
+    chars_kept: int
+
+    @property
+    def tokens_saved(self) -> int:
+        """Estimated prompt tokens saved (about 4 characters per token)"""
+        return (self.chars_total - self.chars_kept) // 4
+
+
+class PageFilterStats:
+    """Totals across all filtered documents"""
+
+    def __init__(self):
+        """Start all counters at zero"""
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.filtered_documents = 0
+        self.pages_total = 0
+        self.pages_kept = 0
+        self.tokens_saved = 0
+
+    def record(self, selection: PageSelection):
+        """Add one document's selection"""
+        with self._lock:
+            self.documents += 1
+            self.filtered_documents += len(selection.pages_kept) < selection.pages_total
+            self.pages_total += selection.pages_total
+            self.pages_kept += len(selection.pages_kept)
+            self.tokens_saved += selection.tokens_saved
+
+    def stats(self) -> Dict[str, Any]:
+        """Return page and token savings"""
+        with self._lock:
+            return {
+                "enabled": PAGE_FILTER_ENABLED,
+                "documents": self.documents,
+                "filtered_documents": self.filtered_documents,
+                "pages_total": self.pages_total,
+                "pages_kept": self.pages_kept,
+                "tokens_saved": self.tokens_saved
+            }
+
+
+page_filter_stats = PageFilterStats()
+
+
+def split_pages(markdown: str) -> List[tuple]:
+    """Return (page number, block) pairs; each block keeps its own START/END markers"""
+    starts = list(PAGE_START.finditer(markdown))
+    pages = []
+    for index, match in enumerate(starts):
+        end = starts[index + 1].start() if index + 1 < len(starts) else len(markdown)
+        pages.append((int(match.group(1)), markdown[match.start():end]))
+    return pages
+
+
+def buyer_pages(pages: List[tuple], buyer: str = PAGE_FILTER_BUYER) -> List[tuple]:
+    """The (page number, block) pairs that name the buyer"""
+    return [(number, block) for number, block in pages if buyer.upper() in block.upper()]
+
+
+def buyer_part_numbers(pages: List[tuple], buyer: str = PAGE_FILTER_BUYER) -> Set[str]:
+    """Part-number-like tokens from the pages that name the buyer"""
+    buyer = buyer.upper()
+    tokens = set()
+    for _, block in buyer_pages(pages, buyer):
+        tokens.update(token for token in PART_NUMBER_TOKEN.findall(block.upper()) if buyer not in token)
+    return tokens
+
+
+def score_page(block: str, part_numbers: Set[str], buyer: str = PAGE_FILTER_BUYER) -> int:
+    """Relevance of one page for certificate extraction"""
+    upper = block.upper()
+    score = 3 if buyer.upper() in upper else 0
+    score += 2 * sum(1 for signal in CERTIFICATE_SIGNALS if signal.search(block))
+    score += sum(1 for signal in TRACEABILITY_SIGNALS if signal.search(block))
+    if part_numbers:
+        score += len(part_numbers.intersection(PART_NUMBER_TOKEN.findall(upper)))
+    return score
+
+
+def select_relevant_pages(markdown: str, min_score: int = PAGE_FILTER_MIN_SCORE) -> PageSelection:
+    """Keep the pages relevant to extraction; the whole document when it cannot be filtered safely"""
+    pages = split_pages(markdown)
+    prefix = markdown[:len(markdown) - sum(len(block) for _, block in pages)]
+    keep_all = PageSelection(markdown, len(pages), [number for number, _ in pages], len(markdown), len(markdown))
+
+    part_numbers = buyer_part_numbers(pages)
+    # Without page markers or the buyer's paperwork there is nothing to anchor the filter on
+    if not PAGE_FILTER_ENABLED or len(pages) < 2 or not part_numbers:
+        page_filter_stats.record(keep_all)
+        return keep_all
+
+    kept = [(number, block) for number, block in pages if score_page(block, part_numbers) >= min_score]
+    text = prefix + "".join(block for _, block in kept)
+    selection = PageSelection(text, len(pages), [number for number, _ in kept], len(markdown), len(text))
+    page_filter_stats.record(selection)
+    return selection
@@ -1,16 +1,133 @@
-from llama_cloud_services import LlamaParse
 import os
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
-from dotenv import load_dotenv
 import logging
 
-load_dotenv(dotenv_path=".env")
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=".env")
+
+from disk_cache import DiskCache, CACHE_DIR
+from adaptive_limiter import parse_limiter
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get API key from environment variable
-API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
+# Maximum number of documents parsed concurrently by the async batch helper
+PARSE_MAX_IN_FLIGHT = int(os.getenv("PARSE_MAX_IN_FLIGHT", "5"))
+
+# Size limit for the content-addressed markdown cache (default 512 MB)
+PARSE_CACHE_MAX_BYTES = int(os.getenv("PARSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+def get_parse_strategies():
+    """Return the parsing strategies to try, in order of preference"""
+    # Read at call time so a .env loaded by the entry point is picked up
+    api_key = os.getenv("LLAMA_CLOUD_API_KEY")
+    return [
+        {
+            "name": "Standard Markdown with Page Numbers and Exact Tables",
+            "config": {
+                "api_key": api_key,
+                "result_type": "markdown",
+                "system_prompt": "Parse this document and extract all text content while preserving structure and formatting. Pay special attention to tables - preserve exact table structure, column alignment, merged cells, and all table data. Maintain precise spacing and formatting within tables.",
+                "max_timeout": 180,
+                "verbose": True,
+                "language": "en",
+                "page_prefix": "START OF PAGE: {pageNumber}\n",
+                "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
+                "split_by_page": True,
+                # Table-specific options for exact structure preservation
+                "output_tables_as_HTML": True,  # Output tables as HTML for better structure preservation
+                "outlined_table_extraction": True,  # Better extraction for tables with borders
+                "adaptive_long_table": True,  # Handle long tables that span multiple pages
+                "do_not_unroll_columns": True,  # Preserve original column structure
+                "premium_mode": True,  # Use best parsing quality
+                "extract_layout": True,  # Preserve layout information
+                "preserve_layout_alignment_across_pages": True,# Maintain alignment across pages
+            }
+        },
+        {
+            "name": "Text Only with Page Numbers and Exact Tables",
+            "config": {
+                "api_key": api_key,
+                "result_type": "text",
+                "system_prompt": "Extract all text content from this document. For tables, preserve exact structure, spacing, and alignment. Maintain all rows, columns, and cell content exactly as they appear.",
+                "max_timeout": 120,
+                "verbose": True,
+                "language": "en",
+                "page_prefix": "START OF PAGE: {pageNumber}\n",
+                "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
+                "split_by_page": True,
+                # Table-specific options
+                "output_tables_as_HTML": True,
+                "outlined_table_extraction": True,
+                "adaptive_long_table": True,
+                "do_not_unroll_columns": True,
+                "premium_mode": True,
+                "extract_layout": True,
+                "preserve_layout_alignment_across_pages": True
+            }
+        },
+        {
+            "name": "Simple Parse with Page Numbers and Exact Tables",
+            "config": {
+                "api_key": api_key,
+                "max_timeout": 90,
+                "verbose": True,
+                "language": "en",
+                "page_prefix": "START OF PAGE: {pageNumber}\n",
+                "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
+                "split_by_page": True,
+                # Table-specific options
+                "output_tables_as_HTML": True,
+                "outlined_table_extraction": True,
+                "adaptive_long_table": True,
+                "do_not_unroll_columns": True,
+                "premium_mode": True,
+                "extract_layout": True
+            }
+        }
+    ]
+
+
+def new_parser(config: dict, shared_connections: bool = False):
+    """Build a LlamaParse client; llama_cloud_services is imported on first use, not at module import.
+
+    shared_connections sends its requests through the running loop's shared HTTP transport
+    (async use only - the sync load_data runs its own event loop).
+    """
+    from llama_cloud_services import LlamaParse
+    if shared_connections:
+        from http_transport import new_async_http_client
+        # Without a custom client LlamaParse opens a fresh connection pool for every call
+        config = {**config, "custom_client": new_async_http_client()}
+    return LlamaParse(**config)
+
+def _check_parse_inputs(file_path: str):
+    """Fail fast when the API key or the input file is missing"""
+    # Check if API key is available
+    if not os.getenv("LLAMA_CLOUD_API_KEY"):
+        raise ValueError("LLAMA_CLOUD_API_KEY not found in environment variables")
+    
+    # Check if file exists
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+def _documents_to_text(documents) -> str:
+    """Join the text of parsed documents, skipping empty pages"""
+    result_text = ""
+    for doc in documents or []:
+        if doc.text and doc.text.strip():
+            result_text += doc.text
+            result_text += "\n\n"
+    return result_text
 
 @retry(
     stop=stop_after_attempt(3),
@@ -20,110 +137,27 @@ API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
 def parse_document(file_path: str) -> str:
     """Parse a document with retry logic on failure."""
     try:
-        # Check if API key is available
-        if not API_KEY:
-            raise ValueError("LLAMA_CLOUD_API_KEY not found in environment variables")
-        
-        # Check if file exists
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+        _check_parse_inputs(file_path)
         
         # Parse document
         logger.info(f"Starting to parse document: {file_path}")
         
-        # Try different parsing strategies in order of preference
-        strategies = [
-            {
-                "name": "Standard Markdown with Page Numbers and Exact Tables",
-                "config": {
-                    "api_key": API_KEY,
-                    "result_type": "markdown",
-                    "system_prompt": "Parse this document and extract all text content while preserving structure and formatting. Pay special attention to tables - preserve exact table structure, column alignment, merged cells, and all table data. Maintain precise spacing and formatting within tables.",
-                    # "max_timeout": 180,
-                    "verbose": True,
-                    "language": "en",
-                    "page_prefix": "START OF PAGE: {pageNumber}\n",
-                    "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
-                    "split_by_page": True,
-                    # Table-specific options for exact structure preservation
-                    "output_tables_as_HTML": True,  # Output tables as HTML for better structure preservation
-                    "outlined_table_extraction": True,  # Better extraction for tables with borders
-                    "adaptive_long_table": True,  # Handle long tables that span multiple pages
-                    "do_not_unroll_columns": True,  # Preserve original column structure
-                    "premium_mode": True,  # Use best parsing quality
-                    "extract_layout": True,  # Preserve layout information
-                    "preserve_layout_alignment_across_pages": True,# Maintain alignment across pages
-                }
-            },
-            {
-                "name": "Text Only with Page Numbers and Exact Tables",
-                "config": {
-                    "api_key": API_KEY,
-                    "result_type": "text",
-                    "system_prompt": "Extract all text content from this document. For tables, preserve exact structure, spacing, and alignment. Maintain all rows, columns, and cell content exactly as they appear.",
-                    # "max_timeout": 120,
-                    "verbose": True,
-                    "language": "en",
-                    "page_prefix": "START OF PAGE: {pageNumber}\n",
-                    "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
-                    "split_by_page": True,
-                    # Table-specific options
-                    "output_tables_as_HTML": True,
-                    "outlined_table_extraction": True,
-                    "adaptive_long_table": True,
-                    "do_not_unroll_columns": True,
-                    "premium_mode": True,
-                    "extract_layout": True,
-                    "preserve_layout_alignment_across_pages": True
-                }
-            },
-            {
-                "name": "Simple Parse with Page Numbers and Exact Tables",
-                "config": {
-                    "api_key": API_KEY,
-                    # "max_timeout": 90,
-                    "verbose": True,
-                    "language": "en",
-                    "page_prefix": "START OF PAGE: {pageNumber}\n",
-                    "page_suffix": "\n\nEND OF PAGE: {pageNumber}\n\n",
-                    "split_by_page": True,
-                    # Table-specific options
-                    "output_tables_as_HTML": True,
-                    "outlined_table_extraction": True,
-                    "adaptive_long_table": True,
-                    "do_not_unroll_columns": True,
-                    "premium_mode": True,
-                    "extract_layout": True
-                }
-            }
-        ]
-        
         last_error = None
         
-        for strategy in strategies:
+        # Try different parsing strategies in order of preference
+        for strategy in get_parse_strategies():
             try:
                 logger.info(f"Attempting parsing with strategy: {strategy['name']}")
-                parser = LlamaParse(**strategy['config'])
+                parser = new_parser(strategy['config'])
                 
                 # Parse document
-                documents = parser.load_data(file_path)
+                result_text = _documents_to_text(parser.load_data(file_path))
                 
-                if documents and len(documents) > 0:
-                    # Extract text from parsed documents
-                    result_text = ""
-                    for doc in documents:
-                        if doc.text and doc.text.strip():
-                            result_text += doc.text
-                            result_text += "\n\n"
-                    
-                    if result_text.strip():
-                        logger.info(f"Successfully parsed document with strategy '{strategy['name']}': {file_path}")
-                        return result_text
-                    else:
-                        logger.warning(f"Strategy '{strategy['name']}' returned empty content")
-                        continue
+                if result_text.strip():
+                    logger.info(f"Successfully parsed document with strategy '{strategy['name']}': {file_path}")
+                    return result_text
                 else:
-                    logger.warning(f"Strategy '{strategy['name']}' returned no documents")
+                    logger.warning(f"Strategy '{strategy['name']}' returned empty content")
                     continue
                     
             except Exception as e:
@@ -141,6 +175,105 @@ def parse_document(file_path: str) -> str:
         logger.error(f"Error parsing document {file_path}: {str(e)}")
         raise
 
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    reraise=True
+)
+async def parse_document_async(file_path: str) -> str:
+    """Async variant of parse_document using LlamaParse's non-blocking API."""
+    try:
+        _check_parse_inputs(file_path)
+        
+        logger.info(f"Starting to parse document (async): {file_path}")
+        
+        last_error = None
+        
+        for strategy in get_parse_strategies():
+            try:
+                logger.info(f"Attempting parsing with strategy: {strategy['name']}")
+                parser = new_parser(strategy['config'], shared_connections=True)
+                
+                # Parse document without blocking the event loop
+                result_text = _documents_to_text(await parser.aload_data(file_path))
+                
+                if result_text.strip():
+                    logger.info(f"Successfully parsed document with strategy '{strategy['name']}': {file_path}")
+                    return result_text
+                else:
+                    logger.warning(f"Strategy '{strategy['name']}' returned empty content")
+                    continue
+                    
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Strategy '{strategy['name']}' failed: {str(e)}")
+                continue
+        
+        if last_error:
+            raise last_error
+        else:
+            raise Exception("All parsing strategies failed to extract content")
+        
+    except Exception as e:
+        logger.error(f"Error parsing document {file_path}: {str(e)}")
+        raise
+
+def get_parse_cache() -> DiskCache:
+    """Return the shared parse cache, opening it on first use"""
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = DiskCache(os.path.join(CACHE_DIR, "parse_cache.sqlite3"), PARSE_CACHE_MAX_BYTES)
+        return _parse_cache
+
+def file_sha256(file_path: str) -> str:
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_cache_key(content_hash: str) -> str:
+    """Build the cache key from the PDF hash and the parse strategy configuration"""
+    # Credentials and timeouts do not change the parsed output, so they stay out of the key
+    configs = [
+        {key: value for key, value in strategy["config"].items() if key not in ("api_key", "max_timeout")}
+        for strategy in get_parse_strategies()
+    ]
+    config_hash = hashlib.sha256(json.dumps(configs, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{content_hash}:{config_hash}"
+
+def parse_document_cached(file_path: str, content_hash: Optional[str] = None) -> str:
+    """Parse a document, reusing cached markdown when the same PDF was parsed before."""
+    cache = get_parse_cache()
+    key = parse_cache_key(content_hash or file_sha256(file_path))
+    
+    cached = cache.get(key)
+    if cached is not None:
+        logger.info(f"Parse cache hit for {file_path}")
+        return cached
+    
+    result_text = parse_document(file_path)
+    cache.set(key, result_text)
+    return result_text
+
+async def parse_document_cached_async(file_path: str, content_hash: Optional[str] = None) -> str:
+    """Async variant of parse_document_cached; hashing and cache I/O run off the event loop."""
+    cache = get_parse_cache()
+    key = parse_cache_key(content_hash or await asyncio.to_thread(file_sha256, file_path))
+    
+    cached = await cache.aget(key)
+    if cached is not None:
+        logger.info(f"Parse cache hit for {file_path}")
+        return cached
+    
+    # Only real LlamaParse calls count against (and feed back into) the adaptive limit
+    async with parse_limiter.slot():
+        result_text = await parse_document_async(file_path)
+    await cache.aset(key, result_text)
+    return result_text
+
 def batch_parse_documents(directory_path: str, output_dir: str = "./markdowns"):
     """Parse all PDF files in a directory."""
     try:
@@ -153,7 +286,7 @@ def batch_parse_documents(directory_path: str, output_dir: str = "./markdowns"):
         for pdf_file in pdf_files:
             file_path = os.path.join(directory_path, pdf_file)
             try:
-                output = parse_document(file_path)
+                output = parse_document_cached(file_path)
                 
                 # Write output to file
                 output_filename = pdf_file.replace('.pdf', '.md')
@@ -172,20 +305,52 @@ def batch_parse_documents(directory_path: str, output_dir: str = "./markdowns"):
         logger.error(f"Failed to process directory {directory_path}: {str(e)}")
         raise
 
+async def batch_parse_documents_async(directory_path: str, output_dir: str = "./markdowns", max_in_flight: int = PARSE_MAX_IN_FLIGHT):
+    """Parse all PDF files in a directory concurrently with a bounded number of in-flight jobs."""
+    try:
+        # Create output directory if it doesn't exist
+        os.makedirs(output_dir, exist_ok=True)
+        
+        # Get all PDF files in directory
+        pdf_files = [f for f in os.listdir(directory_path) if f.lower().endswith('.pdf')]
+        logger.info(f"Submitting {len(pdf_files)} PDFs for parsing ({max_in_flight} in flight)")
+        
+        semaphore = asyncio.Semaphore(max_in_flight)
+        
+        async def parse_one(pdf_file: str) -> bool:
+            file_path = os.path.join(directory_path, pdf_file)
+            try:
+                async with semaphore:
+                    output = await parse_document_cached_async(file_path)
+                
+                # Write output to file
+                output_filename = pdf_file.replace('.pdf', '.md')
+                output_path = os.path.join(output_dir, output_filename)
+                
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(output)
+                    
+                logger.info(f"Successfully wrote output to {output_path}")
+                return True
+                
+            except Exception as e:
+                logger.error(f"Failed to process {pdf_file}: {str(e)}")
+                return False
+        
+        results = await asyncio.gather(*(parse_one(pdf_file) for pdf_file in pdf_files))
+        logger.info(f"Parsed {sum(results)}/{len(pdf_files)} PDFs from {directory_path}")
+        return results
+                
+    except Exception as e:
+        logger.error(f"Failed to process directory {directory_path}: {str(e)}")
+        raise
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     try:
         os.listdir("./invoices")
-        batch_parse_documents("./invoices", "./markdowns")
+        asyncio.run(batch_parse_documents_async("./invoices", "./markdowns"))
     except Exception as e:
         logger.error(f"Failed to process document: {str(e)}")
         print(f"❌ Error: {str(e)}")
         raise
-
-# sync batch
-# results = parser.parse(["./my_file1.pdf", "./my_file2.pdf"])
-
-# # async
-# result = await parser.aparse("./my_file.pdf")
-
-# # async batch
-# results = await parser.aparse(["./my_file1.pdf", "./my_file2.pdf"])
\ No newline at end of file
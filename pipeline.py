@@ -0,0 +1,427 @@
+"""
+Staged Document Pipeline
+Runs parse → extract → validate → render as separate stages connected by
+bounded queues. Every stage has its own worker count, so a slow LlamaParse
+job only occupies a parse worker while other documents keep moving
+through extraction and validation.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pdfparser import parse_document_cached_async, file_sha256
+from stage_executor import StageExecutor
+from singleflight import SingleFlight
+from scheduler import WeightedFairQueue, current_priority, BATCH, BACKGROUND
+from llm_retry import RetryBudget, current_retry_budget
+from page_filter import PageSelection, select_relevant_pages
+
+logger = logging.getLogger(__name__)
+
+# Per-stage worker counts and the size of the queue in front of each stage.
+# Upstream concurrency inside parse/extract/validate is set by the adaptive
+# limiters, so these are upper bounds rather than the working concurrency.
+PIPELINE_PARSE_WORKERS = int(os.getenv("PIPELINE_PARSE_WORKERS", "16"))
+PIPELINE_EXTRACT_WORKERS = int(os.getenv("PIPELINE_EXTRACT_WORKERS", "16"))
+PIPELINE_VALIDATE_WORKERS = int(os.getenv("PIPELINE_VALIDATE_WORKERS", "16"))
+PIPELINE_RENDER_WORKERS = int(os.getenv("PIPELINE_RENDER_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+# Latency budget per document, counted from when the parse stage picks it up, and each stage's share of it
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "600"))
+STAGE_BUDGET_SHARES = {"parse": 0.5, "extract": 0.25, "validate": 0.2, "render": 0.05}
+
+
+class StageTimeoutError(Exception):
+    """A stage ran out of its share of the document's latency budget"""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"{stage} stage timed out after {seconds:.0f}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+@dataclass
+class DocumentContext:
+    """State of one document as it moves through the pipeline"""
+    document_id: str
+    filename: str
+    priority: str = BATCH
+    pdf_path: Optional[str] = None
+    remove_pdf: bool = False
+    content_hash: Optional[str] = None
+    markdown: Optional[str] = None
+    report_path: Optional[str] = None
+    # Pages of the markdown sent to the extraction prompt
+    page_selection: Optional[PageSelection] = None
+    certificates: List[Any] = field(default_factory=list)
+    # Seconds into the extract stage when the first certificate arrived from the streamed response
+    first_certificate_seconds: Optional[float] = None
+    # Registry status of each company named on the certificates, checked as they arrive
+    entity_checks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Validation cache probe started as certificates arrive; resolves to (certificates covered, cached text)
+    validation_probe: Optional[asyncio.Task] = None
+    target_cert: Any = None
+    traceability: Any = None
+    summary_data: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+    stage_timings: Dict[str, float] = field(default_factory=dict)
+    # Absolute time.monotonic() deadline; set from REQUEST_BUDGET_SECONDS when the parse stage picks the
+    # document up, except for background work, which has no deadline
+    deadline: Optional[float] = None
+    timed_out_stages: List[str] = field(default_factory=list)
+    # LLM retries shared by all of this document's stages; created on submission if empty
+    retry_budget: Optional[RetryBudget] = None
+    on_stage: Optional[Callable[[str, float], None]] = None
+    # Called with each certificate (and its entity checks) as soon as extraction yields it
+    on_certificate: Optional[Callable[[Dict[str, Any]], None]] = None
+    future: Optional[asyncio.Future] = None
+
+
+@dataclass
+class Stage:
+    """One pipeline stage: an async step function, its worker count and latency budget share.
+
+    When the stage runs out of time, on_timeout (if set) degrades the document instead of failing it.
+    """
+    name: str
+    event: str
+    func: Callable[[DocumentContext], Awaitable[None]]
+    workers: int
+    budget_share: float = 1.0
+    on_timeout: Optional[Callable[[DocumentContext, float], None]] = None
+
+
+class StagedPipeline:
+    """Generic engine that moves contexts through stages over bounded weighted-fair queues"""
+
+    def __init__(self, stages: List[Stage], queue_size: int = PIPELINE_QUEUE_SIZE):
+        """Configure the stages; workers start lazily on the first submission"""
+        self.stages = stages
+        self.queue_size = queue_size
+        self._queues: List[WeightedFairQueue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._busy: Dict[str, int] = {stage.name: 0 for stage in stages}
+        self._start_lock: Optional[asyncio.Lock] = None
+
+    async def _ensure_started(self):
+        """Create queues and worker tasks inside the running event loop"""
+        if self._tasks:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._tasks:
+                return
+            self._queues = [WeightedFairQueue(maxsize=self.queue_size) for _ in self.stages]
+            for index, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self._tasks.append(asyncio.create_task(self._worker(index)))
+            logger.info("Pipeline started: " + ", ".join(f"{s.name}×{s.workers}" for s in self.stages))
+
+    async def process(self, ctx: DocumentContext) -> DocumentContext:
+        """Run a document through every stage; failures are recorded on ctx.error"""
+        await self._ensure_started()
+        if ctx.retry_budget is None:
+            ctx.retry_budget = RetryBudget()
+        ctx.future = asyncio.get_running_loop().create_future()
+        # Waits here when the first stage is saturated (backpressure)
+        await self._queues[0].put(ctx, ctx.priority)
+        return await ctx.future
+
+    async def _worker(self, index: int):
+        """Pull contexts for one stage, run it and hand them to the next stage"""
+        stage = self.stages[index]
+        queue = self._queues[index]
+        while True:
+            ctx = await queue.get()
+            try:
+                # Waiting behind other documents for the first stage does not use up the budget
+                if index == 0 and ctx.deadline is None and ctx.priority != BACKGROUND:
+                    ctx.deadline = time.monotonic() + REQUEST_BUDGET_SECONDS
+                timeout = self._stage_timeout(index, ctx)
+                # Skip work for failed documents and callers that gave up waiting
+                if ctx.error is None and not ctx.future.done() and timeout is not None and timeout <= 0:
+                    # The budget ran out while the document was queued
+                    self._on_stage_timeout(stage, ctx, 0.0)
+                elif ctx.error is None and not ctx.future.done():
+                    self._busy[stage.name] += 1
+                    stage_start = time.monotonic()
+                    # Cancelling the caller's future (e.g. client disconnect) cancels the running stage
+                    # The stage task inherits the document's priority for the upstream limiters
+                    # and its retry budget for LLM calls
+                    priority_token = current_priority.set(ctx.priority)
+                    budget_token = current_retry_budget.set(ctx.retry_budget)
+                    try:
+                        stage_task = asyncio.ensure_future(stage.func(ctx))
+                    finally:
+                        current_retry_budget.reset(budget_token)
+                        current_priority.reset(priority_token)
+                    cancel_stage = lambda future, task=stage_task: task.cancel() if future.cancelled() else None
+                    ctx.future.add_done_callback(cancel_stage)
+                    try:
+                        await asyncio.wait_for(stage_task, timeout)
+                        seconds = round(time.monotonic() - stage_start, 2)
+                        ctx.stage_timings[stage.name] = seconds
+                        if ctx.on_stage:
+                            ctx.on_stage(stage.event, seconds)
+                    except asyncio.TimeoutError:
+                        self._on_stage_timeout(stage, ctx, timeout)
+                    except asyncio.CancelledError:
+                        if not ctx.future.cancelled():
+                            # The worker itself is being stopped
+                            raise
+                        logger.info(f"Stage '{stage.name}' cancelled for {ctx.filename}")
+                    except Exception as e:
+                        logger.error(f"Stage '{stage.name}' failed for {ctx.filename}: {str(e)}")
+                        ctx.error = e
+                    finally:
+                        ctx.future.remove_done_callback(cancel_stage)
+                        self._busy[stage.name] -= 1
+
+                if index + 1 < len(self.stages) and ctx.error is None and not ctx.future.done():
+                    await self._queues[index + 1].put(ctx, ctx.priority)
+                elif not ctx.future.done():
+                    ctx.future.set_result(ctx)
+            finally:
+                queue.task_done()
+
+    def _stage_timeout(self, index: int, ctx: DocumentContext) -> Optional[float]:
+        """Give this stage its share of the time left, so unused time flows to later stages; None without a deadline"""
+        if ctx.deadline is None:
+            return None
+        remaining = ctx.deadline - time.monotonic()
+        shares = [stage.budget_share for stage in self.stages[index:]]
+        return remaining * shares[0] / sum(shares)
+
+    def _on_stage_timeout(self, stage: Stage, ctx: DocumentContext, timeout: float):
+        """Degrade the document if the stage allows it, otherwise fail it"""
+        seconds = round(timeout, 2)
+        ctx.timed_out_stages.append(stage.name)
+        ctx.stage_timings[stage.name] = seconds
+        if stage.on_timeout is None:
+            logger.error(f"Stage '{stage.name}' timed out after {seconds}s for {ctx.filename}")
+            ctx.error = StageTimeoutError(stage.name, seconds)
+            return
+
+        logger.warning(f"Stage '{stage.name}' timed out after {seconds}s for {ctx.filename} - continuing degraded")
+        stage.on_timeout(ctx, seconds)
+        if ctx.on_stage:
+            ctx.on_stage(stage.event, seconds)
+
+    async def stop(self):
+        """Cancel all stage workers"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-stage worker counts, busy workers and queue depth"""
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "busy": self._busy[stage.name],
+                "queue_depth": self._queues[index].qsize() if self._queues else 0,
+                "queue_depth_by_priority": self._queues[index].depth_by_priority() if self._queues else {}
+            }
+            for index, stage in enumerate(self.stages)
+        }
+
+
+class DocumentPipeline(StagedPipeline):
+    """The parse → extract → validate → render pipeline for traceability packages"""
+
+    def __init__(self, extractor, validator, html_generator, stage_executor: Optional[StageExecutor] = None):
+        """Wire the standard stages to the given components"""
+        self.extractor = extractor
+        self.validator = validator
+        self.html_generator = html_generator
+        self.stage_executor = stage_executor or StageExecutor()
+        self.singleflight = SingleFlight()
+
+        super().__init__([
+            Stage("parse", "parsed", self._parse, PIPELINE_PARSE_WORKERS, STAGE_BUDGET_SHARES["parse"]),
+            Stage("extract", "extracted", self._extract, PIPELINE_EXTRACT_WORKERS, STAGE_BUDGET_SHARES["extract"]),
+            Stage("validate", "validated", self._validate, PIPELINE_VALIDATE_WORKERS, STAGE_BUDGET_SHARES["validate"],
+                  on_timeout=self._validate_timed_out),
+            Stage("render", "report_ready", self._render, PIPELINE_RENDER_WORKERS, STAGE_BUDGET_SHARES["render"])
+        ])
+
+    async def process(self, ctx: DocumentContext) -> DocumentContext:
+        """Run a document, sharing the work with an identical PDF that is already in flight"""
+        if ctx.markdown is not None:
+            return await super().process(ctx)
+        
+        is_leader = False
+        try:
+            if ctx.content_hash is None:
+                ctx.content_hash = await self.stage_executor.run("hash", file_sha256, ctx.pdf_path)
+            
+            is_leader = not self.singleflight.running(ctx.content_hash)
+            leader, shared = await self.singleflight.do(ctx.content_hash, lambda: self._process_shared(ctx))
+        finally:
+            # A leader's PDF may still be needed by shared work that outlives this caller;
+            # in that case the shared work removes it when it finishes
+            if not (is_leader and self.singleflight.running(ctx.content_hash)):
+                self._remove_pdf(ctx)
+        
+        if not shared:
+            return ctx
+        
+        # Same bytes: reuse the leader's analysis and only render this document's own report
+        logger.info(f"Reusing in-flight analysis of {leader.filename} for {ctx.filename}")
+        ctx.timed_out_stages = list(leader.timed_out_stages)
+        if leader.error is not None:
+            ctx.error = leader.error
+            return ctx
+        
+        ctx.markdown = leader.markdown
+        ctx.page_selection = leader.page_selection
+        ctx.certificates = leader.certificates
+        ctx.first_certificate_seconds = leader.first_certificate_seconds
+        ctx.entity_checks = leader.entity_checks
+        if ctx.on_certificate:
+            for cert in ctx.certificates:
+                self._announce_certificate(ctx, cert, self.validator.check_certificate_entities(asdict(cert)))
+        ctx.target_cert = leader.target_cert
+        ctx.traceability = leader.traceability
+        for stage in self.stages[:-1]:
+            ctx.stage_timings[stage.name] = 0.0
+            if ctx.on_stage:
+                ctx.on_stage(stage.event, 0.0)
+        
+        render_start = time.monotonic()
+        try:
+            await self._render(ctx)
+        except Exception as e:
+            logger.error(f"Stage 'render' failed for {ctx.filename}: {str(e)}")
+            ctx.error = e
+            return ctx
+        seconds = round(time.monotonic() - render_start, 2)
+        ctx.stage_timings["render"] = seconds
+        if ctx.on_stage:
+            ctx.on_stage("report_ready", seconds)
+        return ctx
+    
+    async def _process_shared(self, ctx: DocumentContext) -> DocumentContext:
+        """Run all stages for the leader of a content hash"""
+        try:
+            return await super().process(ctx)
+        finally:
+            self._remove_pdf(ctx)
+    
+    @staticmethod
+    def _remove_pdf(ctx: DocumentContext):
+        """Delete a temporary upload once no stage needs it"""
+        if ctx.remove_pdf and ctx.pdf_path and os.path.exists(ctx.pdf_path):
+            os.remove(ctx.pdf_path)
+    
+    async def _parse(self, ctx: DocumentContext):
+        """Step 1: Parse PDF to markdown (skipped when markdown is supplied)"""
+        if ctx.markdown is None:
+            ctx.markdown = await parse_document_cached_async(ctx.pdf_path, ctx.content_hash)
+
+        if not ctx.markdown or not ctx.markdown.strip():
+            raise Exception("Failed to extract content from PDF")
+
+    async def _extract(self, ctx: DocumentContext):
+        """Step 2: Extract certificates and pick the one to report on"""
+        started = time.monotonic()
+        # Recurring vendor layouts are read with a learned template and skip the LLM
+        templated = await self.stage_executor.run("template", self.extractor.extract_with_template, ctx.markdown, ctx.filename)
+        if templated:
+            ctx.first_certificate_seconds = round(time.monotonic() - started, 2)
+            for cert in templated:
+                self._add_certificate(ctx, cert)
+        else:
+            # Only pages relevant to extraction go into the prompt
+            ctx.page_selection = select_relevant_pages(ctx.markdown)
+            if ctx.page_selection.tokens_saved:
+                logger.info(f"Extraction prompt for {ctx.filename}: {len(ctx.page_selection.pages_kept)}/{ctx.page_selection.pages_total} pages, ~{ctx.page_selection.tokens_saved} tokens saved")
+            # Certificates stream in one by one; per-certificate work starts before the response is finished
+            async for cert in self.extractor.astream_certificates_from_text(ctx.page_selection.text, ctx.filename):
+                if ctx.first_certificate_seconds is None:
+                    ctx.first_certificate_seconds = round(time.monotonic() - started, 2)
+                self._add_certificate(ctx, cert)
+            await self.stage_executor.run("template", self.extractor.learn_layout, ctx.markdown, ctx.certificates, ctx.filename)
+
+        if not ctx.certificates:
+            raise Exception("No certificates found in document")
+
+        # Prefer the certificate sold to SKYLINK, fall back to the first one
+        ctx.target_cert = next(
+            (cert for cert in ctx.certificates if cert.buyer_name and "skylink" in cert.buyer_name.lower()),
+            ctx.certificates[0]
+        )
+
+    def _add_certificate(self, ctx: DocumentContext, cert):
+        """Keep one extracted certificate, check its companies, probe the validation cache and announce it"""
+        ctx.certificates.append(cert)
+        checks = self.validator.check_certificate_entities(asdict(cert))
+        ctx.entity_checks.update(checks)
+        # One probe at a time; a running probe picks up certificates that arrive meanwhile
+        if ctx.validation_probe is None or ctx.validation_probe.done():
+            ctx.validation_probe = asyncio.create_task(self._probe_validation_cache(ctx))
+        self._announce_certificate(ctx, cert, checks)
+
+    async def _probe_validation_cache(self, ctx: DocumentContext) -> Tuple[int, Optional[str]]:
+        """Look up the validation response for the certificates received so far until it covers all of them"""
+        covered, cached_text = 0, None
+        try:
+            while covered < len(ctx.certificates):
+                covered = len(ctx.certificates)
+                cached_text = await self.validator.aprobe_validation_cache([asdict(cert) for cert in ctx.certificates[:covered]])
+        except Exception as e:
+            logger.warning(f"Validation cache probe failed for {ctx.filename}: {str(e)}")
+            return 0, None
+        return covered, cached_text
+
+    def _announce_certificate(self, ctx: DocumentContext, cert, entity_checks: Dict[str, Dict[str, Any]]):
+        """Pass one certificate and the registry status of its companies to the caller"""
+        if ctx.on_certificate:
+            ctx.on_certificate({"document_id": ctx.document_id, "filename": ctx.filename,
+                                "certificate": asdict(cert), "entity_checks": entity_checks})
+
+    async def _validate(self, ctx: DocumentContext):
+        """Step 3: Validate traceability"""
+        certificates_dict = [asdict(cert) for cert in ctx.certificates]
+        probed, probed_text = False, None
+        if ctx.validation_probe is not None:
+            covered, probed_text = await ctx.validation_probe
+            probed = covered == len(ctx.certificates)
+        ctx.traceability = await self.validator.avalidate_source_traceability(
+            certificates_dict, ctx.filename, probed=probed, probed_text=probed_text if probed else None)
+
+    def _validate_timed_out(self, ctx: DocumentContext, seconds: float):
+        """Still report the extracted certificate, marked as not validated"""
+        ctx.traceability = self.validator.unvalidated_chain(f"Traceability validation timed out after {seconds:.0f}s")
+
+    async def _render(self, ctx: DocumentContext):
+        """Step 4: Build the summary and write the HTML report if a path was requested"""
+        target_cert = ctx.target_cert
+        ctx.summary_data = {
+            "cert_type": target_cert.certificate_type,
+            "part_number": target_cert.part_number,
+            "serial_number": target_cert.serial_number,
+            "description": target_cert.description,
+            "condition_code": target_cert.condition_code,
+            "quantity": target_cert.quantity,
+            "traceability_type": ctx.traceability.final_source.source_type,
+            "traceability_name": ctx.traceability.final_source.source_name,
+            "validation_notes": ctx.traceability.validation_notes,
+            "document_name": ctx.filename
+        }
+
+        if ctx.report_path:
+            await self.stage_executor.run("render", self._write_report, ctx.summary_data, ctx.filename, ctx.report_path)
+
+    def _write_report(self, summary_data: Dict[str, Any], filename: str, report_path: str):
+        """Generate and save the HTML report (runs on the stage executor)"""
+        html_content = self.html_generator.generate_html(summary_data, filename)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
@@ -173,18 +173,23 @@ class FileUploadManager {
         this.setProcessingState(processButton, statusDiv, true);
 
         try {
-            const response = await fetch('/process-pdf-batch', {
+            const response = await fetch('/process-pdf-stream', {
                 method: 'POST',
                 body: formData
             });
 
-            const result = await response.json();
+            if (!response.ok || !response.body) {
+                const error = await response.json().catch(() => ({}));
+                throw new Error(error.detail || `HTTP ${response.status}`);
+            }
+
+            const result = await this.readProgressStream(response);
 
-            if (result.success) {
+            if (result && result.success) {
                 this.displaySuccess(statusDiv, result);
                 this.clearSelectedFiles();
             } else {
-                this.displayError(statusDiv, result.message);
+                this.displayError(statusDiv, 'Processing stream ended before the batch completed');
             }
         } catch (error) {
             this.displayError(statusDiv, `Connection Error: ${error.message}`);
@@ -193,6 +198,70 @@ class FileUploadManager {
         }
     }
 
+    async readProgressStream(response) {
+        // Parse the Server-Sent Events stream and update per-file progress as events arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let batchResult = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const messages = buffer.split('\n\n');
+            buffer = messages.pop();
+
+            messages.forEach(message => {
+                let event = 'message';
+                let data = '';
+                message.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                });
+                if (!data) return;
+
+                const payload = JSON.parse(data);
+                if (event === 'batch_complete') {
+                    batchResult = payload;
+                } else {
+                    this.updateFileProgress(event, payload);
+                }
+            });
+        }
+
+        return batchResult;
+    }
+
+    updateFileProgress(event, payload) {
+        const progressList = document.getElementById('fileProgress');
+        if (!progressList || !payload.filename) return;
+
+        const stageLabels = {
+            parsed: '📄 Parsed',
+            extracted: '🔍 Certificates extracted',
+            validated: '✅ Traceability validated',
+            report_ready: '📊 Report ready'
+        };
+
+        let item = Array.from(progressList.children).find(li => li.dataset.filename === payload.filename);
+        if (!item) {
+            item = document.createElement('li');
+            item.dataset.filename = payload.filename;
+            item.style.margin = '6px 0';
+            progressList.appendChild(item);
+        }
+
+        if (event === 'file_complete') {
+            item.innerHTML = payload.success
+                ? `<strong>${payload.filename}</strong> — ${payload.compliance_status || 'Done'} (${payload.processing_time}s) <a href="${payload.html_report_url}" target="_blank">View Report</a>`
+                : `<strong>${payload.filename}</strong> — ❌ ${payload.message}`;
+        } else if (stageLabels[event]) {
+            item.innerHTML = `<strong>${payload.filename}</strong> — ${stageLabels[event]} (${payload.seconds}s)`;
+        }
+    }
+
     setProcessingState(processButton, statusDiv, isProcessing) {
         if (isProcessing) {
             processButton.disabled = true;
@@ -202,10 +271,11 @@ class FileUploadManager {
             statusDiv.className = 'processing';
             statusDiv.innerHTML = `
                 <h3>🔄 Processing ${this.selectedFiles.length} Document${this.selectedFiles.length > 1 ? 's' : ''}</h3>
-                <p>${this.selectedFiles.length > 1 ? 'Processing files in parallel. This may take several minutes...' : `Analyzing ${this.selectedFiles[0].name}...`}</p>
+                <p>${this.selectedFiles.length > 1 ? 'Processing files in parallel. Results appear below as each file finishes...' : `Analyzing ${this.selectedFiles[0].name}...`}</p>
                 <div class="progress-bar">
                     <div class="progress-bar-fill"></div>
                 </div>
+                <ul id="fileProgress" style="list-style: none; text-align: left; margin-top: 15px;"></ul>
             `;
         } else {
             processButton.textContent = '🚀 Process Documents';
@@ -0,0 +1,140 @@
+"""
+Priority Scheduler
+Weighted fair queueing across the interactive, batch and background
+classes. Each waiting item gets a virtual finish tag of
+max(virtual time, its class's last tag) + 1/weight, and the smallest tag
+is served first. A fresh interactive upload therefore lands ahead of a
+long batch backlog, while batch and background work still progress in
+proportion to their weights.
+"""
+
+import os
+import heapq
+import asyncio
+import itertools
+import contextvars
+from typing import Any, Dict, List, Tuple
+
+# Priority classes
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKGROUND = "background"
+
+# Relative share of upstream capacity per class when all classes are busy
+PRIORITY_WEIGHTS = {
+    INTERACTIVE: float(os.getenv("PRIORITY_WEIGHT_INTERACTIVE", "8")),
+    BATCH: float(os.getenv("PRIORITY_WEIGHT_BATCH", "2")),
+    BACKGROUND: float(os.getenv("PRIORITY_WEIGHT_BACKGROUND", "1"))
+}
+
+# Priority of the document a coroutine is working on; stage tasks inherit it
+current_priority: contextvars.ContextVar = contextvars.ContextVar("current_priority", default=BATCH)
+
+
+class FairTagger:
+    """Hands out weighted-fair-queueing finish tags per priority class"""
+
+    def __init__(self, weights: Dict[str, float] = PRIORITY_WEIGHTS):
+        """Start with virtual time at zero"""
+        self.weights = weights
+        self._virtual_time = 0.0
+        self._last_tag = {priority: 0.0 for priority in weights}
+        self._sequence = itertools.count()
+
+    def tag(self, priority: str) -> Tuple[float, int]:
+        """Return the (finish tag, tie-breaker) for a new item of this class"""
+        weight = self.weights.get(priority, self.weights[BATCH])
+        start = max(self._virtual_time, self._last_tag.get(priority, 0.0))
+        finish = start + 1.0 / weight
+        self._last_tag[priority] = finish
+        return finish, next(self._sequence)
+
+    def served(self, tag: Tuple[float, int]):
+        """Advance virtual time to the tag of the item just served"""
+        self._virtual_time = max(self._virtual_time, tag[0])
+
+
+class WeightedFairQueue:
+    """asyncio.Queue-like queue that serves items in weighted-fair order across priority classes"""
+
+    def __init__(self, maxsize: int = 0, weights: Dict[str, float] = PRIORITY_WEIGHTS):
+        """Bounded when maxsize > 0; blocked producers are also admitted in fair order"""
+        self.maxsize = maxsize
+        self._tagger = FairTagger(weights)
+        self._items: List[Tuple[Tuple[float, int], str, Any]] = []
+        self._getters: List[asyncio.Future] = []
+        self._putters: List[Tuple[Tuple[float, int], asyncio.Future]] = []
+        # Slots handed to woken producers that have not pushed their item yet
+        self._reserved = 0
+        self._depth = {priority: 0 for priority in weights}
+
+    def qsize(self) -> int:
+        """Number of queued items"""
+        return len(self._items)
+
+    def depth_by_priority(self) -> Dict[str, int]:
+        """Number of queued items per priority class"""
+        return dict(self._depth)
+
+    def full(self) -> bool:
+        """True when producers have to wait"""
+        return self.maxsize > 0 and len(self._items) + self._reserved >= self.maxsize
+
+    async def put(self, item: Any, priority: str = BATCH):
+        """Queue an item, waiting in fair order while the queue is full"""
+        tag = self._tagger.tag(priority)
+        if self.full():
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._putters, (tag, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Hand a slot we were given but can no longer use to the next producer
+                if waiter.done() and not waiter.cancelled():
+                    self._reserved -= 1
+                    self._wake_putter()
+                raise
+            self._reserved -= 1
+
+        heapq.heappush(self._items, (tag, priority, item))
+        self._depth[priority] = self._depth.get(priority, 0) + 1
+        self._wake_getter()
+
+    async def get(self) -> Any:
+        """Remove and return the item with the smallest finish tag"""
+        while not self._items:
+            waiter = asyncio.get_running_loop().create_future()
+            self._getters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._getters:
+                    self._getters.remove(waiter)
+                elif self._items:
+                    self._wake_getter()
+                raise
+
+        tag, priority, item = heapq.heappop(self._items)
+        self._depth[priority] -= 1
+        self._tagger.served(tag)
+        self._wake_putter()
+        return item
+
+    def task_done(self):
+        """Kept for asyncio.Queue compatibility"""
+
+    def _wake_getter(self):
+        """Wake one waiting consumer"""
+        while self._getters:
+            waiter = self._getters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _wake_putter(self):
+        """Admit the waiting producer with the smallest tag if there is room"""
+        while self._putters and not self.full():
+            _, waiter = heapq.heappop(self._putters)
+            if not waiter.done():
+                self._reserved += 1
+                waiter.set_result(None)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+FastAPI Aviation Traceability PDF Processor Production Launcher
+Runs the app in several uvicorn worker processes (uvloop + httptools).
+Workers share the parse and LLM caches and the job store on local disk,
+warm their clients before taking traffic, and drain in-flight requests
+and job files on SIGTERM.
+"""
+
+import os
+import sys
+import importlib.util
+from pathlib import Path
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+# Number of server processes (default: one per CPU core)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# How long a stopping worker waits for open requests before closing them
+GRACEFUL_SHUTDOWN_SECONDS = int(os.getenv("GRACEFUL_SHUTDOWN_SECONDS", "30"))
+
+
+def share_between_workers(workers: int):
+    """Point every worker at the same on-disk state and split process-wide budgets between them"""
+    # Absolute paths so all workers open the same SQLite caches and job store
+    os.environ["CACHE_DIR"] = os.path.abspath(os.getenv("CACHE_DIR", ".cache"))
+    os.environ["JOBS_DIR"] = os.path.abspath(os.getenv("JOBS_DIR", "jobs"))
+
+    # Each worker enforces its own token bucket, so each gets a share of the account limit
+    tpm_limit = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+    if tpm_limit > 0:
+        os.environ["OPENAI_TPM_LIMIT"] = str(max(1, tpm_limit // workers))
+
+    # Files left running by the previous server are re-queued once here, before any
+    # worker starts; workers then only pick up queued files
+    from jobs import JobStore
+    requeued = JobStore(os.path.join(os.environ["JOBS_DIR"], "jobs.sqlite3")).requeue_running()
+    if requeued:
+        print(f"🔁 Re-queued {requeued} interrupted job files")
+    os.environ["JOBS_REQUEUE_ON_START"] = "0"
+
+
+def main():
+    # Add current directory to Python path
+    current_dir = Path(__file__).parent.absolute()
+    sys.path.insert(0, str(current_dir))
+
+    # Check for required environment variables
+    missing_vars = [var for var in ("LLAMA_CLOUD_API_KEY", "OPENAI_API_KEY") if not os.getenv(var)]
+    if missing_vars:
+        print("❌ Missing required environment variables:")
+        for var in missing_vars:
+            print(f"   - {var}")
+        print("\nPlease set these variables in your .env file or environment.")
+        sys.exit(1)
+
+    workers = max(1, WEB_WORKERS)
+    share_between_workers(workers)
+
+    # uvloop does not support Windows; fall back to the default loop there
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "auto"
+    http = "httptools" if importlib.util.find_spec("httptools") else "auto"
+
+    print("🚀 Starting Aviation Traceability PDF Processor (production)")
+    print(f"   Workers: {workers} | Loop: {loop} | HTTP: {http} | http://{HOST}:{PORT}")
+
+    uvicorn.run(
+        "fastapi_pdf_processor:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_SECONDS,
+        log_level="info"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Single-Flight
+Coalesces concurrent calls that share a key: the first caller starts the
+work, later callers with the same key wait for that same result instead
+of repeating it. Entries are dropped as soon as the work finishes, so
+this deduplicates in-flight work only (caching is handled elsewhere).
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Share one in-flight computation between all concurrent callers of a key"""
+
+    def __init__(self):
+        """Start with nothing in flight"""
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run func once per key; returns (result, shared) where shared is True for later arrivals"""
+        self.calls += 1
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+            logger.info(f"Attaching to in-flight work for {key[:16]}")
+        else:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            # One caller giving up must not cancel the work the others wait on
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if self._waiters.get(key) == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def running(self, key: str) -> bool:
+        """True while work for key is in flight"""
+        task = self._tasks.get(key)
+        return task is not None and not task.done()
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Drop a finished computation so the next call starts fresh"""
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counts and how many were served by another caller's work"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._tasks)
+        }
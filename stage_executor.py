@@ -0,0 +1,106 @@
+"""
+Stage Executor
+Runs the blocking pipeline stages (PDF parsing, certificate extraction,
+traceability validation, report writing) on a bounded thread pool so the
+FastAPI event loop stays responsive while documents are being processed
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Default pool size, overridable through the environment
+DEFAULT_STAGE_WORKERS = int(os.getenv("STAGE_EXECUTOR_WORKERS", "8"))
+
+
+class StageExecutor:
+    """Bounded thread pool for blocking pipeline stages with queue depth reporting"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """Initialize the executor with a fixed number of worker threads"""
+        self.max_workers = max_workers or DEFAULT_STAGE_WORKERS
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="pipeline-stage"
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._stage_stats: Dict[str, Dict[str, float]] = {}
+
+    async def run(self, stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking callable on the pool and await its result"""
+        with self._lock:
+            self._queued += 1
+
+        def _call():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+
+            start_time = time.monotonic()
+            succeeded = False
+            try:
+                result = func(*args, **kwargs)
+                succeeded = True
+                return result
+            finally:
+                self._record(stage, time.monotonic() - start_time, succeeded)
+
+        future = self._executor.submit(_call)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A job that never started must not be counted as queued forever
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def _record(self, stage: str, elapsed: float, succeeded: bool):
+        """Update counters once a stage call finishes"""
+        with self._lock:
+            self._running -= 1
+            if succeeded:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+            stats = self._stage_stats.setdefault(stage, {"calls": 0, "failures": 0, "total_seconds": 0.0})
+            stats["calls"] += 1
+            stats["total_seconds"] += elapsed
+            if not succeeded:
+                stats["failures"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return a snapshot of pool utilisation and per-stage timings"""
+        with self._lock:
+            stages = {
+                name: {
+                    "calls": int(values["calls"]),
+                    "failures": int(values["failures"]),
+                    "avg_seconds": round(values["total_seconds"] / values["calls"], 3) if values["calls"] else 0.0
+                }
+                for name, values in self._stage_stats.items()
+            }
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "stages": stages
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and release the worker threads"""
+        logger.info("Shutting down stage executor")
+        self._executor.shutdown(wait=wait)
@@ -1,5 +1,11 @@
 import json
 from dataclasses import asdict
+
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+
 from certificate_extractor import CertificateExtractor
 from traceability_source_validator import TraceabilitySourceValidator
 
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from adaptive_limiter import AdaptiveLimiter, is_overload_error
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+async def call(limiter, seconds, call_class="default", error=None):
+    async with limiter.slot(call_class):
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+
+
+def test_overload_errors():
+    assert is_overload_error(RateLimited())
+    assert is_overload_error(asyncio.TimeoutError())
+    assert not is_overload_error(BadRequest())
+
+
+def test_limit_grows_while_latency_holds():
+    # A wide latency tolerance so timer jitter on millisecond calls cannot trigger a decrease
+    limiter = AdaptiveLimiter("test", initial=2, max_limit=8, latency_tolerance=100.0)
+
+    async def run():
+        for _ in range(20):
+            await asyncio.gather(*(call(limiter, 0.001) for _ in range(limiter.limit)))
+
+    asyncio.run(run())
+    assert limiter.limit > 2
+    assert limiter.decreases == 0
+
+
+def test_limit_halves_on_429():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=16, backoff=0.5)
+
+    async def run():
+        with pytest.raises(RateLimited):
+            await call(limiter, 0, error=RateLimited())
+
+    asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.overloads == 1
+
+
+def test_other_errors_do_not_change_the_limit():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=16)
+
+    async def run():
+        with pytest.raises(BadRequest):
+            await call(limiter, 0, error=BadRequest())
+
+    asyncio.run(run())
+    assert limiter.limit == 8
+
+
+def test_slower_call_class_has_its_own_baseline():
+    limiter = AdaptiveLimiter("test", initial=4, max_limit=32, latency_tolerance=3.0)
+
+    async def run():
+        for _ in range(10):
+            await call(limiter, 0.004, "max_tokens=500")
+        # Ten times slower, but normal for this class
+        for _ in range(5):
+            await call(limiter, 0.08, "max_tokens=8000")
+
+    asyncio.run(run())
+    assert limiter.decreases == 0
+    assert set(limiter.stats()["baseline_seconds"]) == {"max_tokens=500", "max_tokens=8000"}
+
+
+def test_rising_latency_within_a_class_shrinks_the_limit():
+    limiter = AdaptiveLimiter("test", initial=8, max_limit=32, latency_tolerance=2.0)
+
+    async def run():
+        for _ in range(10):
+            await call(limiter, 0.002, "max_tokens=6000")
+        for _ in range(5):
+            await call(limiter, 0.05, "max_tokens=6000")
+
+    asyncio.run(run())
+    assert limiter.decreases >= 1
+
+
+def test_waiters_get_slots_as_they_free_up():
+    limiter = AdaptiveLimiter("test", initial=1, max_limit=1)
+    running = {"now": 0, "peak": 0}
+
+    async def tracked():
+        async with limiter.slot():
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.001)
+            running["now"] -= 1
+
+    async def run():
+        await asyncio.gather(*(tracked() for _ in range(5)))
+
+    asyncio.run(run())
+    assert running["peak"] == 1
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,62 @@
+from certificate_extractor import CertificateInfo
+from chunked_extraction import (certificate_key, group_pages, merge_certificates, page_range, same_certificate,
+                                split_package)
+
+
+def pages(count):
+    return [(number, f"START OF PAGE: {number}\ntext\nEND OF PAGE: {number}\n") for number in range(1, count + 1)]
+
+
+def test_groups_overlap_and_cover_every_page():
+    groups = group_pages(pages(10), size=4, overlap=1)
+    assert [page_range(group) for group in groups] == ["1-4", "4-7", "7-10"]
+    assert group_pages(pages(1), size=4, overlap=1) == [pages(1)]
+
+
+def test_split_package_keeps_text_before_the_first_page():
+    markdown = "Cover note\n" + "".join(block for _, block in pages(2))
+    split = split_package(markdown)
+    assert [number for number, _ in split] == [1, 2]
+    assert split[0][1].startswith("Cover note")
+
+
+def test_duplicate_from_an_overlapping_page_is_merged_field_by_field():
+    first = CertificateInfo("8130-3", "PN-1", "SN-1", seller_name="A&E Parts, Inc.")
+    second = CertificateInfo("8130-3", "pn 1", "SN-1", description="VALVE", seller_name="A&E PARTS INC")
+    merged = merge_certificates([[first], [second]])
+    assert len(merged) == 1
+    assert merged[0].description == "VALVE"
+
+
+def test_partial_sighting_at_an_overlap_page_is_merged():
+    partial = CertificateInfo("8130-3", "PN-1", "SN-1", seller_name="A&E")
+    full = CertificateInfo("8130-3", "PN-1", "SN-1", seller_name="A&E", traceability_source="ENDEAVOR AIR",
+                           certification_date="5/6/2025", quantity="1")
+    merged = merge_certificates([[partial], [full]])
+    assert len(merged) == 1
+    assert (merged[0].traceability_source, merged[0].certification_date) == ("ENDEAVOR AIR", "5/6/2025")
+
+
+def test_partial_serial_less_sighting_merges_with_its_lot():
+    partial = CertificateInfo("COC", "AN960-416", None, seller_name="A&E", quantity="5")
+    full = CertificateInfo("COC", "AN960-416", None, seller_name="A&E", quantity="5", traceability_source="LOT 1")
+    merged = merge_certificates([[partial], [full]])
+    assert len(merged) == 1
+    assert merged[0].traceability_source == "LOT 1"
+
+
+def test_serial_less_lots_of_one_part_stay_apart():
+    lot_1 = CertificateInfo("COC", "AN960-416", None, quantity="5", seller_name="A&E", traceability_source="LOT 1")
+    lot_2 = CertificateInfo("COC", "AN960-416", None, quantity="10", seller_name="A&E", traceability_source="LOT 2")
+    assert certificate_key(lot_1) == certificate_key(lot_2)
+    assert not same_certificate(lot_1, lot_2)
+    # A later sighting of the second lot with fewer fields still finds its own lot
+    partial_lot_2 = CertificateInfo("COC", "AN960-416", None, quantity="10", seller_name="A&E")
+    merged = merge_certificates([[lot_1, lot_2], [partial_lot_2]])
+    assert [cert.quantity for cert in merged] == ["5", "10"]
+
+
+def test_null_like_values_match_missing_ones():
+    first = CertificateInfo("COC", "PN-1", "N/A", seller_name="A&E")
+    second = CertificateInfo("COC", "PN-1", None, seller_name="A&E")
+    assert certificate_key(first) == certificate_key(second)
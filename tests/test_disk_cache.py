@@ -0,0 +1,76 @@
+import asyncio
+import random
+import sqlite3
+
+from disk_cache import DiskCache
+
+
+def stored_size(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries").fetchone()
+
+
+def test_get_set_and_counters(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), 1024)
+    assert cache.get("missing") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["size_bytes"]) == (1, 1, 1, 5)
+
+
+def test_uncounted_lookup_leaves_counters_alone(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), 1024)
+    cache.set("key", "value")
+    assert cache.get("key", count=False) == "value"
+    assert cache.get("other", count=False) is None
+    assert (cache.hits, cache.misses) == (0, 0)
+    cache.count_lookup(True)
+    assert cache.hits == 1
+
+
+def test_running_size_matches_the_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskCache(path, 2000)
+    rng = random.Random(7)
+    for _ in range(300):
+        key = f"k{rng.randrange(40)}"
+        if rng.random() < 0.2:
+            cache.delete(key)
+        else:
+            cache.set(key, "x" * rng.randrange(1, 200), tag=rng.choice(["a", "b"]))
+    cache.delete_tag("a")
+    total, entries = stored_size(path)
+    stats = cache.stats()
+    assert (stats["size_bytes"], stats["entries"]) == (total, entries)
+    assert total <= 2000
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), 30)
+    cache.set("old", "x" * 10)
+    cache.set("used", "x" * 10)
+    cache.get("used")
+    cache.set("new", "x" * 15)
+    assert cache.get("old") is None
+    assert cache.get("used") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_counter_is_initialized_for_an_existing_database(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                     "created_at REAL NOT NULL, last_access REAL NOT NULL, tag TEXT)")
+        conn.execute("INSERT INTO entries VALUES ('a', 'abc', 3, 0, 0, NULL)")
+    assert DiskCache(path, 1024).stats()["size_bytes"] == 3
+
+
+def test_async_access(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), 1024)
+
+    async def run():
+        await cache.aset("key", "value", tag="t")
+        return await cache.aget("key")
+
+    assert asyncio.run(run()) == "value"
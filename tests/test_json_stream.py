@@ -0,0 +1,66 @@
+import json
+
+from json_stream import IncrementalJSONArrayParser
+
+CERTIFICATES = [
+    {"part_number": "295957-5A", "description": "GROMMET, NONMETALLIC", "quantity": "5"},
+    {"part_number": "AN960-10", "description": "WASHER \"FLAT\" [CRES] {1/4}", "serial_number": None},
+    {"part_number": "MS21042", "notes": ["LOT 7", {"trace": "A&E C OF C"}]},
+]
+
+
+def feed_in_pieces(text, size):
+    parser = IncrementalJSONArrayParser()
+    completed = []
+    for start in range(0, len(text), size):
+        completed.append(parser.feed(text[start:start + size]))
+    return parser, completed
+
+
+def test_elements_are_returned_as_soon_as_they_close():
+    text = json.dumps(CERTIFICATES)
+    parser, completed = feed_in_pieces(text, 1)
+    elements = [element for batch in completed for element in batch]
+    assert elements == CERTIFICATES
+    assert parser.complete
+    assert parser.elements == 3
+    # The first certificate is available before the text reaches the second one
+    first_at = next(i for i, batch in enumerate(completed) if batch)
+    assert first_at == len(json.dumps(CERTIFICATES[0]))
+
+
+def test_any_split_gives_the_same_elements():
+    text = json.dumps(CERTIFICATES, indent=2)
+    for size in (1, 2, 3, 7, 64, len(text)):
+        _, completed = feed_in_pieces(text, size)
+        assert [element for batch in completed for element in batch] == CERTIFICATES
+
+
+def test_markdown_fence_and_trailing_text_are_ignored():
+    text = "```json\n" + json.dumps(CERTIFICATES[:1]) + "\n```\nDone [not json]"
+    parser, completed = feed_in_pieces(text, 5)
+    assert [element for batch in completed for element in batch] == CERTIFICATES[:1]
+    assert parser.complete
+    assert parser.text == text
+
+
+def test_scalars_are_emitted_at_the_next_separator():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[1, "a,]b", tr') == [1, "a,]b"]
+    assert parser.feed("ue") == []
+    assert parser.feed(", null]") == [True, None]
+    assert parser.complete
+
+
+def test_truncated_response_keeps_completed_elements():
+    text = json.dumps(CERTIFICATES)
+    cut = text[:len(text) - 20]
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed(cut) == CERTIFICATES[:2]
+    assert not parser.complete
+
+
+def test_empty_array():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed("[ ]") == []
+    assert parser.complete
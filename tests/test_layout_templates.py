@@ -0,0 +1,132 @@
+import json
+import os
+
+import pytest
+
+from disk_cache import DiskCache
+from layout_templates import (LayoutTemplateStore, TEMPLATE_MIN_CONFIDENCE, apply_template, learn_template,
+                              parse_layout)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKING_SLIP = "8. PACKING SLIP WITH COC ON 1 DOC.md"
+
+
+@pytest.fixture(scope="module")
+def sample():
+    """The packing slip markdown and the certificate the LLM extracted from it"""
+    with open(os.path.join(ROOT, "markdowns", PACKING_SLIP), encoding="utf-8") as f:
+        markdown = f.read()
+    with open(os.path.join(ROOT, "certificate_extraction_results.json"), encoding="utf-8") as f:
+        certificates = json.load(f)["extraction_results"][PACKING_SLIP]
+    return markdown, certificates
+
+
+def variant(markdown, certificates, part_number, quantity):
+    """The same vendor layout for another part"""
+    document = markdown.replace("295957-5A", part_number).replace("| 5 | 0 |", f"| {quantity} | 0 |")
+    return document, [dict(certificates[0], part_number=part_number, quantity=quantity)]
+
+
+def test_learns_locators_from_the_packing_slip(sample):
+    markdown, certificates = sample
+    template = learn_template(markdown, certificates)
+    assert template is not None
+    locators = template["locators"]
+    assert locators["part_number"] == ["cell_first", "Part Number/Description"]
+    assert locators["quantity"] == ["cell", "Shipped"]
+    assert locators["traceability_source"] == ["row_label", "TRACE TO:"]
+    assert locators["seller_name"] == ["constant", "A&E Parts, Inc."]
+    # Empty on this slip; the manufacturer is never a vendor constant
+    assert locators["serial_number"] == ["absent"]
+    assert locators["manufacturer"] == ["absent"]
+    assert template["coverage"] >= TEMPLATE_MIN_CONFIDENCE
+
+
+def test_apply_reproduces_the_extraction(sample):
+    markdown, certificates = sample
+    template = learn_template(markdown, certificates)
+    found, confidence = apply_template(template, parse_layout(markdown))
+    assert confidence >= TEMPLATE_MIN_CONFIDENCE
+    assert len(found) == 1
+    for field in ("certificate_type", "part_number", "condition_code", "quantity", "seller_name",
+                  "certification_date", "traceability_source", "serial_number", "manufacturer"):
+        assert found[0][field] == certificates[0][field]
+
+
+def test_apply_reads_another_document_of_the_layout(sample):
+    markdown, certificates = sample
+    template = learn_template(markdown, certificates)
+    document, _ = variant(markdown, certificates, "AN960-416", "12")
+    found, confidence = apply_template(template, parse_layout(document))
+    assert confidence >= TEMPLATE_MIN_CONFIDENCE
+    assert (found[0]["part_number"], found[0]["quantity"]) == ("AN960-416", "12")
+
+
+def test_new_row_label_breaks_the_absence_of_a_field(sample):
+    markdown, certificates = sample
+    template = learn_template(markdown, certificates)
+    document = markdown.replace("LOT# 4677459\nTRACE TO:", "LOT# 4677459\nS/N: 12345\nTRACE TO:", 1)
+    _, confidence = apply_template(template, parse_layout(document))
+    assert confidence < TEMPLATE_MIN_CONFIDENCE
+
+
+def test_value_in_a_formerly_empty_cell_breaks_the_absence_of_a_field(sample):
+    markdown, certificates = sample
+    template = learn_template(markdown, certificates)
+    document = markdown.replace("| NS | | EA |", "| NS | 12.50 | EA |")
+    _, confidence = apply_template(template, parse_layout(document))
+    assert confidence < TEMPLATE_MIN_CONFIDENCE
+
+
+def test_unexplained_part_number_is_not_learned(sample):
+    markdown, certificates = sample
+    assert learn_template(markdown, [dict(certificates[0], part_number="NOT-ON-THE-SLIP")]) is None
+    assert learn_template(markdown, []) is None
+
+
+def test_store_uses_a_template_after_two_distinct_documents(sample, tmp_path):
+    markdown, certificates = sample
+    store = LayoutTemplateStore(DiskCache(str(tmp_path / "templates.sqlite3"), 1024 * 1024))
+    first, first_certificates = variant(markdown, certificates, "AN960-1", "10")
+    second, second_certificates = variant(markdown, certificates, "AN960-2", "20")
+    third, _ = variant(markdown, certificates, "AN960-3", "30")
+
+    assert store.match(first, "first") is None
+    store.learn(first, first_certificates, "first")
+    # The same document again does not confirm the template
+    store.learn(first, first_certificates, "first")
+    assert store.match(third, "third") is None
+
+    store.learn(second, second_certificates, "second")
+    found = store.match(third, "third")
+    assert found is not None
+    assert (found[0]["part_number"], found[0]["quantity"]) == ("AN960-3", "30")
+
+
+def test_coincidental_locator_is_replaced_by_the_next_documents(sample, tmp_path):
+    markdown, certificates = sample
+    store = LayoutTemplateStore(DiskCache(str(tmp_path / "templates.sqlite3"), 1024 * 1024))
+    # Quantity 1 is also the item number, so the first template reads quantity from the Item column
+    for part_number, quantity in (("AN960-1", "1"), ("AN960-2", "20"), ("AN960-3", "30")):
+        store.learn(*variant(markdown, certificates, part_number, quantity), part_number)
+    found = store.match(variant(markdown, certificates, "AN960-4", "40")[0], "AN960-4")
+    assert found is not None and found[0]["quantity"] == "40"
+
+
+def test_unlocated_traceability_source_is_not_learned(sample):
+    markdown, certificates = sample
+    # With no signature every other field is located, so coverage alone (11 of 12) would pass
+    unexplained = dict(certificates[0], traceability_source="ENDEAVOR AIR", authorized_signature=None)
+    assert learn_template(markdown, [unexplained]) is None
+
+
+def test_chain_field_missing_from_a_later_document_goes_to_the_llm(sample, tmp_path):
+    markdown, certificates = sample
+    certificates = [dict(certificates[0], authorized_signature=None)]
+    store = LayoutTemplateStore(DiskCache(str(tmp_path / "templates.sqlite3"), 1024 * 1024))
+    for part_number, quantity in (("AN960-1", "10"), ("AN960-2", "20")):
+        store.learn(*variant(markdown, certificates, part_number, quantity), part_number)
+    document, _ = variant(markdown, certificates, "AN960-3", "30")
+    assert store.match(document, "AN960-3") is not None
+    # The row no longer says where the part traces to; only one field of twelve is missing
+    assert store.match(document.replace("TRACE TO: A&E C OF C.", "TRACE TO:"), "AN960-3") is None
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("tenacity")
+
+from pipeline import StagedPipeline, Stage, DocumentContext
+
+
+def test_documents_pass_every_stage_in_order():
+    seen = []
+
+    def recorder(name):
+        async def step(ctx):
+            seen.append((ctx.document_id, name))
+        return step
+
+    async def run():
+        stages = [Stage(name, name, recorder(name), 2) for name in ("parse", "extract", "validate")]
+        pipeline = StagedPipeline(stages, queue_size=4)
+        contexts = await asyncio.gather(*(pipeline.process(DocumentContext(str(i), f"{i}.pdf")) for i in range(5)))
+        await pipeline.stop()
+        return contexts
+
+    contexts = asyncio.run(run())
+    assert all(ctx.error is None for ctx in contexts)
+    for i in range(5):
+        assert [name for document_id, name in seen if document_id == str(i)] == ["parse", "extract", "validate"]
+
+
+def test_stage_never_exceeds_its_worker_count():
+    async def run():
+        running = {"now": 0, "peak": 0}
+
+        async def slow(ctx):
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+
+        async def fast(ctx):
+            pass
+
+        pipeline = StagedPipeline([Stage("parse", "parsed", fast, 8), Stage("extract", "extracted", slow, 2)], queue_size=2)
+        await asyncio.gather(*(pipeline.process(DocumentContext(str(i), f"{i}.pdf")) for i in range(10)))
+        await pipeline.stop()
+        return running["peak"]
+
+    assert asyncio.run(run()) == 2
+
+
+def test_failed_stage_skips_the_rest():
+    async def run():
+        later = []
+
+        async def broken(ctx):
+            raise ValueError("bad pdf")
+
+        async def record(ctx):
+            later.append(ctx.document_id)
+
+        pipeline = StagedPipeline([Stage("parse", "parsed", broken, 1), Stage("extract", "extracted", record, 1)])
+        ctx = await pipeline.process(DocumentContext("1", "1.pdf"))
+        await pipeline.stop()
+        return ctx, later
+
+    ctx, later = asyncio.run(run())
+    assert isinstance(ctx.error, ValueError)
+    assert later == []
+
+
+def test_validation_cache_is_probed_while_certificates_stream_in(tmp_path, monkeypatch):
+    import json
+    from types import SimpleNamespace
+
+    import llm_cache
+    import traceability_source_validator
+    from disk_cache import DiskCache
+    from certificate_extractor import CertificateExtractor, CertificateInfo
+    from pipeline import DocumentPipeline
+
+    cache = llm_cache.LLMResponseCache(DiskCache(str(tmp_path / "llm_cache.sqlite3"), 1024 * 1024))
+    monkeypatch.setattr(llm_cache, "_llm_cache", cache)
+    llm_calls = []
+
+    async def fake_completion(client, request):
+        llm_calls.append(request)
+        answer = {"traceability_chain": [], "final_source": {"source_name": "ACME", "source_type": "OEM"},
+                  "is_complete": True, "validation_notes": []}
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(answer)))])
+
+    monkeypatch.setattr(traceability_source_validator, "acreate_chat_completion", fake_completion)
+
+    class StreamingExtractor(CertificateExtractor):
+        def extract_with_template(self, markdown, document_name):
+            return None
+
+        def learn_layout(self, markdown, certificates, document_name):
+            pass
+
+        async def astream_certificates_from_text(self, text, document_name):
+            for i in range(5):
+                await asyncio.sleep(0.01)
+                yield CertificateInfo("COC", "PN-1", f"S{i}", seller_name="Unknown Parts Co")
+
+    class LLMValidator(traceability_source_validator.TraceabilitySourceValidator):
+        async_client = None
+
+        def resolve_with_registry(self, certificates, document_name):
+            return None
+
+    async def run():
+        pipeline = DocumentPipeline(StreamingExtractor(), LLMValidator(), SimpleNamespace(generate_html=lambda data, path: ""))
+        contexts = []
+        for name in ("first.pdf", "second.pdf"):
+            contexts.append(await pipeline.process(DocumentContext(name, name, markdown="PN-1 for SKYLINK")))
+        await pipeline.stop()
+        return contexts
+
+    first, second = asyncio.run(run())
+    assert first.error is None and second.error is None
+    # The probe caught up with all five certificates and the second document's validation came from it
+    assert first.validation_probe.result() == (5, None)
+    covered, cached_text = second.validation_probe.result()
+    assert covered == 5 and cached_text is not None
+    assert len(llm_calls) == 1
+    # Probes are counted once per document, like the lookup they replace
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
@@ -0,0 +1,89 @@
+import asyncio
+
+from scheduler import BACKGROUND, BATCH, INTERACTIVE, FairTagger, WeightedFairQueue
+
+WEIGHTS = {INTERACTIVE: 8.0, BATCH: 2.0, BACKGROUND: 1.0}
+
+
+def test_tags_follow_class_weights():
+    tagger = FairTagger(WEIGHTS)
+    assert tagger.tag(INTERACTIVE)[0] == 1 / 8
+    assert tagger.tag(BATCH)[0] == 1 / 2
+    # Successive items of one class are spaced by 1 / weight
+    assert tagger.tag(BATCH)[0] == 1.0
+
+
+def test_unknown_priority_is_treated_as_batch():
+    tagger = FairTagger(WEIGHTS)
+    assert tagger.tag("something-else")[0] == 1 / 2
+
+
+def test_interactive_item_overtakes_batch_backlog():
+    async def run():
+        queue = WeightedFairQueue(weights=WEIGHTS)
+        for i in range(10):
+            await queue.put(f"batch-{i}", BATCH)
+        await queue.put("interactive", INTERACTIVE)
+        return [await queue.get() for _ in range(11)]
+
+    order = asyncio.run(run())
+    assert order.index("interactive") == 0
+    assert [item for item in order if item.startswith("batch")] == [f"batch-{i}" for i in range(10)]
+
+
+def test_classes_share_the_queue_by_weight():
+    async def run():
+        queue = WeightedFairQueue(weights=WEIGHTS)
+        for i in range(20):
+            await queue.put(INTERACTIVE, INTERACTIVE)
+            await queue.put(BATCH, BATCH)
+            await queue.put(BACKGROUND, BACKGROUND)
+        return [await queue.get() for _ in range(22)]
+
+    served = asyncio.run(run())
+    # Background is not starved, but gets the smallest share
+    assert served.count(BACKGROUND) >= 1
+    assert served.count(INTERACTIVE) > served.count(BATCH) > served.count(BACKGROUND)
+
+
+def test_depth_by_priority():
+    async def run():
+        queue = WeightedFairQueue(weights=WEIGHTS)
+        await queue.put("a", INTERACTIVE)
+        await queue.put("b", BATCH)
+        await queue.put("c", BATCH)
+        await queue.get()
+        return queue.qsize(), queue.depth_by_priority()
+
+    size, depth = asyncio.run(run())
+    assert size == 2
+    assert depth == {INTERACTIVE: 0, BATCH: 2, BACKGROUND: 0}
+
+
+def test_full_queue_admits_waiting_producers_in_fair_order():
+    async def run():
+        queue = WeightedFairQueue(maxsize=1, weights=WEIGHTS)
+        await queue.put("first", BATCH)
+        assert queue.full()
+        batch = asyncio.create_task(queue.put("batch", BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(queue.put("interactive", INTERACTIVE))
+        await asyncio.sleep(0)
+        order = [await queue.get() for _ in range(3)]
+        await asyncio.gather(batch, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["first", "interactive", "batch"]
+
+
+def test_cancelled_getter_does_not_lose_items():
+    async def run():
+        queue = WeightedFairQueue(weights=WEIGHTS)
+        waiting = asyncio.create_task(queue.get())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await queue.put("item", BATCH)
+        await asyncio.sleep(0)
+        return await asyncio.wait_for(queue.get(), 1)
+
+    assert asyncio.run(run()) == "item"
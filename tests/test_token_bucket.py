@@ -0,0 +1,60 @@
+import asyncio
+
+from scheduler import BATCH, INTERACTIVE, current_priority
+from token_bucket import TokenBucket, estimate_request_tokens, OPENAI_DEFAULT_COMPLETION_TOKENS
+
+
+def test_estimate_counts_prompt_and_completion_budget():
+    request = {"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 500}
+    assert estimate_request_tokens(request) >= 100 + 500
+    without_budget = {"messages": [{"role": "user", "content": "x" * 400}]}
+    assert estimate_request_tokens(without_budget) >= 100 + OPENAI_DEFAULT_COMPLETION_TOKENS
+
+
+def test_disabled_bucket_never_waits():
+    bucket = TokenBucket(0)
+    assert not bucket.enabled
+    assert bucket.reserve(10 ** 6) == 0.0
+    asyncio.run(bucket.aacquire(10 ** 6))
+
+
+def test_reservation_beyond_balance_waits_for_refill():
+    bucket = TokenBucket(6000)   # 100 tokens per second
+    assert bucket.reserve(6000) == 0.0
+    assert abs(bucket.reserve(300) - 3.0) < 0.1
+    assert bucket.stats()["waits"] == 1
+
+
+def test_settle_returns_unused_tokens():
+    bucket = TokenBucket(6000)
+    bucket.reserve(6000)
+    bucket.settle(6000, 1000)
+    assert 4990 <= bucket.stats()["available_tokens"] <= 5100
+    assert bucket.stats()["used_tokens"] == 1000
+
+
+def test_oversized_request_is_capped_at_capacity():
+    bucket = TokenBucket(6000)
+    assert bucket.reserve(10 ** 6) == 0.0
+    assert bucket.stats()["reserved_tokens"] == 6000
+
+
+def test_interactive_waiters_go_before_batch_waiters():
+    async def run():
+        bucket = TokenBucket(6000)
+        bucket.reserve(6000)
+        order = []
+
+        async def call(name, priority):
+            current_priority.set(priority)
+            await bucket.aacquire(20)
+            order.append(name)
+
+        # The batch call queues first, but the interactive one has the smaller fair-queueing tag
+        batch = asyncio.create_task(call("batch", BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call("interactive", INTERACTIVE))
+        await asyncio.gather(batch, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "batch"]
@@ -0,0 +1,133 @@
+import json
+import os
+
+import pytest
+
+from traceability_rules import EntityRegistry, final_source, normalize_entity, resolve_chain
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def status(source_type, regulated):
+    return {"is_faa_regulated": regulated, "source_type": source_type, "validation_notes": [f"{source_type} entity"]}
+
+
+REGISTRY = EntityRegistry({
+    "Applied Avionics, Inc.": status("OEM", True),
+    "Endeavor Air": status("121", True),
+    "B & W Aviation Corp": status("145", True),
+    "AvAir, LLC": status("PARTS_DISTRIBUTOR", False),
+    "Logistica Aeroespacial S.A. de C.V.": status("FRAUDULENT", False),
+})
+
+
+def certificate(**fields):
+    return dict({"part_number": "PN-1", "manufacturer": None, "traceability_source": None,
+                 "seller_name": None, "buyer_name": "Skylink, Inc."}, **fields)
+
+
+def test_normalize_entity_drops_punctuation_and_legal_form():
+    assert normalize_entity("Applied Avionics, Inc.") == ("APPLIED", "AVIONICS")
+    assert normalize_entity("B&W Aviation Corp") == normalize_entity("B & W AVIATION CORP.")
+    assert normalize_entity("Aventure Int'l Aviation Services") == ("AVENTURE", "INTERNATIONAL", "AVIATION", "SERVICES")
+
+
+def test_lookup_name_matches_spelling_variants():
+    assert REGISTRY.lookup_name("APPLIED AVIONICS INC")["source_type"] == "OEM"
+    assert REGISTRY.lookup_name("avair")["source_type"] == "PARTS_DISTRIBUTOR"
+
+
+def test_lookup_name_does_not_match_prefixes_or_longer_names():
+    assert REGISTRY.lookup_name("Applied") is None
+    assert REGISTRY.lookup_name("Endeavor Air Services Surplus") is None
+
+
+def test_scan_text_finds_registry_names_among_references():
+    found = REGISTRY.scan_text("PO 11421 - 145-Logistica Aeroespacial S.A. de C.V")
+    assert [name for name, _ in found] == ["Logistica Aeroespacial S.A. de C.V."]
+    assert REGISTRY.scan_text("ENDEAVOR AIR C OF C")[0][0] == "Endeavor Air"
+    assert REGISTRY.scan_text("Unknown Salvage Yard") is None
+
+
+def test_chain_from_regulated_source_resolves():
+    resolution = resolve_chain([certificate(traceability_source="ENDEAVOR AIR", seller_name="AvAir")], REGISTRY)
+    assert resolution.resolved
+    assert resolution.chains == [["Endeavor Air", "AvAir"]]
+    assert final_source(resolution).name == "Endeavor Air"
+
+
+def test_manufacturer_outranks_other_regulated_sources():
+    resolution = resolve_chain([certificate(manufacturer="Applied Avionics", traceability_source="Endeavor Air",
+                                            seller_name="AvAir")], REGISTRY)
+    assert final_source(resolution).source_type == "OEM"
+
+
+def test_fraudulent_entity_resolves_despite_gaps():
+    resolution = resolve_chain([certificate(traceability_source="PO 11421 - Logistica Aeroespacial",
+                                            seller_name="AvAir"),
+                                certificate(seller_name="B & W Aviation Corp")], REGISTRY)
+    assert resolution.resolved
+    assert any(entity.source_type == "FRAUDULENT" for entity in resolution.entities)
+
+
+def test_seller_only_chain_is_a_gap():
+    resolution = resolve_chain([certificate(seller_name="B & W Aviation Corp")], REGISTRY)
+    assert not resolution.resolved
+    assert resolution.reason.startswith("incomplete chain")
+    assert resolution.gaps == ["no manufacturer or traceability source names a company for PN-1"]
+
+
+def test_chain_starting_at_distributor_is_a_gap():
+    resolution = resolve_chain([certificate(traceability_source="AvAir", seller_name="Endeavor Air")], REGISTRY)
+    assert not resolution.resolved
+    assert "starts at AvAir" in resolution.reason
+
+
+@pytest.mark.parametrize("fields, reason", [
+    ({"seller_name": "Unknown Parts Co"}, "unknown entity: Unknown Parts Co"),
+    ({"traceability_source": "BizJet PO# P21576", "seller_name": "AvAir"}, "unreadable traceability source: BizJet PO# P21576"),
+    ({"traceability_source": "AvAir C of C", "seller_name": "AvAir"}, "no regulated source"),
+    ({}, "no entities"),
+])
+def test_unresolved_chains_report_why(fields, reason):
+    resolution = resolve_chain([certificate(**fields)], REGISTRY)
+    assert not resolution.resolved
+    assert resolution.reason == reason
+
+
+def test_customer_as_buyer_is_not_part_of_the_chain():
+    resolution = resolve_chain([certificate(traceability_source="Endeavor Air", seller_name="AvAir",
+                                            buyer_name="SKYLINK, INC.")], REGISTRY)
+    assert resolution.resolved
+    assert all(entity.role != "buyer_name" for entity in resolution.entities)
+
+
+def test_validator_registry_on_bundled_results():
+    from traceability_source_validator import TraceabilitySourceValidator
+
+    validator = TraceabilitySourceValidator()
+    with open(os.path.join(ROOT, "certificate_extraction_results.json"), encoding="utf-8") as f:
+        results = json.load(f)["extraction_results"]
+    outcomes = {name.split(".")[0]: resolve_chain(certificates, validator.entity_registry)
+                for name, certificates in results.items()}
+
+    # Example 1 names a fraudulent source, example 7 traces to a 121 carrier
+    assert outcomes["1"].resolved
+    assert outcomes["7"].resolved and final_source(outcomes["7"]).source_type == "121"
+    # Only a distributor is named, so the LLM decides
+    assert not outcomes["8"].resolved
+    # A company name that only starts like a registry name is not treated as that company
+    assert validator.validate_company_faa_status("Applied")["source_type"] == "UNREGULATED"
+
+
+def test_validator_builds_its_registry_without_calling_into_it():
+    from traceability_source_validator import TraceabilitySourceValidator
+
+    class RenamingValidator(TraceabilitySourceValidator):
+        """Looks every name up under a spelling no hard-coded list contains"""
+
+        def validate_company_faa_status(self, company_name):
+            return super().validate_company_faa_status(f"{company_name} Holdings")
+
+    validator = RenamingValidator()
+    assert validator.entity_registry.lookup_name("Endeavor Air") is not None
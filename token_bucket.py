@@ -0,0 +1,160 @@
+"""
+OpenAI Token Bucket
+Process-wide tokens-per-minute limiter shared by every OpenAI caller.
+Each request reserves its estimated prompt + completion tokens before it
+is sent; when the bucket is empty the call waits for the bucket to refill
+instead of failing with a rate-limit error. Reservations are settled
+against the real usage reported by the API once the response arrives.
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, List, Tuple
+
+from scheduler import FairTagger, current_priority
+
+logger = logging.getLogger(__name__)
+
+# Organization tokens-per-minute limit (0 disables the limiter)
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "30000"))
+# Completion budget assumed for requests that do not set max_tokens
+OPENAI_DEFAULT_COMPLETION_TOKENS = int(os.getenv("OPENAI_DEFAULT_COMPLETION_TOKENS", "4096"))
+
+# Rough characters-per-token ratio for English text and JSON
+CHARS_PER_TOKEN = 4
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """Estimate prompt plus completion tokens for a chat completion request"""
+    prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+    # Every message carries a few tokens of role/formatting overhead
+    prompt_tokens = prompt_chars // CHARS_PER_TOKEN + 4 * len(request.get("messages", []))
+    return prompt_tokens + (request.get("max_tokens") or OPENAI_DEFAULT_COMPLETION_TOKENS)
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously up to tokens_per_minute"""
+
+    def __init__(self, tokens_per_minute: int):
+        """Start with a full bucket"""
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        # Async callers queue in weighted-fair order of their priority class
+        self._tagger = FairTagger()
+        self._async_waiters: List[Tuple[Tuple[float, int], int]] = []
+        self.reserved_tokens = 0
+        self.used_tokens = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """False when no TPM limit is configured"""
+        return self.capacity > 0
+
+    def _refill(self):
+        """Add the tokens accumulated since the last update"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: int) -> float:
+        """Take tokens from the bucket and return how long the caller must wait before sending"""
+        if not self.enabled:
+            return 0.0
+        # A single request can never need more than a full bucket
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            # The bucket may go negative: later callers queue behind this reservation
+            self._tokens -= tokens
+            self.reserved_tokens += tokens
+            wait = max(0.0, -self._tokens / self.rate)
+            if wait > 0:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def settle(self, reserved: int, actual: int):
+        """Correct a reservation with the real token usage of the response"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + min(reserved, self.capacity) - actual)
+            self.used_tokens += actual
+
+    def acquire(self, tokens: int):
+        """Block the calling thread until tokens are available"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            logger.info(f"Waiting {wait:.1f}s for {tokens} OpenAI tokens (TPM limit {self.capacity})")
+            time.sleep(wait)
+
+    def _try_take(self, entry: Tuple[Tuple[float, int], int]) -> float:
+        """Take tokens if entry is first in line and they are available; otherwise return seconds to wait"""
+        tokens = entry[1]
+        with self._lock:
+            self._refill()
+            if self._async_waiters[0] is not entry:
+                # Someone with an earlier fair-queueing tag goes first
+                return -1.0
+            if self._tokens >= tokens:
+                heapq.heappop(self._async_waiters)
+                self._tokens -= tokens
+                self.reserved_tokens += tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    async def aacquire(self, tokens: int):
+        """Wait without blocking the event loop until tokens are available; higher priorities go first"""
+        if not self.enabled:
+            return
+        tokens = min(tokens, self.capacity)
+        entry = (self._tagger.tag(current_priority.get()), tokens)
+        heapq.heappush(self._async_waiters, entry)
+        started = time.monotonic()
+        try:
+            while True:
+                wait = self._try_take(entry)
+                if wait == 0.0:
+                    break
+                # The head sleeps until its tokens have refilled; others re-check regularly
+                await asyncio.sleep(wait if wait > 0 else 0.25)
+        except asyncio.CancelledError:
+            if entry in self._async_waiters:
+                self._async_waiters.remove(entry)
+                heapq.heapify(self._async_waiters)
+            raise
+        self._tagger.served(entry[0])
+
+        waited = time.monotonic() - started
+        if waited > 0.01:
+            self.waits += 1
+            self.wait_seconds += waited
+            logger.info(f"Waited {waited:.1f}s for {tokens} OpenAI tokens (TPM limit {self.capacity})")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the configured limit, current balance and wait counters"""
+        with self._lock:
+            self._refill()
+            return {
+                "tokens_per_minute": self.capacity,
+                "available_tokens": int(self._tokens),
+                "reserved_tokens": self.reserved_tokens,
+                "used_tokens": self.used_tokens,
+                "queued_calls": len(self._async_waiters),
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 1)
+            }
+
+
+# One bucket per process, shared by every OpenAI caller
+openai_token_bucket = TokenBucket(OPENAI_TPM_LIMIT)
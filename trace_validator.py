@@ -1,29 +1,22 @@
 import os
 import json
 import logging
-from openai import OpenAI
-from dotenv import load_dotenv
-from pathlib import Path
-
-# --- Configuration and Setup ---
 
-# Set up basic logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=".env")
 
-# Load environment variables from .env file
-load_dotenv(dotenv_path=".env")
+from llm_client import get_openai_client, create_chat_completion
+from pathlib import Path
 
-# Check for OpenAI API key
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("OPENAI_API_KEY not found. Please create a .env file and add your key (e.g., OPENAI_API_KEY=sk-...).")
+# --- Configuration and Setup ---
 
-# Initialize OpenAI client
-try:
-    client = OpenAI(api_key=api_key)
-except Exception as e:
-    logging.error(f"Failed to initialize OpenAI client: {e}")
-    raise
+def get_client():
+    """Return the shared OpenAI client, checking for an API key first"""
+    if not os.getenv("OPENAI_API_KEY"):
+        raise ValueError("OPENAI_API_KEY not found. Please create a .env file and add your key (e.g., OPENAI_API_KEY=sk-...).")
+    return get_openai_client()
 
 # --- File Loading ---
 
@@ -109,14 +102,14 @@ def analyze_traceability(package_name, cert_list, rules, docs):
     system_prompt, user_prompt = build_prompt(package_name, cert_list, rules, docs)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
+        response = create_chat_completion(get_client(), {
+            "model": "gpt-4-turbo-preview",
+            "messages": [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            response_format={"type": "json_object"}
-        )
+            "response_format": {"type": "json_object"}
+        })
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         logging.error(f"An error occurred during OpenAI API call for '{package_name}': {e}")
@@ -189,4 +182,6 @@ def main():
     print("")
 
 if __name__ == "__main__":
+    # Set up basic logging
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     main() 
\ No newline at end of file
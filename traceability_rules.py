@@ -0,0 +1,220 @@
+"""
+Registry Rules Engine for Traceability
+Resolves the companies named on extracted certificates (seller, manufacturer,
+intermediate buyers and the traceability source) against the validator's
+entity registry and decides the chain locally when every one of them is
+known. Chains with an unknown company, free-text origins the rules cannot
+read, or only distributors (whose origin the registry notes describe in
+prose) are left to the LLM validation.
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from page_filter import PAGE_FILTER_BUYER
+
+TRACE_FAST_PATH_ENABLED = os.getenv("TRACE_FAST_PATH_ENABLED", "1") == "1"
+
+# Regulated source types in order of preference
+SOURCE_RANK = ["OEM", "121", "129", "135", "145"]
+
+# Values the extractor uses for "not on the certificate"
+EMPTY_VALUES = {"", "NULL", "NONE", "N/A", "NA", "UNKNOWN", "NONE SPECIFIED", "NOT SPECIFIED"}
+
+# Legal-form suffixes dropped from the end of company names
+CORPORATE_SUFFIXES = [("S", "A", "DE", "C", "V"), ("SA", "DE", "CV"), ("INC",), ("LLC",), ("CORP",),
+                      ("CORPORATION",), ("CO",), ("LTD",), ("LIMITED",), ("COMPANY",)]
+ABBREVIATIONS = {"INTL": "INTERNATIONAL", "SERV": "SERVICES", "SVCS": "SERVICES", "MFG": "MANUFACTURING"}
+
+# Words in a traceability source that reference paperwork rather than name a company
+REFERENCE_WORDS = {"PO", "PURCHASE", "ORDER", "NO", "NUMBER", "NB", "NR", "LOT", "BATCH", "INVOICE", "INV",
+                   "REF", "REFERENCE", "SO", "WO", "SN", "SERIAL", "CERT", "COC", "PART", "FROM", "VIA",
+                   "BY", "AND", "THE", "OF"}
+REFERENCE_WORDS.update(word for suffix in CORPORATE_SUFFIXES for word in suffix)
+
+
+def normalize_entity(name: str) -> Tuple[str, ...]:
+    """Upper-case word tokens of a company name without punctuation or legal-form suffix"""
+    text = re.sub(r"INT'L\b", "INTERNATIONAL", name.upper().replace("&", " AND "))
+    tokens = [ABBREVIATIONS.get(token, token) for token in re.sub(r"[^A-Z0-9]+", " ", text).split()]
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in CORPORATE_SUFFIXES:
+            if len(tokens) > len(suffix) and tuple(tokens[-len(suffix):]) == suffix:
+                tokens = tokens[:-len(suffix)]
+                stripped = True
+    return tuple(tokens)
+
+
+def is_empty(value: Optional[str]) -> bool:
+    """True for missing or placeholder field values"""
+    return value is None or str(value).strip().upper() in EMPTY_VALUES
+
+
+@dataclass
+class ResolvedEntity:
+    """One company on a certificate and its registry status"""
+    role: str
+    name: str
+    source_type: str
+    is_faa_regulated: bool
+    notes: List[str]
+
+
+@dataclass
+class ChainResolution:
+    """Outcome of resolving one document's certificates against the registry"""
+    resolved: bool
+    entities: List[ResolvedEntity] = field(default_factory=list)
+    chains: List[List[str]] = field(default_factory=list)
+    # Certificates whose chain does not start at a regulated source named on the certificate
+    gaps: List[str] = field(default_factory=list)
+    # Why the chain was left to the LLM
+    reason: Optional[str] = None
+
+
+class EntityRegistry:
+    """Normalized index over the validator's known companies"""
+
+    def __init__(self, statuses: Dict[str, Dict[str, Any]]):
+        """Index {registry name: validate_company_faa_status result}; longer names are scanned first"""
+        self._entries: Dict[Tuple[str, ...], Tuple[str, Dict[str, Any]]] = {}
+        for name, status in statuses.items():
+            self._entries.setdefault(normalize_entity(name), (name, status))
+        self._keys = sorted(self._entries, key=len, reverse=True)
+
+    def lookup_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """Status of a company name by exact normalized match ("APPLIED AVIONICS INC" is "Applied Avionics, Inc.")"""
+        entry = self._entries.get(normalize_entity(name))
+        return entry[1] if entry else None
+
+    def scan_text(self, text: str) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+        """Registry companies mentioned in free text; None when other words are left over"""
+        tokens = list(normalize_entity(text))
+        found = []
+        for key in self._keys:
+            starts = [start for start in range(len(tokens) - len(key) + 1) if tuple(tokens[start:start + len(key)]) == key]
+            for start in starts:
+                tokens[start:start + len(key)] = [""] * len(key)
+            if starts:
+                found.append(self._entries[key])
+        # What is left must be paperwork references, part-class numbers or single letters ("C of C")
+        for token in tokens:
+            if token and token not in REFERENCE_WORDS and len(token) > 1 and not any(char.isdigit() for char in token):
+                return None
+        return found
+
+
+class FastPathStats:
+    """Counts chains decided locally versus sent to the LLM"""
+
+    def __init__(self):
+        """Start all counters at zero"""
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.hits = 0
+        self.compliant = 0
+        self.misses: Dict[str, int] = {}
+
+    def record(self, resolution: ChainResolution, compliant: bool = False):
+        """Count one document"""
+        with self._lock:
+            self.documents += 1
+            if resolution.resolved:
+                self.hits += 1
+                self.compliant += compliant
+            else:
+                reason = (resolution.reason or "unknown").split(":")[0]
+                self.misses[reason] = self.misses.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the fast-path hit rate and why chains went to the LLM"""
+        with self._lock:
+            return {
+                "enabled": TRACE_FAST_PATH_ENABLED,
+                "documents": self.documents,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.documents, 3) if self.documents else 0.0,
+                "compliant_hits": self.compliant,
+                "llm_fallbacks": dict(self.misses)
+            }
+
+
+fast_path_stats = FastPathStats()
+
+
+def _is_customer(name: str) -> bool:
+    """True for the buyer whose purchase is being validated"""
+    return PAGE_FILTER_BUYER.upper() in name.upper()
+
+
+def resolve_chain(certificates: List[Dict], registry: EntityRegistry) -> ChainResolution:
+    """Resolve every company on the certificates; resolved only when none is unknown and the chain has no gaps"""
+    resolution = ChainResolution(resolved=False)
+    for certificate in certificates:
+        chain = []
+        origin: Optional[ResolvedEntity] = None
+
+        # Manufacturer → traceability source → seller → intermediate buyer
+        for role in ("manufacturer", "traceability_source", "seller_name", "buyer_name"):
+            value = certificate.get(role)
+            if is_empty(value) or (role == "buyer_name" and _is_customer(value)):
+                continue
+            if role == "traceability_source":
+                mentions = registry.scan_text(value)
+                if mentions is None:
+                    resolution.reason = f"unreadable traceability source: {value}"
+                    return resolution
+            else:
+                status = registry.lookup_name(value)
+                if status is None:
+                    resolution.reason = f"unknown entity: {value}"
+                    return resolution
+                # Name fields keep the company's own spelling
+                mentions = [(value, status)]
+
+            for name, status in mentions:
+                entity = ResolvedEntity(role, name, status["source_type"], status["is_faa_regulated"],
+                                        list(status["validation_notes"]))
+                resolution.entities.append(entity)
+                if origin is None and role in ("manufacturer", "traceability_source"):
+                    origin = entity
+                if not chain or normalize_entity(chain[-1]) != normalize_entity(name):
+                    chain.append(name)
+        if chain and chain not in resolution.chains:
+            resolution.chains.append(chain)
+
+        # The seller alone, or a chain that starts at a distributor, does not trace the part back
+        part = certificate.get("part_number") or "unknown part"
+        if origin is None:
+            resolution.gaps.append(f"no manufacturer or traceability source names a company for {part}")
+        elif not origin.is_faa_regulated and origin.source_type != "FRAUDULENT":
+            resolution.gaps.append(f"chain for {part} starts at {origin.name}, not a regulated source")
+
+    if not resolution.entities:
+        resolution.reason = "no entities"
+        return resolution
+    fraudulent = any(entity.source_type == "FRAUDULENT" for entity in resolution.entities)
+    if not fraudulent and not any(entity.is_faa_regulated for entity in resolution.entities):
+        # Distributor-only chains: their origin is in registry prose and the documents, not in these fields
+        resolution.reason = "no regulated source"
+        return resolution
+    if not fraudulent and resolution.gaps:
+        # A fraudulent entity breaks the chain whatever else is missing; gaps otherwise need the LLM
+        resolution.reason = f"incomplete chain: {resolution.gaps[0]}"
+        return resolution
+    resolution.resolved = True
+    return resolution
+
+
+def final_source(resolution: ChainResolution) -> Optional[ResolvedEntity]:
+    """Most preferred regulated entity of a resolved chain (manufacturer first within a rank)"""
+    regulated = [entity for entity in resolution.entities if entity.is_faa_regulated and entity.source_type in SOURCE_RANK]
+    if not regulated:
+        return None
+    role_order = ["manufacturer", "traceability_source", "seller_name", "buyer_name"]
+    return min(regulated, key=lambda entity: (SOURCE_RANK.index(entity.source_type), role_order.index(entity.role)))
@@ -9,17 +9,21 @@ import json
 from typing import Dict, List, Optional, Any, Set
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from openai import OpenAI
 import logging
 from datetime import datetime
-from dotenv import load_dotenv
 import re
 
-# Load environment variables
-load_dotenv(".env")
+if __name__ == "__main__":
+    # Run as a script: load .env before the imports below read their settings
+    from dotenv import load_dotenv
+    load_dotenv(".env")
+
+from llm_client import get_openai_client, get_async_openai_client, create_chat_completion, acreate_chat_completion
+from llm_cache import get_llm_cache
+from traceability_rules import (
+    TRACE_FAST_PATH_ENABLED, ChainResolution, EntityRegistry, fast_path_stats, final_source, resolve_chain
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -45,12 +49,14 @@ class TraceabilityChain:
 class TraceabilitySourceValidator:
     """Main class for validating traceability sources against ASA-100 requirements"""
     
+    # Bump the version whenever the prompt or response handling changes to invalidate cached responses
+    PROMPT_TEMPLATE = "source_validation"
+    PROMPT_TEMPLATE_VERSION = "1"
+    
     def __init__(self, api_key: str = ""):
         """Initialize the validator with OpenAI API key"""
-        if api_key:
-            self.client = OpenAI(api_key=api_key)
-        else:
-            self.client = OpenAI()
+        # Shared clients are looked up on first use - an empty key falls back to the environment
+        self.api_key = api_key
         
         # Define regulated sources from video transcripts
         self.regulated_sources = {
@@ -148,6 +154,15 @@ class TraceabilitySourceValidator:
             "Southwest Airlines": "Legitimate 121 domestic airline"
         }
         
+        # Every known company with its status, matched by normalized name for the registry fast path
+        registry_names = (list(self.known_unregulated_entities) + list(self.known_oem_manufacturers)
+                          + self.regulated_sources["OEM"]["examples"] + list(self.verified_145_stations)
+                          + list(self.verified_121_airlines) + list(self.known_parts_distributors))
+        # Statuses come from the exact-name lists only: an empty registry while they are computed keeps
+        # validate_company_faa_status from reaching the registry it is building
+        self.entity_registry = EntityRegistry({})
+        self.entity_registry = EntityRegistry({name: self.validate_company_faa_status(name) for name in registry_names})
+        
         # ASA-100 Requirements Matrix
         self.asa100_requirements = {
             "consumable_materials": {
@@ -192,6 +207,16 @@ class TraceabilitySourceValidator:
             }
         }
 
+    @property
+    def client(self):
+        """Shared synchronous OpenAI client"""
+        return get_openai_client(self.api_key)
+    
+    @property
+    def async_client(self):
+        """Shared asynchronous OpenAI client"""
+        return get_async_openai_client(self.api_key)
+    
     def create_source_validation_prompt(self, certificates: List[Dict]) -> str:
         """Create prompt for validating regulated sources based on traceability principles"""
         
@@ -394,155 +419,309 @@ EXAMPLE ANALYSIS FOR "5. LOT PACKAGE EXAMPLE.md":
 """
         return prompt
 
-    def validate_source_traceability(self, certificates: List[Dict], document_name: str) -> TraceabilityChain:
-        """Validate source traceability for a set of certificates based on aviation principles"""
+    def _build_validation_request(self, certificates: List[Dict]) -> Dict[str, Any]:
+        """Build the chat completion arguments for source traceability validation"""
+        prompt = self.create_source_validation_prompt(certificates)
         
-        try:
-            prompt = self.create_source_validation_prompt(certificates)
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are an expert aviation traceability analyst specializing in principle-based regulated source validation. Focus on chain integrity, actual FAA regulation status, and understanding that ANY unregulated source breaks the entire chain. Always return valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,  # Set to 0.0 for maximum consistency in compliance analysis
-                max_tokens=8000   # Increased for more detailed analysis
-            )
-            
-            # Parse the JSON response
-            result_text = response.choices[0].message.content
-            
-            # Clean the response to extract JSON
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0]
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0]
-            
-            analysis = json.loads(result_text)
-            
-            # Extract part number from first certificate
-            part_number = certificates[0].get('part_number', 'Unknown')
-            serial_number = certificates[0].get('serial_number')
-            
-            # Get chain analysis and overall assessment
-            chain_analysis = analysis.get('chain_analysis', {})
-            overall = analysis.get('overall_assessment', {})
+        return {
+            "model": "gpt-4o",
+            "messages": [
+                {"role": "system", "content": "You are an expert aviation traceability analyst specializing in principle-based regulated source validation. Focus on chain integrity, actual FAA regulation status, and understanding that ANY unregulated source breaks the entire chain. Always return valid JSON."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.0,  # Set to 0.0 for maximum consistency in compliance analysis
+            "max_tokens": 8000   # Increased for more detailed analysis
+        }
 
-            chain_integrity_intact = chain_analysis.get('chain_integrity_intact', False)
-            any_fraudulent_entities = overall.get('any_fraudulent_entities', False)
+    def _build_traceability_chain(self, result_text: str, certificates: List[Dict], document_name: str) -> TraceabilityChain:
+        """Convert the raw model response into a TraceabilityChain"""
+        
+        # Clean the response to extract JSON
+        if "```json" in result_text:
+            result_text = result_text.split("```json")[1].split("```")[0]
+        elif "```" in result_text:
+            result_text = result_text.split("```")[1].split("```")[0]
+        
+        analysis = json.loads(result_text)
+        
+        # Extract part number from first certificate
+        part_number = certificates[0].get('part_number', 'Unknown')
+        serial_number = certificates[0].get('serial_number')
+        
+        # Get chain analysis and overall assessment
+        chain_analysis = analysis.get('chain_analysis', {})
+        overall = analysis.get('overall_assessment', {})
 
-            # A chain is compliant ONLY if integrity is intact and there are no fraudulent entities
-            is_compliant = chain_integrity_intact and not any_fraudulent_entities
+        chain_integrity_intact = chain_analysis.get('chain_integrity_intact', False)
+        any_fraudulent_entities = overall.get('any_fraudulent_entities', False)
+
+        # A chain is compliant ONLY if integrity is intact and there are no fraudulent entities
+        is_compliant = chain_integrity_intact and not any_fraudulent_entities
+        
+        # Determine the final source based on compliance
+        if is_compliant:
+            final_source_type = overall.get('final_source_type', 'UNKNOWN')
+            final_source_name = overall.get('final_source_name', 'Unknown')
+            compliance_level = overall.get('compliance_level', 'HIGH')
+        else:
+            compliance_level = 'LOW'
+            final_source_type = 'UNREGULATED'
             
-            # Determine the final source based on compliance
-            if is_compliant:
-                final_source_type = overall.get('final_source_type', 'UNKNOWN')
-                final_source_name = overall.get('final_source_name', 'Unknown')
-                compliance_level = overall.get('compliance_level', 'HIGH')
+            fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
+            unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
+
+            # The point of failure is the most important piece of information
+            if fraudulent_entities:
+                final_source_name = fraudulent_entities[0]
+            elif unregulated_entities:
+                final_source_name = unregulated_entities[0]
             else:
-                compliance_level = 'LOW'
-                final_source_type = 'UNREGULATED'
-                
-                fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
-                unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
-
-                # The point of failure is the most important piece of information
-                if fraudulent_entities:
-                    final_source_name = fraudulent_entities[0]
-                elif unregulated_entities:
-                    final_source_name = unregulated_entities[0]
-                else:
-                    final_source_name = "Undetermined Unregulated Source"
+                final_source_name = "Undetermined Unregulated Source"
+        
+        # Create regulated source object
+        regulated_source = RegulatedSource(
+            source_type=final_source_type,
+            source_name=final_source_name,
+            compliance_level=compliance_level,
+            requirements_met=is_compliant,
+            missing_requirements=list(set(
+                chain_analysis.get('missing_documentation', []) + 
+                chain_analysis.get('linkage_issues', []) +
+                overall.get('principle_violations', [])
+            ))
+        )
+        
+        # Add chain integrity issues to missing requirements for clarity
+        if not is_compliant:
+            if any_fraudulent_entities:
+                 fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
+                 if fraudulent_entities:
+                    regulated_source.missing_requirements.append(f"FRAUDULENT ENTITY: {fraudulent_entities[0]} broke the chain.")
             
-            # Create regulated source object
+            unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
+            if unregulated_entities:
+                regulated_source.missing_requirements.append(f"UNREGULATED ENTITY: {unregulated_entities[0]} broke the chain.")
+
+        # Create traceability chain with enhanced validation notes
+        validation_notes = []
+        
+        if is_compliant:
+            validation_notes.append("Chain integrity intact - all entities are regulated")
+        else:
+            validation_notes.append(f"Chain integrity BROKEN by: {final_source_name}")
+
+        # Add fraudulent entity warnings
+        fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
+        if fraudulent_entities:
+            validation_notes.append(f"FRAUDULENT entities found: {', '.join(fraudulent_entities)}")
+        
+        # Add chain completeness
+        if chain_analysis.get('chain_complete'):
+            validation_notes.append("Complete traceability chain established")
+        else:
+            validation_notes.append("Incomplete traceability chain")
+        
+        # Add chain links
+        if chain_analysis.get('chain_links'):
+            validation_notes.append(f"Chain: {' → '.join(chain_analysis['chain_links'])}")
+        
+        # Add final regulated source info ONLY IF compliant
+        if is_compliant and chain_analysis.get('final_regulated_source'):
+            validation_notes.append(f"Final regulated source: {chain_analysis['final_regulated_source']}")
+        
+        # Add unregulated entities found
+        unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
+        if unregulated_entities:
+            validation_notes.append(f"Unregulated entities found: {', '.join(unregulated_entities)}")
+        
+        chain = TraceabilityChain(
+            part_number=part_number,
+            serial_number=serial_number,
+            chain_links=analysis.get('traceability_analysis', []),
+            final_source=regulated_source,
+            is_complete=chain_analysis.get('chain_complete', False) and is_compliant,
+            validation_notes=list(set(validation_notes)) # Use set to remove duplicate notes
+        )
+        
+        # Log the result with chain integrity status
+        integrity_status = "INTACT" if is_compliant else f"BROKEN by {final_source_name}"
+        fraud_status = "FRAUDULENT" if any_fraudulent_entities else "NO FRAUD"
+        logger.info(f"Validated traceability for {document_name}: {regulated_source.source_type} - Integrity: {integrity_status} ({fraud_status}) - Compliant: {is_compliant}")
+        return chain
+
+    def _error_chain(self, e: Exception) -> TraceabilityChain:
+        """Build the chain returned when validation fails"""
+        return TraceabilityChain(
+            part_number="Error",
+            serial_number=None,
+            chain_links=[],
+            final_source=RegulatedSource(
+                source_type="ERROR",
+                source_name=f"Validation Error: {str(e)}",
+                compliance_level="LOW",
+                requirements_met=False,
+                missing_requirements=["Validation failed"]
+            ),
+            is_complete=False,
+            validation_notes=[f"Error: {str(e)}"]
+        )
+
+    def unvalidated_chain(self, reason: str) -> TraceabilityChain:
+        """Build the chain reported when validation could not run (e.g. it ran out of time)"""
+        return TraceabilityChain(
+            part_number="Unknown",
+            serial_number=None,
+            chain_links=[],
+            final_source=RegulatedSource(
+                source_type="UNVALIDATED",
+                source_name=reason,
+                compliance_level="LOW",
+                requirements_met=False,
+                missing_requirements=["Traceability validation not completed"]
+            ),
+            is_complete=False,
+            validation_notes=[reason]
+        )
+
+    def resolve_with_registry(self, certificates: List[Dict], document_name: str) -> Optional[TraceabilityChain]:
+        """Decide the chain from the entity registry alone; None when it needs the LLM"""
+        if not TRACE_FAST_PATH_ENABLED or not certificates:
+            return None
+        
+        resolution = resolve_chain(certificates, self.entity_registry)
+        if not resolution.resolved:
+            fast_path_stats.record(resolution)
+            logger.info(f"Registry fast path not taken for {document_name}: {resolution.reason}")
+            return None
+        
+        chain = self._registry_chain(resolution, certificates)
+        fast_path_stats.record(resolution, chain.final_source.requirements_met)
+        logger.info(f"Validated traceability for {document_name} from the entity registry: {chain.final_source.source_type} - {chain.final_source.source_name} - Compliant: {chain.final_source.requirements_met}")
+        return chain
+
+    def _registry_chain(self, resolution: ChainResolution, certificates: List[Dict]) -> TraceabilityChain:
+        """Build a TraceabilityChain from a fully resolved registry chain, with the same notes as the LLM path"""
+        fraudulent = list(dict.fromkeys(entity.name for entity in resolution.entities if entity.source_type == "FRAUDULENT"))
+        chain_text = "; ".join(" → ".join(names) for names in resolution.chains)
+        
+        # Any fraudulent entity breaks the chain; otherwise the most preferred regulated source is final
+        if fraudulent:
             regulated_source = RegulatedSource(
-                source_type=final_source_type,
-                source_name=final_source_name,
-                compliance_level=compliance_level,
-                requirements_met=is_compliant,
-                missing_requirements=list(set(
-                    chain_analysis.get('missing_documentation', []) + 
-                    chain_analysis.get('linkage_issues', []) +
-                    overall.get('principle_violations', [])
-                ))
+                source_type="UNREGULATED",
+                source_name=fraudulent[0],
+                compliance_level="LOW",
+                requirements_met=False,
+                missing_requirements=[f"FRAUDULENT ENTITY: {fraudulent[0]} broke the chain."]
             )
+            validation_notes = [f"Chain integrity BROKEN by: {fraudulent[0]}", f"FRAUDULENT entities found: {', '.join(fraudulent)}",
+                                "Incomplete traceability chain"]
+        else:
+            final = final_source(resolution)
+            regulated_source = RegulatedSource(
+                source_type=final.source_type,
+                source_name=final.name,
+                compliance_level=self.regulated_sources[final.source_type]["compliance_level"],
+                requirements_met=True,
+                missing_requirements=[]
+            )
+            validation_notes = ["Chain integrity intact - all entities are regulated", "Complete traceability chain established",
+                                f"Final regulated source: {final.name}"]
+        
+        if chain_text:
+            validation_notes.append(f"Chain: {chain_text}")
+        validation_notes.extend(f"Traceability gap: {gap}" for gap in resolution.gaps)
+        for entity in resolution.entities:
+            for note in entity.notes:
+                if note not in validation_notes:
+                    validation_notes.append(note)
+        validation_notes.append("Resolved from the verified entity registry (no LLM call)")
+        
+        return TraceabilityChain(
+            part_number=certificates[0].get('part_number', 'Unknown'),
+            serial_number=certificates[0].get('serial_number'),
+            chain_links=[{
+                "role": entity.role,
+                "source_name": entity.name,
+                "source_type": entity.source_type,
+                "is_actually_regulated": entity.is_faa_regulated,
+                "fraudulent_claims": entity.source_type == "FRAUDULENT",
+                "validation_notes": entity.notes
+            } for entity in resolution.entities],
+            final_source=regulated_source,
+            # resolve_chain only resolves gap-free chains unless a fraudulent entity broke them
+            is_complete=not fraudulent and not resolution.gaps,
+            validation_notes=validation_notes
+        )
+
+    def validate_source_traceability(self, certificates: List[Dict], document_name: str) -> TraceabilityChain:
+        """Validate source traceability for a set of certificates based on aviation principles"""
+        
+        try:
+            chain = self.resolve_with_registry(certificates, document_name)
+            if chain is not None:
+                return chain
             
-            # Add chain integrity issues to missing requirements for clarity
-            if not is_compliant:
-                if any_fraudulent_entities:
-                     fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
-                     if fraudulent_entities:
-                        regulated_source.missing_requirements.append(f"FRAUDULENT ENTITY: {fraudulent_entities[0]} broke the chain.")
-                
-                unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
-                if unregulated_entities:
-                    regulated_source.missing_requirements.append(f"UNREGULATED ENTITY: {unregulated_entities[0]} broke the chain.")
-
-            # Create traceability chain with enhanced validation notes
-            validation_notes = []
+            request = self._build_validation_request(certificates)
+            llm_cache = get_llm_cache()
             
-            if is_compliant:
-                validation_notes.append("Chain integrity intact - all entities are regulated")
-            else:
-                validation_notes.append(f"Chain integrity BROKEN by: {final_source_name}")
-
-            # Add fraudulent entity warnings
-            fraudulent_entities = chain_analysis.get('fraudulent_entities_found', [])
-            if fraudulent_entities:
-                validation_notes.append(f"FRAUDULENT entities found: {', '.join(fraudulent_entities)}")
+            cached_text = llm_cache.get(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION)
+            if cached_text is not None:
+                logger.info(f"Using cached validation response for {document_name}")
+                return self._build_traceability_chain(cached_text, certificates, document_name)
             
-            # Add chain completeness
-            if chain_analysis.get('chain_complete'):
-                validation_notes.append("Complete traceability chain established")
-            else:
-                validation_notes.append("Incomplete traceability chain")
+            response = create_chat_completion(self.client, request)
+            result_text = response.choices[0].message.content
             
-            # Add chain links
-            if chain_analysis.get('chain_links'):
-                validation_notes.append(f"Chain: {' → '.join(chain_analysis['chain_links'])}")
+            # Parse the JSON response - only cache it once it produced a chain
+            chain = self._build_traceability_chain(result_text, certificates, document_name)
+            llm_cache.set(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION, result_text)
+            return chain
+            
+        except Exception as e:
+            logger.error(f"Error validating traceability for {document_name}: {str(e)}")
+            return self._error_chain(e)
+
+    async def aprobe_validation_cache(self, certificates: List[Dict]) -> Optional[str]:
+        """Cached validation response for these certificates, looked up without touching the hit/miss counters"""
+        request = self._build_validation_request(certificates)
+        return await get_llm_cache().aprobe(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION)
+
+    async def avalidate_source_traceability(self, certificates: List[Dict], document_name: str,
+                                            probed: bool = False, probed_text: Optional[str] = None) -> TraceabilityChain:
+        """Async variant of validate_source_traceability using the shared AsyncOpenAI client
+
+        With probed=True, probed_text is the result of aprobe_validation_cache for these certificates
+        and replaces the cache lookup.
+        """
+        
+        try:
+            chain = self.resolve_with_registry(certificates, document_name)
+            if chain is not None:
+                return chain
             
-            # Add final regulated source info ONLY IF compliant
-            if is_compliant and chain_analysis.get('final_regulated_source'):
-                validation_notes.append(f"Final regulated source: {chain_analysis['final_regulated_source']}")
+            request = self._build_validation_request(certificates)
+            llm_cache = get_llm_cache()
             
-            # Add unregulated entities found
-            unregulated_entities = chain_analysis.get('unregulated_entities_found', [])
-            if unregulated_entities:
-                validation_notes.append(f"Unregulated entities found: {', '.join(unregulated_entities)}")
+            if probed:
+                llm_cache.count_probe(probed_text is not None)
+                cached_text = probed_text
+            else:
+                cached_text = await llm_cache.aget(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION)
+            if cached_text is not None:
+                logger.info(f"Using cached validation response for {document_name}")
+                return self._build_traceability_chain(cached_text, certificates, document_name)
             
-            chain = TraceabilityChain(
-                part_number=part_number,
-                serial_number=serial_number,
-                chain_links=analysis.get('traceability_analysis', []),
-                final_source=regulated_source,
-                is_complete=chain_analysis.get('chain_complete', False) and is_compliant,
-                validation_notes=list(set(validation_notes)) # Use set to remove duplicate notes
-            )
+            response = await acreate_chat_completion(self.async_client, request)
+            result_text = response.choices[0].message.content
             
-            # Log the result with chain integrity status
-            integrity_status = "INTACT" if is_compliant else f"BROKEN by {final_source_name}"
-            fraud_status = "FRAUDULENT" if any_fraudulent_entities else "NO FRAUD"
-            logger.info(f"Validated traceability for {document_name}: {regulated_source.source_type} - Integrity: {integrity_status} ({fraud_status}) - Compliant: {is_compliant}")
+            # Parse the JSON response - only cache it once it produced a chain
+            chain = self._build_traceability_chain(result_text, certificates, document_name)
+            await llm_cache.aset(request, self.PROMPT_TEMPLATE, self.PROMPT_TEMPLATE_VERSION, result_text)
             return chain
             
         except Exception as e:
             logger.error(f"Error validating traceability for {document_name}: {str(e)}")
-            # Return empty chain with error
-            return TraceabilityChain(
-                part_number="Error",
-                serial_number=None,
-                chain_links=[],
-                final_source=RegulatedSource(
-                    source_type="ERROR",
-                    source_name=f"Validation Error: {str(e)}",
-                    compliance_level="LOW",
-                    requirements_met=False,
-                    missing_requirements=["Validation failed"]
-                ),
-                is_complete=False,
-                validation_notes=[f"Error: {str(e)}"]
-            )
+            return self._error_chain(e)
 
     def validate_all_documents(self, certificate_results: Dict[str, List[Dict]]) -> Dict[str, TraceabilityChain]:
         """Validate traceability for all documents"""
@@ -676,6 +855,15 @@ EXAMPLE ANALYSIS FOR "5. LOT PACKAGE EXAMPLE.md":
         logger.info(f"Validation results saved to {output_file}")
         return output_data
 
+    def check_certificate_entities(self, certificate: Dict) -> Dict[str, Dict[str, Any]]:
+        """Registry status of the companies named on one certificate (seller, manufacturer, traceability source)"""
+        checks = {}
+        for field in ("seller_name", "manufacturer", "traceability_source"):
+            name = (certificate.get(field) or "").strip()
+            if name and name.lower() not in ("null", "none", "n/a") and name not in checks:
+                checks[name] = self.validate_company_faa_status(name)
+        return checks
+
     def validate_company_faa_status(self, company_name: str) -> Dict[str, Any]:
         """
         Validate if a company is actually FAA-regulated by checking against known entities
@@ -731,6 +919,12 @@ EXAMPLE ANALYSIS FOR "5. LOT PACKAGE EXAMPLE.md":
                 "validation_notes": [f"Known parts distributor: {self.known_parts_distributors[company_name]}"]
             }
         
+        # Spelling variants ("APPLIED AVIONICS INC", "AVAIR") of a known company; never a longer name that merely starts with one
+        if company_name:
+            status = self.entity_registry.lookup_name(company_name)
+            if status is not None:
+                return status
+        
         # Default to unregulated if not found in verified lists
         return {
             "is_faa_regulated": False,
@@ -820,4 +1014,5 @@ def main():
     print(f"\nDetailed results saved to: traceability_source_validation_results.json")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     main() 
\ No newline at end of file
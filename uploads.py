@@ -0,0 +1,61 @@
+"""
+Upload Ingestion
+Streams uploaded files to disk in fixed-size chunks while hashing them,
+so an upload is never held in memory as a whole. A batch shares one
+memory budget that caps how many chunks can be buffered at once.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Chunk size used when copying uploads to disk (default 1 MB)
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Upload bytes a single batch may hold in memory at once (default 16 MB)
+UPLOAD_BATCH_MEMORY_BYTES = int(os.getenv("UPLOAD_BATCH_MEMORY_BYTES", str(16 * 1024 * 1024)))
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size in bytes of an upload that has already been received"""
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    return size
+
+
+def new_memory_budget(max_bytes: int = UPLOAD_BATCH_MEMORY_BYTES) -> asyncio.Semaphore:
+    """Create the shared chunk budget for one batch"""
+    return asyncio.Semaphore(max(1, max_bytes // UPLOAD_CHUNK_BYTES))
+
+
+async def save_upload(file: UploadFile, dest_path: str, memory_budget: Optional[asyncio.Semaphore] = None) -> str:
+    """Stream an upload to dest_path chunk by chunk and return the SHA-256 of its bytes"""
+    if memory_budget is None:
+        memory_budget = new_memory_budget()
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, "wb") as buffer:
+            while True:
+                # Each buffered chunk takes one slot of the batch's memory budget
+                async with memory_budget:
+                    chunk = await file.read(UPLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    buffer.write(chunk)
+                    size += len(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+
+    logger.info(f"Saved upload {file.filename} ({size} bytes) to {dest_path}")
+    return digest.hexdigest()
@@ -0,0 +1,49 @@
+"""
+Startup Warm-Up
+Opens the shared caches and upstream clients before a server process
+takes traffic, so the first requests do not pay for SQLite setup, client
+construction or a cold TLS handshake. Failures are logged and never stop
+the server from starting.
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from pdfparser import get_parse_cache, get_parse_strategies, new_parser
+from llm_cache import get_llm_cache
+from llm_client import get_openai_client, get_async_openai_client
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long warm-up may delay startup
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+
+
+async def warm_up(timeout: float = WARMUP_TIMEOUT_SECONDS):
+    """Open caches and upstream connections for this process"""
+    start = time.time()
+
+    # Step 1: Open the on-disk caches shared by all worker processes
+    try:
+        get_parse_cache()
+        get_llm_cache()
+    except Exception as e:
+        logger.warning(f"Cache warm-up failed: {str(e)}")
+
+    # Step 2: Listing models opens a pooled connection to OpenAI and checks the API key
+    # (building the clients raises without OPENAI_API_KEY, so it stays inside the try)
+    try:
+        get_openai_client()
+        await asyncio.wait_for(get_async_openai_client().models.list(), timeout)
+    except Exception as e:
+        logger.warning(f"OpenAI warm-up failed: {str(e)}")
+
+    # Step 3: Build a LlamaParse client on the shared transport so its imports and configuration are loaded
+    try:
+        new_parser(get_parse_strategies()[0]["config"], shared_connections=True)
+    except Exception as e:
+        logger.warning(f"LlamaParse warm-up failed: {str(e)}")
+
+    logger.info(f"Warm-up finished in {time.time() - start:.2f}s")